@@ -0,0 +1,68 @@
+#!/usr/bin/env python
+
+## Copyright (C) 2014 Bitergia
+##
+## This program is free software; you can redistribute it and/or modify
+## it under the terms of the GNU General Public License as published by
+## the Free Software Foundation; either version 3 of the License, or
+## (at your option) any later version.
+##
+## This program is distributed in the hope that it will be useful,
+## but WITHOUT ANY WARRANTY; without even the implied warranty of
+## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+## GNU General Public License for more details.
+##
+## You should have received a copy of the GNU General Public License
+## along with this program; if not, write to the Free Software
+## Foundation, Inc., 59 Temple Place - Suite 330, Boston, MA 02111-1307, USA.
+##
+## Authors:
+##   Alvaro del Castillo <acs@bitergia.com>
+
+## Time needed to align filter items data with a growing number of items.
+## The time per item should not grow with the number of items.
+##
+## Run from the testing directory: ./benchmark_items.py
+
+import random
+import time
+
+from vizgrimoire.GrimoireUtils import fill_and_order_items
+from vizgrimoire.metrics.metrics import Metrics
+
+sizes = [1000, 10000, 100000]
+
+def get_items(size):
+    items = ["item%i" % i for i in range(0, size)]
+    # Half of the items with data, in a different order
+    data_items = items[0:size/2]
+    random.shuffle(data_items)
+    return items, data_items
+
+def bench_fill_and_order_items(size):
+    items, data_items = get_items(size)
+    data = {"name": data_items, "commits": range(0, len(data_items))}
+    start = time.time()
+    fill_and_order_items(items, data, "name")
+    return time.time() - start
+
+def bench_convert_group_to_ts(size):
+    items, data_items = get_items(size)
+    # Three periods per item
+    data = {"name": [], "month": [], "commits": []}
+    for item in data_items:
+        for month in [24170, 24171, 24172]:
+            data["name"].append(item)
+            data["month"].append(month)
+            data["commits"].append(1)
+    start = time.time()
+    Metrics._convert_group_to_ts(data, "name")
+    return time.time() - start
+
+if __name__ == '__main__':
+    random.seed(0)
+    for bench in [bench_fill_and_order_items, bench_convert_group_to_ts]:
+        for size in sizes:
+            total = bench(size)
+            print("%s %7i items: %.3fs (%.2f us/item)" %
+                  (bench.__name__[6:], size, total, total * 1000000 / size))
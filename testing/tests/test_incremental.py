@@ -0,0 +1,153 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2014 Bitergia
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place - Suite 330, Boston, MA 02111-1307, USA.
+#
+# Authors:
+#         Alvaro del Castillo <acs@bitergia.com>
+#
+
+"""Tests for incremental evolutionary data (no database needed)"""
+
+import json
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+if not '..' in sys.path:
+    sys.path.insert(0, '../..')
+
+from vizgrimoire.GrimoireUtils import splice_evol_data
+from vizgrimoire.data_source import DataSource
+from vizgrimoire.metrics.metrics import Metrics
+
+
+def evol(months, **fields):
+    data = {"month": months, "id": range(0, len(months)),
+            "date": ["d" + str(month) for month in months],
+            "unixtime": [str(month) for month in months]}
+    data.update(fields)
+    return data
+
+
+class TestSpliceEvolData(unittest.TestCase):
+
+    def test_splice(self):
+        old = evol([1, 2, 3, 4], commits=[1, 1, 1, 1], total=10)
+        new = evol([3, 4, 5], commits=[2, 2, 2], total=20)
+        data = splice_evol_data(old, new, "month")
+        self.assertEqual(evol([1, 2, 3, 4, 5], commits=[1, 1, 2, 2, 2], total=20), data)
+
+    def test_splice_items(self):
+        old = evol([1, 2, 3], name=["a", "b"], commits=[[1, 1, 1], [3, 3, 3]])
+        new = evol([3, 4], name=["a", "b"], commits=[[2, 2], [4, 4]])
+        data = splice_evol_data(old, new, "month")
+        self.assertEqual(evol([1, 2, 3, 4], name=["a", "b"],
+                              commits=[[1, 1, 2, 2], [3, 3, 4, 4]]), data)
+
+    def test_not_spliced(self):
+        old = evol([1, 2, 3], commits=[1, 1, 1])
+        # First new period not in old
+        self.assertEqual(None, splice_evol_data(old, evol([5, 6], commits=[2, 2]), "month"))
+        # Different fields
+        self.assertEqual(None, splice_evol_data(old, evol([3, 4], authors=[2, 2]), "month"))
+        # Different items
+        old = evol([1, 2], name=["a"], commits=[[1, 1]])
+        new = evol([2, 3], name=["b"], commits=[[2, 2]])
+        self.assertEqual(None, splice_evol_data(old, new, "month"))
+
+
+class Pending(Metrics):
+    id = "pending"
+    state_dependent = True
+
+
+class FakeDS(object):
+    """ Data source with one value per month: 2013-01 is month 1 """
+
+    _metrics_set = []
+    value = 1
+    calls = []
+
+    @staticmethod
+    def get_name():
+        return "fake"
+
+    @staticmethod
+    def get_evolutionary_data(period, startdate, enddate, identities_db, filter_ = None):
+        FakeDS.calls.append(startdate)
+        first = int(startdate.split("-")[1])
+        months = range(first, int(enddate.split("-")[1]))
+        return evol(months, commits=[FakeDS.value] * len(months))
+
+
+class TestIncrementalData(unittest.TestCase):
+
+    def setUp(self):
+        self.destdir = tempfile.mkdtemp()
+        self.filepath = os.path.join(self.destdir, "fake-evolutionary.json")
+        self.write_old_data("commits")
+        FakeDS.value = 2
+        FakeDS.calls = []
+        DataSource.set_incremental(1)
+
+    def tearDown(self):
+        DataSource.set_incremental(None)
+        shutil.rmtree(self.destdir)
+
+    def write_old_data(self, field):
+        f = open(self.filepath, "w")
+        json.dump(evol([1, 2, 3, 4, 5], **{field: [1, 1, 1, 1, 1]}), f)
+        f.close()
+
+    def get_data(self, DS = FakeDS):
+        return DataSource.get_evolutionary_data_incremental(
+            DS, "month", "'2013-01-01'", "'2013-06-01'", None, None, self.filepath)
+
+    def test_last_periods(self):
+        data = self.get_data()
+        self.assertEqual(["'2013-04-01'"], FakeDS.calls)
+        self.assertEqual([1, 1, 1, 2, 2], data["commits"])
+
+    def test_state_dependent_metrics(self):
+        self.write_old_data("pending")
+        data = self.get_data(StateDS)
+        self.assertEqual("'2013-01-01'", FakeDS.calls[-1])
+        self.assertEqual([2, 2, 2, 2, 2], data["pending"])
+
+    def test_identities_changed(self):
+        DataSource.set_incremental(1, False, ["fake"])
+        data = self.get_data()
+        self.assertEqual(["'2013-01-01'"], FakeDS.calls)
+        self.assertEqual([2, 2, 2, 2, 2], data["commits"])
+
+
+class StateDS(FakeDS):
+    """ Data source with a state dependent metric """
+
+    _metrics_set = [Pending]
+
+    @staticmethod
+    def get_evolutionary_data(period, startdate, enddate, identities_db, filter_ = None):
+        data = FakeDS.get_evolutionary_data(period, startdate, enddate, identities_db, filter_)
+        data["pending"] = data.pop("commits")
+        return data
+
+
+if __name__ == '__main__':
+    unittest.main()
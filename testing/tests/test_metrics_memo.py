@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2014 Bitergia
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place - Suite 330, Boston, MA 02111-1307, USA.
+#
+# Authors:
+#         Alvaro del Castillo <acs@bitergia.com>
+#
+
+
+"""Tests for the memo of metrics results (no database needed)"""
+
+import sys
+import unittest
+
+if not '..' in sys.path:
+    sys.path.insert(0, '../..')
+
+from vizgrimoire.metrics.metrics import Metrics
+from vizgrimoire.metrics.metrics_filter import MetricFilters
+from vizgrimoire.metrics.metrics_memo import MetricsMemo
+
+
+class FakeDB(object):
+    database = "test_db"
+    identities_db = "test_identities"
+
+
+class Commits(Metrics):
+    id = "commits"
+
+
+class TestMetricsMemo(unittest.TestCase):
+
+    def get_metric(self, global_filter = None):
+        filters = MetricFilters("month", "'2013-01-01'", "'2014-01-01'",
+                                ["repository", None], global_filter = global_filter)
+        return Commits(FakeDB(), filters)
+
+    def test_list_filters(self):
+        # <ds>_global_filter config is read as a list
+        metric = self.get_metric([["type", "'bug'"], ["status", "'closed'"]])
+        key = MetricsMemo.get_key(metric, "get_ts")
+        hash(key)
+        memo = MetricsMemo()
+        self.assertFalse(memo.has_key(key))
+        memo.put(key, {"commits": [1, 2]})
+        self.assertTrue(memo.has_key(key))
+        self.assertEqual((True, {"commits": [1, 2]}), memo.get(key))
+
+    def test_different_filters(self):
+        key = MetricsMemo.get_key(self.get_metric([["type", "'bug'"]]), "get_ts")
+        other = MetricsMemo.get_key(self.get_metric([["type", "'task'"]]), "get_ts")
+        self.assertNotEqual(key, other)
+        self.assertNotEqual(key, MetricsMemo.get_key(self.get_metric(), "get_ts"))
+
+    def test_copies(self):
+        memo = MetricsMemo()
+        key = MetricsMemo.get_key(self.get_metric(), "get_agg")
+        value = {"commits": 1}
+        memo.put(key, value)
+        value["commits"] = 2
+        (found, stored) = memo.get(key)
+        stored["commits"] = 3
+        self.assertEqual((True, {"commits": 1}), memo.get(key))
+
+    def test_not_hashable_key(self):
+        memo = MetricsMemo()
+        key = (Commits, {"not": "hashable"})
+        self.assertFalse(memo.has_key(key))
+        memo.put(key, 1)
+        self.assertFalse(memo.has_key(key))
+        self.assertEqual(0, memo.hits)
+
+    def test_call(self):
+        memo = MetricsMemo()
+        metric = self.get_metric([["type", "'bug'"]])
+        calls = []
+        def function(*args):
+            calls.append(args)
+            return len(calls)
+        self.assertEqual(1, memo.call(metric, "get_list", function, (10,), {}))
+        self.assertEqual(1, memo.call(metric, "get_list", function, (10,), {}))
+        self.assertEqual(2, memo.call(metric, "get_list", function, (20,), {}))
+        # Not hashable args are not memoized
+        self.assertEqual(3, memo.call(metric, "get_list", function, ({},), {}))
+        self.assertEqual([1, 2], memo.get_stats())
+
+
+if __name__ == '__main__':
+    unittest.main()
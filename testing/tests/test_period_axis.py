@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2014 Bitergia
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place - Suite 330, Boston, MA 02111-1307, USA.
+#
+# Authors:
+#         Alvaro del Castillo <acs@bitergia.com>
+#
+
+
+"""Tests for the completion of time series periods (no database needed)"""
+
+import calendar
+import datetime
+import os
+import sys
+import time
+import unittest
+
+if not '..' in sys.path:
+    sys.path.insert(0, '../..')
+
+from vizgrimoire.GrimoireUtils import completePeriodIds, genDates
+from vizgrimoire.metrics.query_builder import DSQuery
+
+
+class TestDayPeriods(unittest.TestCase):
+
+    def setUp(self):
+        # Results must not depend on the time zone of the servers
+        self.tz = os.environ.get("TZ")
+        os.environ["TZ"] = "America/Los_Angeles"
+        time.tzset()
+
+    def tearDown(self):
+        if self.tz is None: del os.environ["TZ"]
+        else: os.environ["TZ"] = self.tz
+        time.tzset()
+
+    def test_sql_day(self):
+        sql = DSQuery.GetSQLPeriod("day", "s.date", "count(*) as commits",
+                                   "scmlog s", "", "'2014-01-01'", "'2014-01-04'")
+        self.assertTrue("TO_DAYS(s.date) AS day" in sql)
+
+    def test_complete_days(self):
+        # TO_DAYS('2014-01-01') is 735599
+        data = {"day": [735599, 735601], "commits": [3, 5]}
+        data = completePeriodIds(data, "day", "'2014-01-01'", "'2014-01-04'")
+        self.assertEqual([735599, 735600, 735601], data["day"])
+        self.assertEqual([3, 0, 5], data["commits"])
+        unixtime = [unicode(calendar.timegm(datetime.date(2014, 1, day).timetuple()))
+                    for day in [1, 2, 3]]
+        self.assertEqual(unixtime, data["unixtime"])
+        self.assertEqual(["01 Jan 2014", "02 Jan 2014", "03 Jan 2014"], data["date"])
+        self.assertEqual([0, 1, 2], data["id"])
+
+    def test_gen_dates(self):
+        data = genDates("day", "'2014-02-27'", "'2014-03-02'")
+        self.assertEqual([735656, 735657, 735658], data["day"])
+
+    def test_without_day(self):
+        # Days not grouped by TO_DAYS are not completed
+        data = {"unixtime": [1388563200], "commits": [3]}
+        self.assertEqual(data, completePeriodIds(dict(data), "day",
+                                                 "'2014-01-01'", "'2014-01-04'"))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,130 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2014 Bitergia
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place - Suite 330, Boston, MA 02111-1307, USA.
+#
+# Authors:
+#         Alvaro del Castillo <acs@bitergia.com>
+#
+
+"""Tests for the metrics fused in one query (no database needed)"""
+
+import sys
+import unittest
+from sets import Set
+
+if not '..' in sys.path:
+    sys.path.insert(0, '../..')
+
+from vizgrimoire.GrimoireUtils import fill_and_order_items
+from vizgrimoire.metrics.metrics import Metrics
+from vizgrimoire.metrics.metrics_filter import MetricFilters
+from vizgrimoire.metrics.query_planner import QueryPlanner
+
+
+class FakeDB(object):
+    """ DSQuery returning a fixed result """
+
+    database = "test_db"
+
+    def __init__(self, result):
+        self.result = result
+        self.queries = []
+
+    def BuildQuery(self, period, startdate, enddate, date_field, fields,
+                   tables, filters, evolutionary, type_analysis = None):
+        fields = sorted(fields)
+        # Items of the filter with all its items, as DSQuery does
+        if type_analysis is not None and type_analysis[1] is None:
+            fields = ["org.name as name"] + fields
+        return "SELECT " + ",".join(fields)
+
+    def ExecuteQuery(self, sql):
+        self.queries.append(sql)
+        return self.result
+
+
+class Commits(Metrics):
+    id = "commits"
+
+    def _get_sql(self, evolutionary):
+        fields = Set(["count(distinct(s.id)) as commits"])
+        return self.db.BuildQuery(self.filters.period, self.filters.startdate,
+                                  self.filters.enddate, " s.date ", fields,
+                                  Set(["scmlog s"]), Set([]), evolutionary,
+                                  self.filters.type_analysis)
+
+
+class Authors(Commits):
+    id = "authors"
+
+    def _get_sql(self, evolutionary):
+        fields = Set(["count(distinct(s.author_id)) as authors"])
+        return self.db.BuildQuery(self.filters.period, self.filters.startdate,
+                                  self.filters.enddate, " s.date ", fields,
+                                  Set(["scmlog s"]), Set([]), evolutionary,
+                                  self.filters.type_analysis)
+
+
+class SentPatchsets(Commits):
+    id = "sent_patchsets"
+
+    def _get_sql(self, evolutionary):
+        fields = Set(["count(distinct ch.issue_id, ch.old_value) as sent_patchsets"])
+        return self.db.BuildQuery(self.filters.period, self.filters.startdate,
+                                  self.filters.enddate, " s.date ", fields,
+                                  Set(["scmlog s"]), Set([]), evolutionary,
+                                  self.filters.type_analysis)
+
+
+class TestQueryPlanner(unittest.TestCase):
+
+    def setUp(self):
+        self.filters = MetricFilters("month", "'2013-01-01'", "'2014-01-01'",
+                                     ["company", None])
+
+    def test_one_query_for_group(self):
+        db = FakeDB({"name": ["a", "b"], "commits": [3, 2], "authors": [2, 1]})
+        metrics = [Commits(db, self.filters), Authors(db, self.filters)]
+        values = QueryPlanner(metrics, False).get_values()
+        self.assertEqual(1, len(db.queries))
+        self.assertEqual({"name": ["a", "b"], "commits": [3, 2]}, values["commits"])
+        self.assertEqual({"name": ["a", "b"], "authors": [2, 1]}, values["authors"])
+
+    def test_fill_items_without_activity(self):
+        # Items filled in the values of a metric must not change the others
+        db = FakeDB({"name": ["a", "b"], "commits": [3, 2], "authors": [2, 1]})
+        metrics = [Commits(db, self.filters), Authors(db, self.filters)]
+        values = QueryPlanner(metrics, False).get_values()
+        items = ["b", "c", "a"]
+        commits = fill_and_order_items(items, values["commits"], "name")
+        authors = fill_and_order_items(items, values["authors"], "name")
+        self.assertEqual({"name": items, "commits": [2, 0, 3]}, commits)
+        self.assertEqual({"name": items, "authors": [1, 0, 2]}, authors)
+
+    def test_order_field_all_items(self):
+        # The ORDER BY of all the items is the third word of the first field
+        db = FakeDB({})
+        metrics = [SentPatchsets(db, self.filters), Commits(db, self.filters)]
+        self.assertEqual([], QueryPlanner(metrics, False).get_groups())
+        self.assertEqual(1, len(QueryPlanner(metrics, True).get_groups()))
+        filters = MetricFilters("month", "'2013-01-01'", "'2014-01-01'")
+        metrics = [SentPatchsets(db, filters), Commits(db, filters)]
+        self.assertEqual(1, len(QueryPlanner(metrics, False).get_groups()))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,129 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2014 Bitergia
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place - Suite 330, Boston, MA 02111-1307, USA.
+#
+# Authors:
+#         Alvaro del Castillo <acs@bitergia.com>
+#
+
+
+"""Tests for the tasks scheduler (no database needed)"""
+
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+if not '..' in sys.path:
+    sys.path.insert(0, '../..')
+
+from vizgrimoire.tasks import Task, TaskScheduler
+
+# Names of the tasks run in this process
+calls = []
+
+def add(name, *values):
+    calls.append(name)
+    return sum(values)
+
+def fail(name, *values):
+    calls.append(name)
+    raise Exception("task failed")
+
+
+class TestTaskScheduler(unittest.TestCase):
+
+    jobs = 1
+
+    def setUp(self):
+        del calls[:]
+        self.destdir = tempfile.mkdtemp()
+        self.state_file = os.path.join(self.destdir, ".tasks.json")
+        logging.disable(logging.CRITICAL)
+
+    def tearDown(self):
+        logging.disable(logging.NOTSET)
+        shutil.rmtree(self.destdir)
+
+    def get_scheduler(self, second = add, signature = "run1"):
+        scheduler = TaskScheduler(self.jobs, None, self.state_file, signature)
+        scheduler.add(Task("first", add, ("first", 1)))
+        scheduler.add(Task("second", second, ("second", 2), inputs = ["first"]))
+        scheduler.add(Task("third", add, ("third", 3), inputs = ["second"]))
+        scheduler.add(Task("other", add, ("other", 4), depends = ["first"]))
+        return scheduler
+
+    def test_run(self):
+        scheduler = self.get_scheduler()
+        self.assertEqual([], scheduler.run())
+        self.assertEqual({"first": 1, "second": 3, "third": 6, "other": 4}, scheduler.done)
+
+    def test_failed(self):
+        scheduler = self.get_scheduler(fail)
+        # Tasks depending on the failed one are skipped, the rest go on
+        self.assertEqual(["second", "third"], scheduler.run())
+        self.assertEqual(["second"], scheduler.failed)
+        self.assertEqual(["third"], scheduler.skipped)
+        self.assertEqual({"first": 1, "other": 4}, scheduler.done)
+
+    def test_skipped_later(self):
+        # Tasks depending on tasks skipped after them in the same scan
+        scheduler = TaskScheduler(self.jobs)
+        scheduler.add(Task("C", add, ("C",), depends = ["B"]))
+        scheduler.add(Task("B", add, ("B",), depends = ["A"]))
+        scheduler.add(Task("A", fail, ("A",)))
+        self.assertEqual(["A", "B", "C"], scheduler.run())
+        self.assertEqual(["B", "C"], scheduler.skipped)
+
+    def test_resume(self):
+        self.get_scheduler(fail).run()
+        del calls[:]
+        scheduler = self.get_scheduler()
+        self.assertEqual([], scheduler.run(resume = True))
+        self.assertEqual({"first": 1, "second": 3, "third": 6, "other": 4}, scheduler.done)
+        if self.jobs == 1:
+            self.assertEqual(["second", "third"], calls)
+
+    def test_resume_other_run(self):
+        self.get_scheduler(fail).run()
+        del calls[:]
+        scheduler = self.get_scheduler(signature = "run2")
+        self.assertEqual([], scheduler.run(resume = True))
+        if self.jobs == 1:
+            self.assertEqual(["first", "second", "third", "other"], calls)
+
+    def test_wrong_dependencies(self):
+        scheduler = TaskScheduler(self.jobs)
+        scheduler.add(Task("first", add, ("first",), depends = ["unknown"]))
+        self.assertRaises(ValueError, scheduler.run)
+        scheduler = TaskScheduler(self.jobs)
+        scheduler.add(Task("first", add, ("first",), depends = ["second"]))
+        scheduler.add(Task("second", add, ("second",), depends = ["first"]))
+        self.assertRaises(ValueError, scheduler.run)
+        self.assertRaises(ValueError, scheduler.add, Task("first", add))
+
+
+class TestTaskSchedulerJobs(TestTaskScheduler):
+    """ Tasks run in worker processes """
+
+    jobs = 2
+
+
+if __name__ == '__main__':
+    unittest.main()
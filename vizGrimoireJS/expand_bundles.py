@@ -0,0 +1,76 @@
+#!/usr/bin/env python
+
+# Copyright (C) 2014 Bitergia
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place - Suite 330, Boston, MA 02111-1307, USA.
+#
+# This file is a part of the vizGrimoire.R package
+#
+# Authors:
+#   Alvaro del Castillo <acs@bitergia.com>
+#
+
+""" Write the legacy JSON files of the items in bundles (report_tool --bundles) """
+
+import logging, sys
+from optparse import OptionParser
+
+from vizgrimoire.bundles import expand_bundle, get_bundles
+
+def get_options():
+    parser = OptionParser(usage='Usage: %prog [options]',
+                          description='Expand filters items bundles to one JSON file per item',
+                          version='0.1')
+    parser.add_option("-d", "--destination",
+                      action="store",
+                      dest="destdir",
+                      default="data/json",
+                      help="Directory with the bundles")
+    parser.add_option("-o", "--output",
+                      action="store",
+                      dest="outdir",
+                      help="Directory for the JSON files. Default: the bundles directory")
+    parser.add_option("-b", "--bundle",
+                      action="store",
+                      dest="bundle",
+                      help="Bundle to expand. Default: all bundles")
+    parser.add_option("-g", "--debug",
+                      action="store_true",
+                      dest="debug",
+                      default=False,
+                      help="Debug mode")
+    (opts, args) = parser.parse_args()
+
+    if len(args) != 0:
+        parser.error("Wrong number of arguments")
+
+    return opts
+
+if __name__ == '__main__':
+    opts = get_options()
+    if opts.debug:
+        logging.basicConfig(level=logging.DEBUG, format='%(asctime)s %(message)s')
+    else:
+        logging.basicConfig(level=logging.INFO, format='%(asctime)s %(message)s')
+
+    if opts.bundle: bundles = [opts.bundle]
+    else: bundles = get_bundles(opts.destdir)
+    if len(bundles) == 0:
+        logging.error("No bundles found in " + opts.destdir)
+        sys.exit(1)
+
+    for bundle in bundles:
+        items = expand_bundle(opts.destdir, bundle, opts.outdir)
+        logging.info(bundle + ": " + str(items) + " files")
@@ -75,7 +75,6 @@ def init_env():
 
 if __name__ == '__main__':
     init_env()
-    from vizgrimoire.metrics.metric import Metric
     from vizgrimoire.SCM import SCM
     from vizgrimoire.report import Report
 
@@ -104,15 +103,20 @@ if __name__ == '__main__':
     # Metrics
     for ds in dss:
         print("\nGetting metrics for " + ds.get_name())
+        if opts.list:
+            # Metrics are not created, so no database is used
+            for metrics_class in Report.get_metrics_classes(ds):
+                print "->" + metrics_class.name
+                total_metrics += 1
+            continue
         metrics_set = ds.get_metrics_set(ds)
         for metrics in metrics_set:
             print "->" + metrics.get_definition()['name']
             total_metrics += 1
-            if opts.list is None:
-                agg = metrics.get_agg()
-                if agg is not None: print(agg)
-                evol = metrics.get_ts()
-                # if evol is not None: print(evol)
+            agg = metrics.get_agg()
+            if agg is not None: print(agg)
+            evol = metrics.get_ts()
+            # if evol is not None: print(evol)
 
     # Studies
     studies = Report.get_all_studies()
@@ -32,6 +32,7 @@ import vizgrimoire.GrimoireUtils, vizgrimoire.GrimoireSQL
 from vizgrimoire.GrimoireUtils import dataFrame2Dict, createJSON, completePeriodIds
 from optparse import OptionParser
 from vizgrimoire.analysis.threads import Threads
+import vizgrimoire.threads_index
 import vizgrimoire.MLS
 
 def read_options():
@@ -67,6 +68,10 @@ def read_options():
                       action="store", 
                       dest="destdir",
                       help="Output dir of JSON files")
+    parser.add_option("-x", "--threads-index",
+                      action="store",
+                      dest="threads_index_dir",
+                      help="Dir to keep the threads index between runs")
     (opts, args) = parser.parse_args()
 
     if len(args) != 0:
@@ -109,10 +114,11 @@ if __name__ == '__main__':
     startdate = opts.initdate
     enddate = opts.enddate
     identities_db = opts.dbidentities
-
-    main_topics = Threads(startdate, enddate, identities_db)
+    if opts.threads_index_dir is not None:
+        vizgrimoire.threads_index.set_index_dir(opts.threads_index_dir)
 
     # Example of use for the most verbose thread
+    #main_topics = Threads(startdate, enddate, identities_db)
     #email = main_topics.verboseThread()
     #print "The most verbose thread: "
     #print """
@@ -34,10 +34,9 @@ def get_evol_report(startdate, enddate, identities_db):
         all_ds[ds.get_name()] = ds.get_evolutionary_data (period, startdate, enddate, identities_db)
     return all_ds
 
-def create_evol_report(startdate, enddate, destdir, identities_db):
-    for ds in Report.get_data_sources():
-        Report.connect_ds(ds)
-        ds.create_evolutionary_report (period, startdate, enddate, destdir, identities_db)
+def create_evol_report_ds(ds, startdate, enddate, destdir, identities_db):
+    Report.connect_ds(ds)
+    ds.create_evolutionary_report (period, startdate, enddate, destdir, identities_db)
 
 def get_agg_report(startdate, enddate, identities_db):
     all_ds = {}
@@ -47,10 +46,9 @@ def get_agg_report(startdate, enddate, identities_db):
         all_ds[ds.get_name()] = ds.get_agg_data (period, startdate, enddate, identities_db)
     return all_ds
 
-def create_agg_report(startdate, enddate, destdir, identities_db):
-    for ds in Report.get_data_sources():
-        Report.connect_ds(ds)
-        ds.create_agg_report (period, startdate, enddate, destdir, identities_db)
+def create_agg_report_ds(ds, startdate, enddate, destdir, identities_db):
+    Report.connect_ds(ds)
+    ds.create_agg_report (period, startdate, enddate, destdir, identities_db)
 
 def get_top_report(startdate, enddate, npeople, identities_db, only_people=False):
     all_ds_top = {}
@@ -66,61 +64,56 @@ def get_top_report(startdate, enddate, npeople, identities_db, only_people=False
         all_ds_top[ds.get_name()] = top
     return all_ds_top
 
-def create_top_report(startdate, enddate, destdir, npeople, identities_db):
-    for ds in Report.get_data_sources():
-        logging.info("Creating TOP for " + ds.get_name())
-        Report.connect_ds(ds)
-        ds.create_top_report (startdate, enddate, destdir, npeople, identities_db)
+def create_top_report_ds(ds, startdate, enddate, destdir, npeople, identities_db):
+    logging.info("Creating TOP for " + ds.get_name())
+    Report.connect_ds(ds)
+    ds.create_top_report (startdate, enddate, destdir, npeople, identities_db)
+
+def create_filter_report_ds(ds, filter_, period, startdate, enddate, destdir, npeople, identities_db):
+    Report.connect_ds(ds)
+    logging.info("Creating filter reports for " + ds.get_name() + " -> " + filter_.get_name())
+    # Tested in all this filters the group by
+    supported_all = {
+                 "scm":["people2","company","country","repository","domain","company+country","company+project"],
+                 "its":["people2","company","country","repository","domain","company+country","company+project"],
+                 "its_1":["people2"],
+                 "mls":["people2","company","country","repository","domain"],
+                 "scr":["people2","company","country","repository"],
+                 "mediawiki":["people2","company"],
+                 "irc":["people2"],
+                 "downloads":["people2"],
+                 "qaforums":["people2"],
+                 "releases":["people2"],
+                 "pullpo":["people2"],
+                 "eventizer":[]
+                 }
+    supported_on = {
+                 "scm":["people2","company","country","repository","domain","company+country","company+project"],
+                 "its":["people2","company","country","repository","domain","company+country","company+project"],
+                 "its_1":["people2"],
+                 "mls":["people2","company","country","repository","domain"],
+                 "scr":["people2","company","country","repository"],
+                 "mediawiki":["people2","company"],
+                 "irc":["people2"],
+                 "downloads":["people2"],
+                 "qaforums":["people2"],
+                 "releases":["people2"],
+                 "pullpo":["people2"],
+                 "eventizer":[]
+                 }
+
+    if filter_.get_name() in supported_on[ds.get_name()]:
+    # if filter_.get_name() in ["people2","company+country","repository","company"]:
+        logging.info("---> Using new filter API")
+        ds.create_filter_report_all(filter_, period, startdate, enddate,
+                                    destdir, npeople, identities_db)
+    else:
+        ds.create_filter_report(filter_, period, startdate, enddate, destdir, npeople, identities_db)
 
-def create_reports_filters(period, startdate, enddate, destdir, npeople, identities_db):
-    for ds in Report.get_data_sources():
-        Report.connect_ds(ds)
-        logging.info("Creating filter reports for " + ds.get_name())
-        for filter_ in Report.get_filters():
-            logging.info("-> " + filter_.get_name())
-            # Tested in all this filters the group by
-            supported_all = {
-                         "scm":["people2","company","country","repository","domain","company+country","company+project"],
-                         "its":["people2","company","country","repository","domain","company+country","company+project"],
-                         "its_1":["people2"],
-                         "mls":["people2","company","country","repository","domain"],
-                         "scr":["people2","company","country","repository"],
-                         "mediawiki":["people2","company"],
-                         "irc":["people2"],
-                         "downloads":["people2"],
-                         "qaforums":["people2"],
-                         "releases":["people2"],
-                         "pullpo":["people2"],
-                         "eventizer":[]
-                         }
-            supported_on = {
-                         "scm":["people2","company","country","repository","domain","company+country","company+project"],
-                         "its":["people2","company","country","repository","domain","company+country","company+project"],
-                         "its_1":["people2"],
-                         "mls":["people2","company","country","repository","domain"],
-                         "scr":["people2","company","country","repository"],
-                         "mediawiki":["people2","company"],
-                         "irc":["people2"],
-                         "downloads":["people2"],
-                         "qaforums":["people2"],
-                         "releases":["people2"],
-                         "pullpo":["people2"],
-                         "eventizer":[]
-                         }
-
-            if filter_.get_name() in supported_on[ds.get_name()]:
-            # if filter_.get_name() in ["people2","company+country","repository","company"]:
-                logging.info("---> Using new filter API")
-                ds.create_filter_report_all(filter_, period, startdate, enddate,
-                                            destdir, npeople, identities_db)
-            else:
-                ds.create_filter_report(filter_, period, startdate, enddate, destdir, npeople, identities_db)
-
-def create_report_people(startdate, enddate, destdir, npeople, identities_db, people_ids=None):
-    for ds in Report.get_data_sources():
-        Report.connect_ds(ds)
-        logging.info("Creating people for " + ds.get_name())
-        ds().create_people_report(period, startdate, enddate, destdir, npeople, identities_db, people_ids)
+def create_report_people_ds(ds, startdate, enddate, destdir, npeople, identities_db, people_ids=None):
+    Report.connect_ds(ds)
+    logging.info("Creating people for " + ds.get_name())
+    ds().create_people_report(period, startdate, enddate, destdir, npeople, identities_db, people_ids)
 
 def get_top_people (startdate, enddate, idb):
     """Top people for all data sources."""
@@ -242,7 +235,7 @@ def create_people_identifiers(startdate, enddate, destdir, npeople, identities_d
 
     return people_ids
 
-def create_reports_studies(period, startdate, enddate, destdir):
+def create_reports_studies_ds(ds, period, startdate, enddate, destdir):
     from vizgrimoire.metrics.metrics_filter import MetricFilters
 
     db_identities= Report.get_config()['generic']['db_identities']
@@ -253,22 +246,21 @@ def create_reports_studies(period, startdate, enddate, destdir):
 
     metric_filters = MetricFilters(period, startdate, enddate, [])
 
-    for ds in Report.get_data_sources():
-        ds_dbname = ds.get_db_name()
-        dbname = Report.get_config()['generic'][ds_dbname]
-        dsquery = ds.get_query_builder()
-        dbcon = dsquery(dbuser, dbpass, dbname, db_identities)
-        # logging.info(ds.get_name() + " studies active " + str(studies))
-        for study in studies:
-            logging.info("Creating report for " + study.id + " for " + ds.get_name())
-            try:
-                obj = study(dbcon, metric_filters)
-                obj.create_report(ds, destdir)
-            except TypeError:
-                import traceback
-                logging.info(study.id + " does no support standard API. Not used.")
-                traceback.print_exc(file=sys.stdout)
-                continue
+    ds_dbname = ds.get_db_name()
+    dbname = Report.get_config()['generic'][ds_dbname]
+    dsquery = ds.get_query_builder()
+    dbcon = dsquery(dbuser, dbpass, dbname, db_identities)
+    # logging.info(ds.get_name() + " studies active " + str(studies))
+    for study in studies:
+        logging.info("Creating report for " + study.id + " for " + ds.get_name())
+        try:
+            obj = study(dbcon, metric_filters)
+            obj.create_report(ds, destdir)
+        except TypeError:
+            import traceback
+            logging.info(study.id + " does no support standard API. Not used.")
+            traceback.print_exc(file=sys.stdout)
+            continue
 
 def create_events(startdate, enddate, destdir):
     for ds in Report.get_data_sources():
@@ -329,6 +321,88 @@ def set_study(study_id):
         logging.error(study_id + " study not available ")
         sys.exit(1)
 
+def check_indexes(create = False):
+    """ Show or create the indexes missing in each data source database """
+    generic = Report.get_config()['generic']
+    db_projects = None
+    if 'db_projects' in generic: db_projects = generic['db_projects']
+    for ds in Report.get_data_sources():
+        try:
+            builder = ds.get_query_builder()
+        except NotImplementedError:
+            continue
+        dsquery = builder(generic['db_user'], generic['db_password'],
+                          generic[ds.get_db_name()], generic['db_identities'],
+                          db_projects)
+        if create: missing = dsquery.create_missing_indexes()
+        else: missing = dsquery.get_missing_indexes()
+        for (table, columns) in missing:
+            logging.info("%s: missing index %s(%s)" % (ds.get_name(), table, ",".join(columns)))
+        if create and len(missing) > 0:
+            logging.info("%s: %i indexes created" % (ds.get_name(), len(missing)))
+        elif len(missing) == 0:
+            logging.info("%s: all indexes available" % (ds.get_name()))
+
+def create_report_tasks(period, startdate, enddate, destdir, npeople, identities_db):
+    """ Scheduler with the tasks of the report: (data source, phase, filter) """
+    from vizgrimoire.tasks import Task, TaskScheduler
+
+    group_jobs = 1
+    if 'jobs_per_data_source' in automator['r']:
+        group_jobs = int(automator['r']['jobs_per_data_source'])
+    # Run options: a state is only resumed by the same run
+    signature = {"config_file": os.path.abspath(opts.config_file),
+                 "startdate": startdate, "enddate": enddate, "period": period,
+                 "destdir": os.path.abspath(destdir),
+                 "data_sources": [ds.get_name() for ds in Report.get_data_sources()],
+                 "filters": [filter_.get_name() for filter_ in Report.get_filters()],
+                 "items": Report.get_items(),
+                 "studies": [study.id for study in Report.get_studies()],
+                 "metric": opts.metric, "no_filters": opts.no_filters,
+                 "incremental": opts.incremental}
+    state_file = os.path.join(destdir, ".report_tool_state.json")
+    scheduler = TaskScheduler(opts.jobs, group_jobs, state_file, signature)
+
+    data_sources = Report.get_data_sources()
+    if not opts.filter and not opts.study:
+        for ds in data_sources:
+            scheduler.add(Task("evol:" + ds.get_name(), create_evol_report_ds,
+                               (ds, startdate, enddate, destdir, identities_db),
+                               group = ds.get_name()))
+            scheduler.add(Task("agg:" + ds.get_name(), create_agg_report_ds,
+                               (ds, startdate, enddate, destdir, identities_db),
+                               group = ds.get_name()))
+        if not opts.metric:
+            scheduler.add(Task("people_identifiers", create_people_identifiers,
+                               (startdate, enddate, destdir, npeople, identities_db)))
+            for ds in data_sources:
+                scheduler.add(Task("top:" + ds.get_name(), create_top_report_ds,
+                                   (ds, startdate, enddate, destdir, npeople, identities_db),
+                                   group = ds.get_name()))
+            if (automator['r']['reports'].find('people')>-1):
+                for ds in data_sources:
+                    scheduler.add(Task("people:" + ds.get_name(), create_report_people_ds,
+                                       (ds, startdate, enddate, destdir, npeople, identities_db),
+                                       inputs = ["people_identifiers"], group = ds.get_name()))
+            # create_reports_r(end_date, opts.destdir)
+            scheduler.add(Task("top_people", create_top_people_report,
+                               (startdate, enddate, destdir, identities_db)))
+
+    if not opts.study and not opts.no_filters and not opts.metric:
+        for ds in data_sources:
+            for filter_ in Report.get_filters():
+                scheduler.add(Task("filter:" + ds.get_name() + ":" + filter_.get_name(),
+                                   create_filter_report_ds,
+                                   (ds, filter_, period, startdate, enddate, destdir,
+                                    npeople, identities_db),
+                                   group = ds.get_name()))
+    if not opts.filter and not opts.metric and not opts.item:
+        for ds in data_sources:
+            scheduler.add(Task("studies:" + ds.get_name(), create_reports_studies_ds,
+                               (ds, period, startdate, enddate, destdir),
+                               group = ds.get_name()))
+    return scheduler
+
 def init_env():
     # env vars for R
     os.environ["LANG"] = ""
@@ -337,8 +411,11 @@ def init_env():
 if __name__ == '__main__':
 
     init_env()
-    from vizgrimoire.GrimoireUtils import getPeriod, read_main_conf, createJSON
+    from vizgrimoire.GrimoireUtils import getPeriod, read_main_conf, createJSON, readJSON, writeJSON
     from vizgrimoire.report import Report
+    from vizgrimoire.metrics.query_builder import DSQuery
+    from vizgrimoire.metrics.metrics import Metrics
+    from vizgrimoire.data_source import DataSource
 
     logging.basicConfig(level=logging.INFO,format='%(asctime)s %(message)s')
     logging.info("Starting Report analysis")
@@ -373,6 +450,32 @@ if __name__ == '__main__':
 
     identities_db = automator['generic']['db_identities']
 
+    if (opts.incremental):
+        # By default the last period and the previous one are computed
+        lookback = 1
+        if 'incremental_lookback' in automator['r']:
+            lookback = int(automator['r']['incremental_lookback'])
+        logging.info("Incremental evolutionary reports. Lookback periods: " + str(lookback))
+        # Old periods are not valid if the identities changed since the last run
+        identities_file = os.path.join(opts.destdir, ".report_tool_identities.json")
+        identities = Report.get_identities_fingerprints()
+        last_identities = readJSON(identities_file)
+        if last_identities is None: last_identities = {}
+        full = [ds for ds in identities if last_identities.get(ds) != identities[ds]]
+        if len(full) > 0:
+            logging.info("Identities changed. Computing all periods for: " + ",".join(full))
+        DataSource.set_incremental(lookback, opts.incremental_check, full)
+
+    if (opts.filter_jobs > 1):
+        DataSource.set_filter_jobs(opts.filter_jobs)
+
+    if (opts.bundles or opts.bundles_gzip):
+        shards = 4
+        if 'bundles_shards' in automator['r']:
+            shards = int(automator['r']['bundles_shards'])
+        logging.info("Filters items in bundles. Shards: " + str(shards))
+        DataSource.set_bundles(shards, opts.bundles_gzip)
+
     if (opts.data_source):
         set_data_source(opts.data_source)
     if (opts.filter):
@@ -381,29 +484,26 @@ if __name__ == '__main__':
         set_metric(opts.metric, opts.data_source)
     if (opts.study):
         set_study(opts.study)
+    if (opts.check_indexes or opts.create_indexes):
+        check_indexes(opts.create_indexes)
+        sys.exit(0)
     if (opts.events):
         create_events(startdate, enddate, opts.destdir)
         logging.info("Events generated OK")
         sys.exit(0)
 
-    if not opts.filter and not opts.study:
-        logging.info("Creating global evolution metrics...")
-        evol = create_evol_report(startdate, enddate, opts.destdir, identities_db)
-        logging.info("Creating global aggregated metrics...")
-        agg = create_agg_report(startdate, enddate, opts.destdir, identities_db)
-        if not opts.metric:
-            people_ids = create_people_identifiers(startdate, enddate, opts.destdir, opts.npeople, identities_db)
-
-            logging.info("Creating global top metrics...")
-            top = create_top_report(startdate, enddate, opts.destdir, opts.npeople, identities_db)
-            if (automator['r']['reports'].find('people')>-1):
-                create_report_people(startdate, enddate, opts.destdir, opts.npeople, identities_db, people_ids)
-            # create_reports_r(end_date, opts.destdir)
-            create_top_people_report(startdate, enddate, opts.destdir, identities_db)
+    scheduler = create_report_tasks(period, startdate, enddate, opts.destdir,
+                                    opts.npeople, identities_db)
+    failed = scheduler.run(opts.resume)
 
-    if not opts.study and not opts.no_filters and not opts.metric:
-        create_reports_filters(period, startdate, enddate, opts.destdir, opts.npeople, identities_db)
-    if not opts.filter and not opts.metric and not opts.item:
-        create_reports_studies(period, startdate, enddate, opts.destdir)
+    if DSQuery.cache is not None: DSQuery.cache.log_stats()
+    if Metrics.memo is not None: Metrics.memo.log_stats()
+    if DSQuery.query_log is not None: DSQuery.query_log.write_summary()
 
+    if len(failed) > 0:
+        logging.error("Report data source analysis failed. Tasks not done: " + ",".join(failed))
+        logging.error("Use --resume to run only the tasks not done")
+        sys.exit(1)
+    os.remove(scheduler.state_file)
+    if (opts.incremental): writeJSON(identities, identities_file)
     logging.info("Report data source analysis OK")
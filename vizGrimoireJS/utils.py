@@ -117,6 +117,46 @@ def read_options():
                       action="store_true",
                       dest="events",
                       help="Generate events.")
+    parser.add_option("--incremental",
+                      action="store_true",
+                      dest="incremental",
+                      help="Only compute the last periods of evolutionary data, reusing the JSON files in destdir.")
+    parser.add_option("--incremental-check",
+                      action="store_true",
+                      dest="incremental_check",
+                      help="Compare incremental evolutionary data with the data for all periods.")
+    parser.add_option("--jobs",
+                      action="store",
+                      dest="jobs",
+                      type="int",
+                      default=1,
+                      help="Number of report tasks run in parallel. Each task runs in its own process: metrics results are memoized only within a task.")
+    parser.add_option("--resume",
+                      action="store_true",
+                      dest="resume",
+                      help="Skip the report tasks done in the last run, if it failed.")
+    parser.add_option("--filter-jobs",
+                      action="store",
+                      dest="filter_jobs",
+                      type="int",
+                      default=1,
+                      help="Number of filter items processed in parallel by each data source.")
+    parser.add_option("--bundles",
+                      action="store_true",
+                      dest="bundles",
+                      help="Write the items files of filters in sharded bundles instead of one JSON file per item.")
+    parser.add_option("--bundles-gzip",
+                      action="store_true",
+                      dest="bundles_gzip",
+                      help="Compress the bundles with gzip.")
+    parser.add_option("--check-indexes",
+                      action="store_true",
+                      dest="check_indexes",
+                      help="Show the indexes missing in the data sources databases.")
+    parser.add_option("--create-indexes",
+                      action="store_true",
+                      dest="create_indexes",
+                      help="Create the indexes missing in the data sources databases.")
 
     (opts, args) = parser.parse_args()
 
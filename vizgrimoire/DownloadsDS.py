@@ -109,9 +109,10 @@ class DownloadsDS(DataSource):
 
     @staticmethod
     def create_evolutionary_report (period, startdate, enddate, destdir, i_db, filter_ = None):
-        data =  DownloadsDS.get_evolutionary_data (period, startdate, enddate, i_db, filter_)
         filename = DownloadsDS().get_evolutionary_filename()
-        createJSON (data, os.path.join(destdir, filename))
+        fn = os.path.join(destdir, filename)
+        data = DataSource.get_evolutionary_data_incremental(DownloadsDS, period, startdate, enddate, i_db, filter_, fn)
+        createJSON (data, fn)
 
     @staticmethod
     def get_agg_data (period, startdate, enddate, i_db, filter_ = None):
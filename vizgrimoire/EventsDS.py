@@ -79,9 +79,10 @@ class EventsDS(DataSource):
 
     @staticmethod
     def create_evolutionary_report (period, startdate, enddate, destdir, i_db, type_analysis = None):
-        data =  EventsDS.get_evolutionary_data (period, startdate, enddate, i_db, type_analysis)
         filename = EventsDS().get_evolutionary_filename()
-        createJSON (data, os.path.join(destdir, filename))
+        fn = os.path.join(destdir, filename)
+        data = DataSource.get_evolutionary_data_incremental(EventsDS, period, startdate, enddate, i_db, type_analysis, fn)
+        createJSON (data, fn)
 
     @staticmethod
     def get_agg_data (period, startdate, enddate, identities_db, filter_ = None):
@@ -21,16 +21,17 @@
 
 # SQL utilities
 
-import MySQLdb
 import logging
 import re, sys
+import threading
+from vizgrimoire.db_pool import get_pool
 from vizgrimoire.metrics.query_builder import DSQuery
 
 
-# global vars to be moved to specific classes
-cursor = None
-# one connection per database
-dbpool = {}
+# pool of the database selected with SetDBChannel, per thread
+channel = threading.local()
+# last pool selected in any thread, used by threads without their own channel
+default_pool = None
 
 ##
 ## METAQUERIES
@@ -50,6 +51,79 @@ def GetSQLPeriod(period, date, fields, tables, filters, start, end,
     all_items = DSQuery.get_all_items(type_analysis)
     return DSQuery.GetSQLPeriod(period, date, fields, tables, filters, start, end, all_items)
 
+def GetSQLPeopleFilter(developer_id):
+    """ Condition for a person uuid or for a list of them """
+    if isinstance(developer_id, list):
+        uuids = ",".join(["'" + str(uuid) + "'" for uuid in developer_id])
+        return "pup.uuid IN (" + uuids + ")"
+    return "pup.uuid = '" + str(developer_id) + "'"
+
+def GetSQLPeople(developer_id, period, date, fields, tables, filters, start, end, evol):
+    """ Activity query of a person or, grouped by uuid, of a list of people """
+    if not isinstance(developer_id, list):
+        if evol: return GetSQLPeriod(period, date, fields, tables, filters, start, end)
+        return GetSQLGlobal(date, fields, tables, filters, start, end)
+    if evol:
+        return DSQuery.GetSQLPeriod(period, date, fields, tables, filters, start, end, 'uuid')
+    group_field = DSQuery.get_group_field('uuid')
+    sql = DSQuery.GetSQLGlobal(date, group_field + ", " + fields, tables, filters, start, end)
+    return sql + " GROUP BY " + group_field
+
+def _split_fields(fields):
+    """ Fields of a SELECT, not splitting inside functions or strings """
+    split = []
+    (level, quoted, start) = (0, False, 0)
+    for (pos, char) in enumerate(fields):
+        if char == "'": quoted = not quoted
+        elif quoted: continue
+        elif char == "(": level += 1
+        elif char == ")": level -= 1
+        elif char == "," and level == 0:
+            split.append(fields[start:pos])
+            start = pos + 1
+    split.append(fields[start:])
+    return split
+
+def _get_people_agg_default(sql):
+    """ Aggregated values of a person without activity: 0 counts, NULL others """
+    default = {}
+    fields = sql[sql.upper().index("SELECT") + len("SELECT"):sql.upper().index(" FROM ")]
+    for field in _split_fields(fields):
+        field = re.split(r"\s+as\s+", field.strip(), flags=re.IGNORECASE)
+        if len(field) < 2: continue # uuid
+        (expression, alias) = (field[0].strip(), field[-1].strip())
+        if expression.upper().startswith("COUNT"): default[alias] = 0
+        else: default[alias] = None
+    return default
+
+def ExecutePeopleQuery(sql, people, evol):
+    """ {uuid: data} from a GetSQLPeople query of the list people
+
+        The data of each person is the same the query for the person returns.
+    """
+    data = ExecuteQuery(sql)
+    columns = [column for column in data.keys() if column != 'uuid']
+    if not isinstance(data.get('uuid', []), list):
+        # Just one row
+        data = dict([(column, [value]) for (column, value) in data.items()])
+
+    rows = {} # uuid: positions of its rows
+    for (pos, uuid) in enumerate(data.get('uuid', [])):
+        rows.setdefault(uuid, []).append(pos)
+
+    people_data = {}
+    for uuid in people:
+        positions = rows.get(uuid, [])
+        if len(positions) == 0 and not evol:
+            people_data[uuid] = _get_people_agg_default(sql)
+        elif len(positions) == 1:
+            people_data[uuid] = dict([(column, data[column][positions[0]])
+                                      for column in columns])
+        else:
+            people_data[uuid] = dict([(column, [data[column][pos] for pos in positions])
+                                      for column in columns])
+    return people_data
+
 ############
 #Generic functions to check evolutionary or static info and for the execution of the final query
 ###########
@@ -69,40 +143,17 @@ def BuildQuery (period, startdate, enddate, date_field, fields, tables, filters,
 
 def SetDBChannel (user=None, password=None, database=None,
                   host="127.0.0.1", port=3306, group=None):
-    global cursor
-    global dbpool
-
-    db = None
-
-    if database in dbpool:
-        db = dbpool[database]
-    else:
-        if (group == None):
-            db = MySQLdb.connect(user=user, passwd=password,
-                                 db=database, host=host, port=port)
-        else:
-            db = MySQLdb.connect(read_default_group=group, db=database)
-        dbpool[database] = db
-
-    cursor = db.cursor()
-    cursor.execute("SET NAMES 'utf8'")
-
-def ExecuteQuery (sql):
-    result = {}
-    cursor.execute(sql)
-    rows = cursor.rowcount
-    columns = cursor.description
-
-    if columns is None: return result
-
-    for column in columns:
-        result[column[0]] = []
-    if rows > 1:
-        for value in cursor.fetchall():
-            for (index,column) in enumerate(value):
-                result[columns[index][0]].append(column)
-    elif rows == 1:
-        value = cursor.fetchone()
-        for i in range (0, len(columns)):
-            result[columns[i][0]] = value[i]
-    return result 
+    global default_pool
+    # connections are shared with DSQuery using the same database
+    channel.pool = get_pool(user, password, database, host, port, group)
+    default_pool = channel.pool
+
+def ExecuteQuery (sql, columnar = False):
+    pool = getattr(channel, 'pool', default_pool)
+    if columnar: return DSQuery._execute_columnar(pool, sql)
+    return DSQuery._execute(pool, sql)
+
+def ExecuteQueryStream (sql, chunk_size = None):
+    """ Generator of the results of sql. See DSQuery.ExecuteQueryStream """
+    pool = getattr(channel, 'pool', default_pool)
+    return DSQuery._stream_result(pool, sql, chunk_size)
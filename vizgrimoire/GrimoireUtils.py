@@ -27,8 +27,10 @@
 # Misc utils
 
 import calendar
+from collections import OrderedDict
 from ConfigParser import SafeConfigParser
 from datetime import datetime, timedelta
+from decimal import Decimal
 from dateutil.relativedelta import relativedelta
 from dateutil import parser
 import logging
@@ -37,7 +39,11 @@ import math
 import rpy2.rinterface as rinterface
 from rpy2.robjects.vectors import StrVector
 import os,sys
-from numpy import average, median
+import tempfile
+import numpy
+from numpy import average, median, ndarray
+
+from vizgrimoire.items_index import ItemsIndex
 
 def valRtoPython(val):
     if val is rinterface.NA_Character: val = None
@@ -67,7 +73,7 @@ def createTimeSeries(ts_data):
 def checkListArray(data):
     data_vars = data.keys()
     for key in (data_vars):
-        if not isinstance(data[key], (list)):
+        if not isinstance(data[key], (list, ndarray)):
             data[key] = [data[key]]
 
 # NaN converted to 0
@@ -80,137 +86,164 @@ def cleanNaN(ts_data):
     return ts_data
 
 
-def completePeriodIdsYears(ts_data, start, end):
-    data_vars = ts_data.keys()
-    new_ts_data =  createTimeSeries(ts_data)
-    checkListArray(ts_data)
-
-    start_year = start.year * 12
-    years = end.year - start.year
+def date2Week(date):
+    # isocalendar: year weeknumber weekday
+    week   = str(date.isocalendar()[0])
+    week  += "%02d" % date.isocalendar()[1]
+    return week
 
+def date2Days(date):
+    # TO_DAYS of MySQL: days since year 0
+    return date.toordinal() + 365
 
-    for i in range(0, years+1):
-        if (start_year+(i*12) in ts_data['year']) is False:
-            # Add new time point with all vars to zero
-            for key in (data_vars):
-                new_ts_data[key].append(0)
-            new_ts_data['year'].pop()
-            new_ts_data['year'].append(start_year+(i*12))
-        else:
-            # Add already existing data for the time point
-            index = ts_data['year'].index(start_year+(i*12))
-            for key in (data_vars):
-                new_ts_data[key].append(ts_data[key][index])
+def getPeriodAxis(period, start, end):
+    """ Ids, unixtime, date and position of all periods between start and end
 
-        current =  start + relativedelta(years=i)
-        timestamp = calendar.timegm(current.timetuple())
-        new_ts_data['unixtime'].append(unicode(timestamp))
-        new_ts_data['id'].append(i)
-        new_ts_data['date'].append(datetime.strftime(current, "%b %Y"))
+        Ids are the values used for the period in SQL queries, in ascending
+        order. None is returned for not supported periods.
+    """
+    ids = []
+    dates = []
+    if period == "year":
+        start_year = start.year * 12
+        for i in range(0, end.year - start.year + 1):
+            ids.append(start_year+(i*12))
+            dates.append(start + relativedelta(years=i))
+    elif period == "month":
+        start_month = start.year*12 + start.month
+        end_month = end.year*12 + end.month
+        # All data is from the complete month
+        start = start - timedelta(days=(start.day-1))
+        for i in range(0, end_month - start_month + 1):
+            ids.append(start_month+i)
+            dates.append(start + relativedelta(months=i))
+    elif period == "week":
+        # Start of the week
+        dayweek = start.isocalendar()[2]
+        new_week = start - timedelta(days=dayweek-1)
+        while (new_week <= end):
+            ids.append(int(date2Week(new_week)))
+            dates.append(new_week)
+            new_week = new_week + timedelta(weeks=1)
+    elif period == "day":
+        # Days are identified by TO_DAYS in SQL queries, that does not depend
+        # on the time zone as UNIX_TIMESTAMP does
+        day = datetime(start.year, start.month, start.day)
+        while (day <= end):
+            ids.append(date2Days(day))
+            dates.append(day)
+            day = day + timedelta(days=1)
+    else:
+        return None
 
-    return new_ts_data
+    unixtime = [unicode(calendar.timegm(date.timetuple())) for date in dates]
+    date_format = "%b %Y"
+    if period == "day": date_format = "%d %b %Y"
+    if period == "month" and len(dates) > 0:
+        import locale
+        locale.setlocale(locale.LC_ALL, "en_US.UTF-8")
+    dates = [datetime.strftime(date, date_format) for date in dates]
+    return (ids, unixtime, dates, range(0, len(ids)))
 
+def getPeriodPositions(period_ids, values):
+    """ Position in values of the first value for each period id, -1 if missing
 
-def completePeriodIdsMonths(ts_data, start, end):
-    data_vars = ts_data.keys()
-    new_ts_data =  createTimeSeries(ts_data)
-    checkListArray(ts_data)
+        period_ids must be in ascending order.
+    """
+    positions = numpy.empty(len(period_ids), dtype='int64')
+    positions.fill(-1)
+    if len(period_ids) == 0 or len(values) == 0: return positions.tolist()
+
+    period_ids = numpy.asarray(period_ids, dtype='float64')
+    values = numpy.asarray(values, dtype='float64')
+    slots = numpy.searchsorted(period_ids, values)
+    slots = numpy.minimum(slots, len(period_ids)-1)
+    found = numpy.nonzero(period_ids[slots] == values)[0]
+    # unique returns the first position of each slot
+    found_slots, first = numpy.unique(slots[found], return_index=True)
+    positions[found_slots] = found[first]
+    return positions.tolist()
+
+def getPeriodValues(values, positions):
+    """ Value for each period from its position in values, 0 if missing or NaN """
+    period_values = [values[pos] if pos >= 0 else 0 for pos in positions]
+    for i in range(0, len(period_values)):
+        val = period_values[i]
+        if (isinstance(val, float) and math.isnan(val)): period_values[i] = 0
+    return period_values
+
+# Period axes built in this run by (period, startdate, enddate)
+_period_axes = {}
+
+def getRunPeriodAxis(period, startdate, enddate):
+    """ Period axis for startdate and enddate shared by all time series
+
+        The axis is built once per run and the same lists are used in all
+        time series, so they must not be modified.
+    """
+    key = (period, startdate, enddate)
+    if key not in _period_axes:
+        start = datetime.strptime(startdate.replace("'", ""), "%Y-%m-%d")
+        end = datetime.strptime(enddate.replace("'", ""), "%Y-%m-%d")
+        # In order to use the same approach in the whole GrimoireLib, the last day
+        # specified when retrieving datasets is always ignored. What means that
+        # GrimoireLib is using date >= startdate and date < enddate.
+        # For this reason, a day is substracted from the end date
+        end = end - timedelta(days=1)
+        _period_axes[key] = getPeriodAxis(period, start, end)
+    return _period_axes[key]
+
+def getPeriodField(ts_data, period):
+    """ Field with the period ids in ts_data, None if not included """
+    if period not in ts_data: return None
+    return period
 
-    start_month = start.year*12 + start.month
-    end_month = end.year*12 + end.month
-    months = end_month - start_month
+def completePeriodAxis(ts_data, period_field, axis):
+    """ Time series with a point for each period in axis, 0 for missing ones
 
-    # All data is from the complete month
-    start = start - timedelta(days=(start.day-1))
+        The axis lists are used in the time series, not copied.
+    """
+    (ids, unixtime, dates, id_list) = axis
+    checkListArray(ts_data)
+    positions = getPeriodPositions(ids, ts_data[period_field])
 
-    for i in range(0, months+1):
-        if (start_month+i in ts_data['month']) is False:
-            # Add new time point with all vars to zero
-            for key in (data_vars):
-                new_ts_data[key].append(0)
-            new_ts_data['month'].pop()
-            new_ts_data['month'].append(start_month+i)
+    new_ts_data = {}
+    for key in ts_data:
+        if key == period_field:
+            values = ts_data[key]
+            new_ts_data[key] = [values[pos] if pos >= 0 else ids[i]
+                                for (i, pos) in enumerate(positions)]
         else:
-            # Add already existing data for the time point
-            index = ts_data['month'].index(start_month+i)
-            for key in (data_vars):
-                new_ts_data[key].append(ts_data[key][index])
-
-        current =  start + relativedelta(months=i)
-        timestamp = calendar.timegm(current.timetuple())
-        new_ts_data['unixtime'].append(unicode(timestamp))
-        new_ts_data['id'].append(i)
-        import locale
-        locale.setlocale(locale.LC_ALL, "en_US.UTF-8")
-        new_ts_data['date'].append(datetime.strftime(current, "%b %Y"))
-
+            new_ts_data[key] = getPeriodValues(ts_data[key], positions)
+    # TODO: old format from R JSON. To be simplified
+    new_ts_data['unixtime'] = unixtime
+    new_ts_data['date'] = dates
+    new_ts_data['id'] = id_list
     return new_ts_data
 
-def date2Week(date):
-    # isocalendar: year weeknumber weekday
-    week   = str(date.isocalendar()[0])
-    week  += "%02d" % date.isocalendar()[1]
-    return week
+def completePeriodIdsYears(ts_data, start, end):
+    return completePeriodAxis(ts_data, 'year', getPeriodAxis('year', start, end))
 
-def completePeriodIdsWeeks(ts_data, start, end):
-    data_vars = ts_data.keys()
-    new_ts_data =  createTimeSeries(ts_data)
-    checkListArray(ts_data)
+def completePeriodIdsMonths(ts_data, start, end):
+    return completePeriodAxis(ts_data, 'month', getPeriodAxis('month', start, end))
 
-    # Start of the week
-    dayweek = start.isocalendar()[2]
-    new_week = start - relativedelta(days=dayweek-1)
-    i = 0 # for ids in time series
-
-    while (new_week <= end):
-        new_week_txt = date2Week(new_week)
-        if (int(new_week_txt) in ts_data['week']) is False:
-            # Add new time point with all vars to zero
-            for key in (data_vars):
-                new_ts_data[key].append(0)
-            new_ts_data['week'].pop()
-            new_ts_data['week'].append(int(new_week_txt))
-        else:
-            # Add already existing data for the time point
-            index = ts_data['week'].index(int(new_week_txt))
-            for key in (data_vars):
-                new_ts_data[key].append(ts_data[key][index])
-            new_ts_data['week'].pop()
-            new_ts_data['week'].append(ts_data['week'][index])
-
-        timestamp = calendar.timegm(new_week.timetuple())
-        new_ts_data['unixtime'].append(unicode(timestamp))
-        new_ts_data['id'].append(i)
-        i += 1
-        new_ts_data['date'].append(datetime.strftime(new_week, "%b %Y"))
-        new_week = new_week + relativedelta(weeks=1)
+def completePeriodIdsWeeks(ts_data, start, end):
+    return completePeriodAxis(ts_data, 'week', getPeriodAxis('week', start, end))
 
-    return new_ts_data
+def completePeriodIdsDays(ts_data, start, end):
+    return completePeriodAxis(ts_data, 'day', getPeriodAxis('day', start, end))
 
 def completePeriodIds(ts_data, period, startdate, enddate):
     # If already complete, return
     if "id" in ts_data: return ts_data
 
     if len(ts_data.keys()) == 0: return ts_data
-    new_ts_data = ts_data
-    startdate = startdate.replace("'", "")
-    enddate = enddate.replace("'", "")
-    start = datetime.strptime(startdate, "%Y-%m-%d")
-    end = datetime.strptime(enddate, "%Y-%m-%d")
-    # In order to use the same approach in the whole GrimoireLib, the last day
-    # specified when retrieving datasets is always ignored. What means that
-    # GrimoireLib is using date >= startdate and date < enddate.
-    # For this reason, a day is substracted from the end date
-    end = end - timedelta(days=1)
 
-    if period == "week":
-        new_ts_data = completePeriodIdsWeeks(ts_data, start, end)
-    elif period == "month":
-        new_ts_data = completePeriodIdsMonths(ts_data, start, end)
-    elif period == "year":
-        new_ts_data = completePeriodIdsYears(ts_data, start, end)
+    axis = getRunPeriodAxis(period, startdate, enddate)
+    period_field = getPeriodField(ts_data, period)
+    if axis is None or period_field is None: return cleanNaN(ts_data)
 
-    return cleanNaN(new_ts_data)
+    return completePeriodAxis(ts_data, period_field, axis)
 
 def genDates(period, startdate, enddate):
     """ This function generates empty timeseries period
@@ -226,10 +259,6 @@ def genDates(period, startdate, enddate):
 
     dates = completePeriodIds(dates, period, startdate, enddate)
 
-    # Remove zeros
-    dates['date'] = [d for d in dates['date'] if d != 0]
-    dates['unixtime'] = [d for d in dates['unixtime'] if d != 0]
-
     return dates
 
 
@@ -304,12 +333,16 @@ def roundDecimals(data):
                 data[key] = roundDecimals(data[key])
             elif (isinstance(data[key], dict)):
                 data[key] = roundDecimals(data[key])
+            elif (isinstance(data[key], ndarray)):
+                data[key] = roundDecimals(data[key])
     if (isinstance(data, list)):
         for i in range(0,len(data)):
             if (isinstance(data[i], float)):
                 data[i] = round(data[i], Metrics.max_decimals)
-            if (isinstance(data[i], list)):
+            if (isinstance(data[i], (list, ndarray))):
                 data[i] = roundDecimals(data[i])
+    if (isinstance(data, ndarray) and data.dtype.kind == 'f'):
+        data = numpy.round(data, Metrics.max_decimals)
     return data
 
 
@@ -322,10 +355,15 @@ def convertDatetime(data):
                 data[key] = convertDatetime(data[key])
             elif (isinstance(data[key], dict)):
                 data[key] = convertDatetime(data[key])
+            elif (isinstance(data[key], ndarray)):
+                data[key] = convertDatetime(data[key])
     if (isinstance(data, list)):
         for i in range(0,len(data)):
             if (isinstance(data[i], datetime)):
                 data[i] = str(data[i])
+    if (isinstance(data, ndarray) and data.dtype.kind == 'M'):
+        # Same format than datetime. NaT is converted to None.
+        data = [str(d) if d is not None else None for d in data.astype(object)]
     return data
 
 # Rename "CONCAT(org.name,'_',cou.name)" to "filter"
@@ -341,23 +379,172 @@ def convertCombinedFiltersName(data):
             break
     return data
 
-# Until we use VizPy we will create JSON python files with _py
+def numpy2Python(data):
+    """ Convert NumPy arrays and scalars to Python types for JSON encoding """
+    if isinstance(data, ndarray): return data.tolist()
+    if isinstance(data, numpy.generic): return data.item()
+    raise TypeError(repr(data) + " is not JSON serializable")
+
+# simplejson, if available, encodes with sorted keys in C. The C encoder in
+# json is only used without sort_keys, so keys are ordered in prepareJSON.
+try:
+    import simplejson
+    _json_encoder = simplejson.JSONEncoder(sort_keys=True, default=numpy2Python)
+except ImportError:
+    _json_encoder = json.JSONEncoder(default=numpy2Python)
+
+# Types encoded without changes
+_json_plain_types = set([int, long, str, unicode, bool, type(None)])
+
+# Permissions for JSON files, created first as temporary files
+_umask = os.umask(0)
+os.umask(_umask)
+
+def prepareJSON(data, convert = True, datetimes = True, max_decimals = None):
+    """ Data ready to be encoded in JSON in the format used in createJSON
+
+        It is done in one pass: Decimal to float, rounding floats,
+        datetimes to string, NaN to "NA" and dicts with ordered keys.
+        The first three are also done in data, as removeDecimals,
+        roundDecimals and convertDatetime did, in the same places.
+    """
+    if max_decimals is None:
+        from vizgrimoire.metrics.metrics import Metrics
+        max_decimals = Metrics.max_decimals
+
+    def prepare_value(value):
+        # Types not supported by the encoder and NaN, without conversions
+        if type(value) in _json_plain_types:
+            return value
+        elif isinstance(value, float):
+            if math.isnan(value): return "NA"
+            if type(value) is not float: return float(value)
+        elif isinstance(value, (list, tuple, dict)):
+            return prepareJSON(value, False, False, max_decimals)
+        elif isinstance(value, ndarray):
+            return prepareJSON(value.tolist(), False, False, max_decimals)
+        elif isinstance(value, numpy.generic):
+            return prepare_value(value.item())
+        return value
+
+    if isinstance(data, dict):
+        items = sorted(data.items(), key=lambda kv: kv[0])
+        prepared = OrderedDict()
+        for (key, value) in items:
+            if convert:
+                if isinstance(value, Decimal):
+                    value = data[key] = round(float(value), max_decimals)
+                elif isinstance(value, float):
+                    value = data[key] = round(value, max_decimals)
+                elif isinstance(value, datetime):
+                    value = data[key] = str(value)
+                elif isinstance(value, (list, dict)):
+                    prepared[key] = prepareJSON(value, True, True, max_decimals)
+                    continue
+                elif isinstance(value, ndarray):
+                    if value.dtype.kind == 'f':
+                        value = data[key] = numpy.round(value, max_decimals)
+                    elif value.dtype.kind == 'M':
+                        value = data[key] = convertDatetime(value)
+            prepared[key] = prepare_value(value)
+        return prepared
+
+    if isinstance(data, list) and convert:
+        prepared = []
+        for i in range(0, len(data)):
+            value = data[i]
+            value_type = type(value)
+            if value_type in _json_plain_types:
+                prepared.append(value)
+                continue
+            elif value_type is float:
+                value = data[i] = round(value, max_decimals)
+                if value != value: value = "NA"
+                prepared.append(value)
+                continue
+            elif isinstance(value, Decimal):
+                value = data[i] = round(float(value), max_decimals)
+            elif isinstance(value, float):
+                value = data[i] = round(value, max_decimals)
+            elif datetimes and isinstance(value, datetime):
+                value = data[i] = str(value)
+            elif isinstance(value, list):
+                prepared.append(prepareJSON(value, True, False, max_decimals))
+                continue
+            elif isinstance(value, ndarray) and value.dtype.kind == 'f':
+                value = data[i] = numpy.round(value, max_decimals)
+            prepared.append(prepare_value(value))
+        return prepared
+
+    if isinstance(data, (list, tuple)):
+        return [prepare_value(value) for value in data]
+
+    if isinstance(data, ndarray) and convert:
+        if data.dtype.kind == 'f':
+            data = numpy.round(data, max_decimals)
+        elif data.dtype.kind == 'M':
+            data = convertDatetime(data)
+    return prepare_value(data)
+
+def toJSON(data):
+    """ JSON string for data as it is written by createJSON """
+    data = convertCombinedFiltersName(data)
+    return _json_encoder.encode(prepareJSON(data))
+
+def writeJSON(data, filepath):
+    """ Write data in filepath as JSON replacing it atomically
+
+        The fields of a dict are encoded and written one by one.
+    """
+    data = convertCombinedFiltersName(data)
+    prepared = prepareJSON(data)
+    (fd, tmp_path) = tempfile.mkstemp(dir=os.path.dirname(filepath) or ".",
+                                      prefix=".tmp")
+    try:
+        jsonfile = os.fdopen(fd, 'w')
+        try:
+            if isinstance(prepared, OrderedDict):
+                jsonfile.write("{")
+                first = True
+                for (key, value) in prepared.items():
+                    if not first: jsonfile.write(", ")
+                    first = False
+                    field = _json_encoder.encode(OrderedDict([(key, value)]))
+                    jsonfile.write(field[1:-1])
+                jsonfile.write("}")
+            else:
+                jsonfile.write(_json_encoder.encode(prepared))
+        finally:
+            jsonfile.close()
+        os.chmod(tmp_path, 0666 & ~_umask)
+        os.rename(tmp_path, filepath)
+    except:
+        if os.path.exists(tmp_path): os.remove(tmp_path)
+        raise
+
+def readJSON(filepath):
+    """ Data from a JSON file or None if it can not be read """
+    try:
+        f = open(filepath)
+        try:
+            return json.load(f)
+        finally:
+            f.close()
+    except (IOError, ValueError):
+        return None
+
 def createJSON(data, filepath, check=False, skip_fields = []):
     check = False # for production mode
     filepath_tokens = filepath.split(".json")
     filepath_py = filepath_tokens[0]+"_py.json"
     filepath_r = filepath_tokens[0]+"_r.json"
 
-    checked_data = convertDatetime(roundDecimals(removeDecimals(data)))
-    checked_data = convertCombinedFiltersName(checked_data)
-    json_data = json.dumps(checked_data, sort_keys=True)
-    json_data = json_data.replace('NaN','"NA"')
     if check == False: #forget about R JSON checking
-        jsonfile = open(filepath, 'w')
-        jsonfile.write(json_data)
-        jsonfile.close()
+        writeJSON(data, filepath)
         return
 
+    json_data = toJSON(data)
+
     # NA as value is not decoded with Python JSON
     # JSON R has "NA" and not NaN
     # JSON R has "NA" and not null
@@ -453,6 +640,71 @@ def compare_json_data(data1, data2, orig_file = "", new_file = "", skip_fields =
 
     return check
 
+def get_lookback_startdate(period, enddate, lookback):
+    """ Start of the period lookback periods before the last one before enddate
+
+        None is returned if period is not supported.
+    """
+    end = datetime.strptime(enddate.replace("'", ""), "%Y-%m-%d")
+    # enddate is not included in the data
+    end = end - timedelta(days=1)
+    if period == "month":
+        start = datetime(end.year, end.month, 1) - relativedelta(months=lookback)
+    elif period == "week":
+        start = end - timedelta(days=end.weekday()) - relativedelta(weeks=lookback)
+    else:
+        return None
+    return "'" + start.strftime("%Y-%m-%d") + "'"
+
+def splice_evol_data(old, new, period):
+    """ Replace in old evolutionary data the periods included in new
+
+        Both must be complete time series with the same fields and, for
+        GROUP BY data, the same items. The periods in new must go from one
+        included in old to the last one. None is returned if the data
+        can not be spliced.
+    """
+    ts_fields = [period, 'id', 'unixtime', 'date']
+    if period not in old or period not in new or not new[period]: return None
+    if set(old.keys()) != set(new.keys()): return None
+    if new[period][0] not in old[period]: return None
+    cut = old[period].index(new[period][0])
+    nold = len(old[period])
+    nnew = len(new[period])
+
+    def is_items_ts(value):
+        return isinstance(value, list) and \
+            len([v for v in value if not isinstance(v, list)]) == 0
+    group_by = len([field for field in new if field not in ts_fields
+                    and is_items_ts(new[field])]) > 0
+
+    data = {}
+    for field in new:
+        if field == 'id':
+            data[field] = range(0, cut + nnew)
+        elif field in ts_fields:
+            data[field] = old[field][0:cut] + new[field]
+        elif not isinstance(new[field], list):
+            data[field] = new[field]
+        elif not isinstance(old[field], list):
+            return None
+        elif group_by and is_items_ts(new[field]):
+            if len(old[field]) != len(new[field]): return None
+            data[field] = []
+            for i in range(0, len(new[field])):
+                if not isinstance(old[field][i], list) or \
+                    len(old[field][i]) != nold or len(new[field][i]) != nnew:
+                    return None
+                data[field].append(old[field][i][0:cut] + new[field][i])
+        elif group_by:
+            # Items names
+            if old[field] != new[field]: return None
+            data[field] = new[field]
+        else:
+            if len(old[field]) != nold or len(new[field]) != nnew: return None
+            data[field] = old[field][0:cut] + new[field]
+    return data
+
 def GetDates (last_date, days):
     enddate = last_date.replace("'","")
 
@@ -561,6 +813,9 @@ def buildIssueURL(tracker_url, issue_id, backend='bugzilla'):
     return url
 
 def get_median(period_values):
+    if isinstance(period_values, ndarray):
+        if len(period_values) == 0: return float('nan')
+        return median(period_values)
     # No data for this period
     if not period_values:
         return float('nan')
@@ -570,6 +825,9 @@ def get_median(period_values):
 
 
 def get_avg(period_values):
+    if isinstance(period_values, ndarray):
+        if len(period_values) == 0: return float('nan')
+        return average(period_values)
     # No data for this period
     if not period_values:
         return float('nan')
@@ -577,52 +835,101 @@ def get_avg(period_values):
         return period_values
     return average(removeDecimals(period_values))
 
-def medianAndAvgByPeriod(period, dates, values):
-
-    def get_period(period, date):
-        if period == 'month':
-            return date.year * 12 + date.month
+class PeriodMedianAvg(object):
+    """ Median and average of values grouped in consecutive periods
 
-    if len(dates) == 0: return None
-    if not values: return None
+        Values are added one by one, ordered as the dates they come from, so
+        only the values of the current period are kept in memory.
+    """
 
-    if not isinstance(values, list):
-        values = [values]
+    def __init__(self, period):
+        self.period = period
+        self.current_period = None
+        self.period_values = []
+        self.result = {period  : [],
+                       'size' : [],
+                       'median' : [],
+                       'avg'    : []}
+
+    def _get_period(self, date):
+        if self.period == 'month':
+            return date.year * 12 + date.month
 
-    if len(dates) != len(values): return None
+    def _close_period(self):
+        self.result[self.period].append(self.current_period)
+        self.result['size'].append(len(self.period_values))
+        self.result['median'].append(get_median(self.period_values))
+        self.result['avg'].append(get_avg(self.period_values))
 
+    def add(self, date, value):
+        date_period = self._get_period(date)
+        # Change of period
+        if self.period_values and date_period != self.current_period:
+            self._close_period()
+            self.period_values = []
+        self.current_period = date_period
+        self.period_values.append(value)
+
+    def get_result(self):
+        """ Return the values for all periods or None if no values were added """
+        if not self.period_values: return None
+        # End of the list
+        self._close_period()
+        self.period_values = []
+        return self.result
+
+def medianAndAvgByPeriodStream(period, rows):
+    """ medianAndAvgByPeriod for an iterable of (date, value) pairs """
+    median_avg = PeriodMedianAvg(period)
+    for date, value in rows:
+        median_avg.add(date, value)
+    return median_avg.get_result()
+
+def medianAndAvgByPeriodArrays(period, dates, values):
+    """ medianAndAvgByPeriod for NumPy arrays of datetime64 dates and values """
     result = {period  : [],
               'size' : [],
               'median' : [],
               'avg'    : []}
 
-    start = dates[0]
-    current_period = get_period(period, start)
-    period_values = []
-    ndates = len(dates)
+    if period == 'month':
+        months = dates.astype('datetime64[M]').astype('int64')
+        periods = (months // 12 + 1970) * 12 + months % 12 + 1
+    else:
+        periods = numpy.zeros(len(dates), dtype='int64')
+    values = values.astype('float64')
+
+    # Limits of the consecutive values in the same period
+    starts = numpy.flatnonzero(periods[1:] != periods[:-1]) + 1
+    starts = numpy.concatenate(([0], starts))
+    ends = numpy.append(starts[1:], len(periods))
+
+    for (start, end) in zip(starts, ends):
+        current_period = None
+        if period == 'month': current_period = int(periods[start])
+        result[period].append(current_period)
+        result['size'].append(int(end - start))
+        result['median'].append(median(values[start:end]))
+        result['avg'].append(average(values[start:end]))
+    return result
+
+def medianAndAvgByPeriod(period, dates, values):
 
-    for i in range(0, ndates):
-        date_period = get_period(period, dates[i])
+    if isinstance(dates, ndarray) or isinstance(values, ndarray):
+        if len(dates) == 0 or len(dates) != len(values): return None
+        return medianAndAvgByPeriodArrays(period,
+                                          numpy.asarray(dates, dtype='datetime64[s]'),
+                                          numpy.asarray(values, dtype='float64'))
 
-        # Change of period
-        if date_period != current_period:
-            result[period].append(current_period)
-            result['size'].append(len(period_values))
-            result['median'].append(get_median(period_values))
-            result['avg'].append(get_avg(period_values))
+    if len(dates) == 0: return None
+    if not values: return None
 
-            current_period = date_period
-            period_values = []
+    if not isinstance(values, list):
+        values = [values]
 
-        period_values.append(values[i])
+    if len(dates) != len(values): return None
 
-        # End of the list
-        if i == ndates - 1:
-            result[period].append(current_period)
-            result['size'].append(len(period_values))
-            result['median'].append(get_median(period_values))
-            result['avg'].append(get_avg(period_values))                        # Accumulated values
-    return result
+    return medianAndAvgByPeriodStream(period, zip(dates, values))
 
 def check_array_value(data):
         if not isinstance(data, list): data = [data]
@@ -649,14 +956,17 @@ def fill_items(items, data, id_field, evol = False,
         logging.info("[fill_items] " + id_field + " not found in " + ",".join(data))
         return data
     fields.remove(id_field)
+    data = check_array_values(data)
 
     if not isinstance(items, list):
         items_ids = [items]
     else:
         items_ids = items
 
+    data_ids = ItemsIndex(data[id_field])
     for id in items_ids:
-        if id not in data[id_field]:
+        if id not in data_ids:
+            data_ids.append(id)
             data[id_field].append(id)
             for field in fields:
                 if field in ts_fields: continue
@@ -686,10 +996,11 @@ def order_items(items, data, id_field, evol = False, period = None):
                 fields.remove(evol_field)
                 data_ordered[evol_field] = data[evol_field]
 
+    data_ids = ItemsIndex(data[id_field])
     for id in items:
         data_ordered[id_field].append(id)
         try:
-            pos = data[id_field].index(id)
+            pos = data_ids.index(id)
         except:
             print items
             print data[id_field]
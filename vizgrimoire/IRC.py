@@ -24,6 +24,7 @@
 import logging, os
 
 from vizgrimoire.GrimoireSQL import GetSQLGlobal, GetSQLPeriod, ExecuteQuery, BuildQuery
+from vizgrimoire.GrimoireSQL import GetSQLPeople, GetSQLPeopleFilter, ExecutePeopleQuery
 from vizgrimoire.GrimoireUtils import GetPercentageDiff, GetDates, getPeriod, createJSON, completePeriodIds
 from vizgrimoire.data_source import DataSource
 from vizgrimoire.filter import Filter
@@ -60,9 +61,10 @@ class IRC(DataSource):
 
     @staticmethod
     def create_evolutionary_report (period, startdate, enddate, destdir, identities_db, filter_ = None):
-        data =  IRC.get_evolutionary_data (period, startdate, enddate, identities_db, filter_)
         filename = IRC().get_evolutionary_filename()
-        createJSON (data, os.path.join(destdir, filename))
+        fn = os.path.join(destdir, filename)
+        data = DataSource.get_evolutionary_data_incremental(IRC, period, startdate, enddate, identities_db, filter_, fn)
+        createJSON (data, fn)
 
     @staticmethod
     def get_agg_data (period, startdate, enddate, identities_db, filter_ = None):
@@ -162,9 +164,9 @@ class IRC(DataSource):
             fn = os.path.join(destdir, filter_.get_static_filename_all(IRC()))
             createJSON(agg_all, fn)
 
-            evol_all = IRC.get_evolutionary_data(period, startdate, enddate,
-                                                 identities_db, filter_all)
             fn = os.path.join(destdir, filter_.get_evolutionary_filename_all(IRC()))
+            evol_all = DataSource.get_evolutionary_data_incremental(IRC, period, startdate, enddate,
+                                                                    identities_db, filter_all, fn)
             createJSON(evol_all, fn)
         else:
             logging.error(IRC.get_name()+ " " + filter_name +" does not support yet group by items sql queries")
@@ -191,6 +193,19 @@ class IRC(DataSource):
     def get_person_agg(uuid, startdate, enddate, identities_db, type_analysis):
         return GetStaticPeopleIRC(uuid, startdate, enddate)
 
+    @staticmethod
+    def get_people_evol(uuids, period, startdate, enddate, identities_db, type_analysis):
+        q = GetQueryPeopleIRC(uuids, period, startdate, enddate, True)
+        evol = ExecutePeopleQuery(q, uuids, True)
+        for uuid in evol:
+            evol[uuid] = completePeriodIds(evol[uuid], period, startdate, enddate)
+        return evol
+
+    @staticmethod
+    def get_people_agg(uuids, startdate, enddate, identities_db, type_analysis):
+        q = GetQueryPeopleIRC(uuids, None, startdate, enddate, False)
+        return ExecutePeopleQuery(q, uuids, False)
+
     @staticmethod
     def create_r_reports(vizr, enddate, destdir):
         pass
@@ -351,20 +366,18 @@ def GetListPeopleIRC (startdate, enddate) :
     return(ExecuteQuery(q))
 
 def GetQueryPeopleIRC (developer_id, period, startdate, enddate, evol):
+    # developer_id can be a list of uuids: activity grouped by uuid
     fields = "COUNT(irclog.id) AS sent"
     tables = GetTablesOwnUniqueIdsIRC()
-    filters = GetFiltersOwnUniqueIdsIRC() + " AND pup.uuid = '" + str(developer_id) + "'"
+    filters = GetFiltersOwnUniqueIdsIRC() + " AND " + GetSQLPeopleFilter(developer_id)
     filters += " AND irclog.type='COMMENT'"
 
-    if (evol) :
-        q = GetSQLPeriod(period,'date', fields, tables, filters,
-                startdate, enddate)
-    else:
+    if not evol:
         fields = fields + \
                 ",DATE_FORMAT (min(date),'%Y-%m-%d') as first_date,"+\
                 " DATE_FORMAT (max(date),'%Y-%m-%d') as last_date"
-        q = GetSQLGlobal('date', fields, tables, filters,
-                startdate, enddate)
+    q = GetSQLPeople(developer_id, period, 'date', fields, tables, filters,
+                     startdate, enddate, evol)
     return (q)
 
 def GetEvolPeopleIRC (developer_id, period, startdate, enddate) :
@@ -27,6 +27,7 @@
 import logging, os, re
 
 from vizgrimoire.GrimoireSQL import GetSQLGlobal, GetSQLPeriod
+from vizgrimoire.GrimoireSQL import GetSQLPeople, GetSQLPeopleFilter, ExecutePeopleQuery
 from vizgrimoire.GrimoireSQL import ExecuteQuery, BuildQuery
 from vizgrimoire.GrimoireUtils import GetPercentageDiff, GetDates, completePeriodIds, getPeriod, check_array_value
 from vizgrimoire.GrimoireUtils import createJSON
@@ -93,9 +94,10 @@ class ITS(DataSource):
 
     @classmethod
     def create_evolutionary_report (cls, period, startdate, enddate, destdir, i_db, filter_ = None):
-        data =  cls.get_evolutionary_data (period, startdate, enddate, i_db, filter_)
         filename = cls().get_evolutionary_filename()
-        createJSON (data, os.path.join(destdir, filename))
+        fn = os.path.join(destdir, filename)
+        data = DataSource.get_evolutionary_data_incremental(cls, period, startdate, enddate, i_db, filter_, fn)
+        createJSON (data, fn)
 
     @classmethod
     def get_agg_data (cls, period, startdate, enddate, identities_db, filter_ = None):
@@ -259,29 +261,16 @@ class ITS(DataSource):
         else:
             items_list = items
 
-        for item in items :
-            item_name = "'"+ item+ "'"
-            logging.info (item_name)
-            filter_item = Filter(filter_name, item)
-
-            evol_data = cls.get_evolutionary_data(period, startdate, enddate, identities_db, filter_item)
-            fn = os.path.join(destdir, filter_item.get_evolutionary_filename(cls()))
-            createJSON(evol_data, fn)
-
-            agg = cls.get_agg_data(period, startdate, enddate, identities_db, filter_item)
-            fn = os.path.join(destdir, filter_item.get_static_filename(cls()))
-            createJSON(agg, fn)
+        items_agg = cls.map_filter_items("create_filter_item_report", filter_name, items,
+                                         period, startdate, enddate, destdir, npeople,
+                                         identities_db)
 
+        for (item, agg) in zip(items, items_agg):
             if filter_name in ["domain", "company", "repository"]:
                 items_list['name'].append(item.replace('/', '_'))
                 items_list['closed_365'].append(agg['closed_365'])
                 items_list['closers_365'].append(agg['closers_365'])
 
-            if filter_name in ["company","domain","repository"]:
-                top = cls.get_top_data(startdate, enddate, identities_db, filter_item, npeople)
-                fn = os.path.join(destdir, filter_item.get_top_filename(cls()))
-                createJSON(top, fn)
-
         fn = os.path.join(destdir, filter_.get_filename(cls()))
         createJSON(items_list, fn)
 
@@ -297,6 +286,26 @@ class ITS(DataSource):
             # Perform ages study, if it is specified in Report
             cls.ages_study_com (items, period, startdate, enddate, destdir)
 
+    @classmethod
+    def create_filter_item_report(cls, filter_item, period, startdate, enddate, destdir,
+                                  npeople, identities_db):
+        """ Evolutionary, static and top JSON of a filter item. Returns the static data """
+        logging.info ("'"+ filter_item.get_item() + "'")
+        filter_name = filter_item.get_name()
+
+        evol_data = cls.get_evolutionary_data(period, startdate, enddate, identities_db, filter_item)
+        fn = os.path.join(destdir, filter_item.get_evolutionary_filename(cls()))
+        createJSON(evol_data, fn)
+
+        agg = cls.get_agg_data(period, startdate, enddate, identities_db, filter_item)
+        fn = os.path.join(destdir, filter_item.get_static_filename(cls()))
+        createJSON(agg, fn)
+
+        if filter_name in ["company","domain","repository"]:
+            top = cls.get_top_data(startdate, enddate, identities_db, filter_item, npeople)
+            fn = os.path.join(destdir, filter_item.get_top_filename(cls()))
+            createJSON(top, fn)
+        return agg
 
     @staticmethod
     def _check_report_all_data(data, filter_, startdate, enddate, idb,
@@ -321,9 +330,9 @@ class ITS(DataSource):
             createJSON(agg_all, fn)
             ITS.convert_all_to_single(agg_all, filter_, destdir, False, period)
 
-            evol_all = cls.get_evolutionary_data(period, startdate, enddate,
-                                                 identities_db, filter_all)
             fn = os.path.join(destdir, filter_.get_evolutionary_filename_all(cls()))
+            evol_all = DataSource.get_evolutionary_data_incremental(cls, period, startdate, enddate,
+                                                                    identities_db, filter_all, fn)
             createJSON(evol_all, fn)
             ITS.convert_all_to_single(evol_all, filter_, destdir, True, period)
 
@@ -369,6 +378,21 @@ class ITS(DataSource):
         closed_condition =  cls._get_closed_condition()
         return GetPeopleStaticITS(uuid, startdate, enddate, closed_condition)
 
+    @classmethod
+    def get_people_evol(cls, uuids, period, startdate, enddate, identities_db, type_analysis):
+        closed_condition =  cls._get_closed_condition()
+        q = GetPeopleQueryITS(uuids, period, startdate, enddate, True, closed_condition)
+        evol = ExecutePeopleQuery(q, uuids, True)
+        for uuid in evol:
+            evol[uuid] = completePeriodIds(evol[uuid], period, startdate, enddate)
+        return evol
+
+    @classmethod
+    def get_people_agg(cls, uuids, startdate, enddate, identities_db, type_analysis):
+        closed_condition =  cls._get_closed_condition()
+        q = GetPeopleQueryITS(uuids, None, startdate, enddate, False, closed_condition)
+        return ExecutePeopleQuery(q, uuids, False)
+
     @classmethod
     def create_r_reports(cls, vizr, enddate, destdir):
         backend = cls._get_backend().its_type
@@ -578,19 +602,17 @@ def GetPeopleListITS (startdate, enddate) :
 
 
 def GetPeopleQueryITS (developer_id, period, startdate, enddate, evol,  closed_condition) :
+    # developer_id can be a list of uuids: activity grouped by uuid
     fields = " COUNT(distinct(c.issue_id)) AS closed"
     tables = GetTablesOwnUniqueIdsITS()
-    filters = GetFiltersOwnUniqueIdsITS() + " AND pup.uuid = '"+ str(developer_id)+"'"
+    filters = GetFiltersOwnUniqueIdsITS() + " AND " + GetSQLPeopleFilter(developer_id)
     filters += " AND "+ closed_condition
 
-    if (evol) :
-        q = GetSQLPeriod(period,'changed_on', fields, tables, filters,
-                            startdate, enddate)
-    else :
+    if not evol:
         fields += ",DATE_FORMAT (min(changed_on),'%Y-%m-%d') as first_date, "+\
                   "DATE_FORMAT (max(changed_on),'%Y-%m-%d') as last_date"
-        q = GetSQLGlobal('changed_on', fields, tables, filters,
-                            startdate, enddate)
+    q = GetSQLPeople(developer_id, period, 'changed_on', fields, tables, filters,
+                     startdate, enddate, evol)
 
     return (q)
 
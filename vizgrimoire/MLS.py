@@ -30,6 +30,7 @@ import sys
 import datetime
 
 from vizgrimoire.GrimoireSQL import GetSQLGlobal, GetSQLPeriod
+from vizgrimoire.GrimoireSQL import GetSQLPeople, GetSQLPeopleFilter, ExecutePeopleQuery
 from vizgrimoire.GrimoireSQL import ExecuteQuery, BuildQuery
 from vizgrimoire.GrimoireUtils import GetPercentageDiff, GetDates, completePeriodIds, getPeriod, createJSON, get_subprojects
 from vizgrimoire.metrics.metrics_filter import MetricFilters
@@ -68,9 +69,10 @@ class MLS(DataSource):
 
     @staticmethod
     def create_evolutionary_report (period, startdate, enddate, destdir, i_db, type_analysis = None):
-        data =  MLS.get_evolutionary_data (period, startdate, enddate, i_db, type_analysis)
         filename = MLS().get_evolutionary_filename()
-        createJSON (data, os.path.join(destdir, filename))
+        fn = os.path.join(destdir, filename)
+        data = DataSource.get_evolutionary_data_incremental(MLS, period, startdate, enddate, i_db, type_analysis, fn)
+        createJSON (data, fn)
 
     @staticmethod
     def get_agg_data (period, startdate, enddate, identities_db, filter_ = None):
@@ -233,29 +235,17 @@ class MLS(DataSource):
         else:
             items_list = items
 
-        for item in items :
-            item = item.replace("'", "\\'")
-            item_name = "'"+ item+ "'"
-            logging.info (item_name)
-            filter_item = Filter(filter_.get_name(), item)
-
-            evol_data = MLS.get_evolutionary_data(period, startdate, enddate, 
-                                                  identities_db, filter_item)
-            fn = os.path.join(destdir, filter_item.get_evolutionary_filename(MLS()))
-            createJSON(evol_data, fn)
-
-            agg = MLS.get_agg_data(period, startdate, enddate, identities_db, filter_item)
-            fn = os.path.join(destdir, filter_item.get_static_filename(MLS()))
-            createJSON(agg, fn)
+        items_escaped = [item.replace("'", "\\'") for item in items]
+        items_agg = MLS.map_filter_items("create_filter_item_report", filter_name, items_escaped,
+                                         period, startdate, enddate, destdir, npeople,
+                                         identities_db)
 
+        for (item, agg) in zip(items_escaped, items_agg):
             if filter_name in ("domain", "company", "repository"):
                 items_list['name'].append(item.replace('/', '_').replace("<","__").replace(">","___"))
                 items_list['sent_365'].append(agg['sent_365'])
                 items_list['senders_365'].append(agg['senders_365'])
 
-            top_senders = MLS.get_top_data(startdate, enddate, identities_db, filter_item, npeople, False)
-            createJSON(top_senders, destdir+"/"+filter_item.get_top_filename(MLS()))
-
         fn = os.path.join(destdir, filter_.get_filename(MLS()))
         createJSON(items_list, fn)
 
@@ -271,6 +261,25 @@ class MLS(DataSource):
             # Perform ages study, if it is specified in Report
             MLS.ages_study_com (items, period, startdate, enddate, destdir)
 
+    @staticmethod
+    def create_filter_item_report(filter_item, period, startdate, enddate, destdir,
+                                  npeople, identities_db):
+        """ Evolutionary, static and top JSON of a filter item. Returns the static data """
+        logging.info ("'"+ filter_item.get_item() + "'")
+
+        evol_data = MLS.get_evolutionary_data(period, startdate, enddate,
+                                              identities_db, filter_item)
+        fn = os.path.join(destdir, filter_item.get_evolutionary_filename(MLS()))
+        createJSON(evol_data, fn)
+
+        agg = MLS.get_agg_data(period, startdate, enddate, identities_db, filter_item)
+        fn = os.path.join(destdir, filter_item.get_static_filename(MLS()))
+        createJSON(agg, fn)
+
+        top_senders = MLS.get_top_data(startdate, enddate, identities_db, filter_item, npeople, False)
+        createJSON(top_senders, destdir+"/"+filter_item.get_top_filename(MLS()))
+        return agg
+
     @staticmethod
     def _check_report_all_data(data, filter_, startdate, enddate, idb,
                                evol = False, period = None):
@@ -288,9 +297,9 @@ class MLS(DataSource):
             createJSON(agg_all, fn)
             MLS.convert_all_to_single(agg_all, filter_, destdir, False, period)
 
-            evol_all = MLS.get_evolutionary_data(period, startdate, enddate,
-                                                 identities_db, filter_all)
             fn = os.path.join(destdir, filter_.get_evolutionary_filename_all(MLS()))
+            evol_all = DataSource.get_evolutionary_data_incremental(MLS, period, startdate, enddate,
+                                                                    identities_db, filter_all, fn)
             createJSON(evol_all, fn)
             MLS.convert_all_to_single(evol_all, filter_, destdir, True, period)
 
@@ -323,6 +332,19 @@ class MLS(DataSource):
     def get_person_agg(uuid, startdate, enddate, identities_db, type_analysis):
         return GetStaticPeopleMLS(uuid, startdate, enddate)
 
+    @staticmethod
+    def get_people_evol(uuids, period, startdate, enddate, identities_db, type_analysis):
+        q = GetQueryPeopleMLS(uuids, period, startdate, enddate, True)
+        evol = ExecutePeopleQuery(q, uuids, True)
+        for uuid in evol:
+            evol[uuid] = completePeriodIds(evol[uuid], period, startdate, enddate)
+        return evol
+
+    @staticmethod
+    def get_people_agg(uuids, startdate, enddate, identities_db, type_analysis):
+        q = GetQueryPeopleMLS(uuids, None, startdate, enddate, False)
+        return ExecutePeopleQuery(q, uuids, False)
+
     @staticmethod
     def create_r_reports(vizr, enddate, destdir):
         unique_ids = True
@@ -585,19 +607,17 @@ def GetListPeopleMLS (startdate, enddate) :
     return (data)
 
 def GetQueryPeopleMLS (developer_id, period, startdate, enddate, evol) :
+    # developer_id can be a list of uuids: activity grouped by uuid
     fields = "COUNT(m.message_ID) AS sent"
     tables = GetTablesOwnUniqueIdsMLS()
-    filters = GetFiltersOwnUniqueIdsMLS() + "AND pup.uuid = '" + str(developer_id) + "'"
+    filters = GetFiltersOwnUniqueIdsMLS() + "AND " + GetSQLPeopleFilter(developer_id)
 
-    if (evol) :
-        q = GetSQLPeriod(period,'first_date', fields, tables, filters,
-                startdate, enddate)
-    else:
+    if not evol:
         fields = fields +\
                 ",DATE_FORMAT (min(first_date),'%Y-%m-%d') as first_date, "+\
                 "DATE_FORMAT (max(first_date),'%Y-%m-%d') as last_date"
-        q = GetSQLGlobal('first_date', fields, tables, filters,
-                startdate, enddate)
+    q = GetSQLPeople(developer_id, period, 'first_date', fields, tables, filters,
+                     startdate, enddate, evol)
     return (q)
 
 
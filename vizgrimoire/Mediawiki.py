@@ -24,6 +24,7 @@ import logging, os
 from filter import Filter
 from vizgrimoire.GrimoireSQL import GetSQLGlobal, GetSQLPeriod 
 from vizgrimoire.GrimoireSQL import ExecuteQuery, BuildQuery
+from vizgrimoire.GrimoireSQL import GetSQLPeople, GetSQLPeopleFilter, ExecutePeopleQuery
 from vizgrimoire.GrimoireUtils import GetPercentageDiff, GetDates, completePeriodIds, createJSON
 from vizgrimoire.metrics.metrics_filter import MetricFilters
 
@@ -72,9 +73,10 @@ class Mediawiki(DataSource):
 
     @staticmethod
     def create_evolutionary_report (period, startdate, enddate, destdir, i_db, type_analysis = None):
-        data =  Mediawiki.get_evolutionary_data (period, startdate, enddate, i_db, type_analysis)
         filename = Mediawiki().get_evolutionary_filename()
-        createJSON (data, os.path.join(destdir, filename))
+        fn = os.path.join(destdir, filename)
+        data = DataSource.get_evolutionary_data_incremental(Mediawiki, period, startdate, enddate, i_db, type_analysis, fn)
+        createJSON (data, fn)
 
     @staticmethod
     def get_agg_data (period, startdate, enddate, identities_db, filter_ = None):
@@ -157,9 +159,9 @@ class Mediawiki(DataSource):
             fn = os.path.join(destdir, filter_.get_static_filename_all(Mediawiki()))
             createJSON(agg_all, fn)
 
-            evol_all = Mediawiki.get_evolutionary_data(period, startdate, enddate,
-                                                       identities_db, filter_all)
             fn = os.path.join(destdir, filter_.get_evolutionary_filename_all(Mediawiki()))
+            evol_all = DataSource.get_evolutionary_data_incremental(Mediawiki, period, startdate, enddate,
+                                                                    identities_db, filter_all, fn)
             createJSON(evol_all, fn)
         else:
             logging.error(Mediawiki.get_name()+ " " + filter_name +" does not support yet group by items sql queries")
@@ -186,6 +188,19 @@ class Mediawiki(DataSource):
     def get_person_agg(uuid, startdate, enddate, identities_db, type_analysis):
         return GetStaticPeopleMediaWiki(uuid, startdate, enddate)
 
+    @staticmethod
+    def get_people_evol(uuids, period, startdate, enddate, identities_db, type_analysis):
+        q = GetQueryPeopleMediaWiki(uuids, period, startdate, enddate, True)
+        evol = ExecutePeopleQuery(q, uuids, True)
+        for uuid in evol:
+            evol[uuid] = completePeriodIds(evol[uuid], period, startdate, enddate)
+        return evol
+
+    @staticmethod
+    def get_people_agg(uuids, startdate, enddate, identities_db, type_analysis):
+        q = GetQueryPeopleMediaWiki(uuids, None, startdate, enddate, False)
+        return ExecutePeopleQuery(q, uuids, False)
+
     @staticmethod
     def create_r_reports(vizr, enddate, destdir):
         pass
@@ -233,18 +248,16 @@ def GetListPeopleMediaWiki (startdate, enddate) :
 
 
 def GetQueryPeopleMediaWiki (developer_id, period, startdate, enddate, evol) :
+    # developer_id can be a list of uuids: activity grouped by uuid
     fields = "COUNT(wiki_pages_revs.id) AS revisions"
     tables = GetTablesOwnUniqueIdsMediaWiki()
-    filters = GetFiltersOwnUniqueIdsMediaWiki() + " AND pup.uuid = '" + str(developer_id) + "'"
+    filters = GetFiltersOwnUniqueIdsMediaWiki() + " AND " + GetSQLPeopleFilter(developer_id)
 
-    if (evol) :
-        q = GetSQLPeriod(period,'date', fields, tables, filters,
-                startdate, enddate)
-    else :
+    if not evol:
         fields += ",DATE_FORMAT (min(date),'%Y-%m-%d') as first_date, "+\
                   "DATE_FORMAT (max(date),'%Y-%m-%d') as last_date"
-        q = GetSQLGlobal('date', fields, tables, filters,
-                startdate, enddate)
+    q = GetSQLPeople(developer_id, period, 'date', fields, tables, filters,
+                     startdate, enddate, evol)
     return (q)
 
 
@@ -17,30 +17,9 @@
 ## Authors:
 ##   Alvaro del Castillo <acs@bitergia.com>
 
-from vizgrimoire.GrimoireSQL import ExecuteQuery
+from vizgrimoire.identities_cache import get_identities_cache
 
 def GetPersonIdentifiers (identities_db, upeople_id):
     """ Get people, company and country information """
-    res = None
-    q = """
-        SELECT pro.uuid, pro.name, pro.email, cou.name as country,
-               org.name as affiliation
-        FROM %s.profiles pro
-        JOIN %s.enrollments enr ON enr.uuid= pro.uuid
-        JOIN %s.organizations org ON org.id = enr.organization_id
-        LEFT JOIN %s.countries cou ON cou.code = pro.country_code
-        WHERE pro.uuid ='%s'
-        """ % (identities_db, identities_db, identities_db, identities_db,
-               upeople_id)
-    try:
-        res = ExecuteQuery(q)
-    except:
-        # No organizations. Just people data and country data.
-        q = """
-            SELECT pro.uuid, pro.name, pro.email, cou.name as country
-            FROM %s.profiles pro
-            LEFT JOIN %s.countries cou ON cou.code = pro.country_code
-            WHERE pro.uuid ='%s'
-            """ % (identities_db, identities_db, upeople_id)
-        res = ExecuteQuery(q)
-    return res
\ No newline at end of file
+    # All identities are loaded once and shared by all the people
+    return get_identities_cache(identities_db).get_person_identifiers(upeople_id)
\ No newline at end of file
@@ -31,6 +31,7 @@ from datetime import datetime, timedelta
 
 from vizgrimoire.GrimoireSQL import GetSQLGlobal, GetSQLPeriod
 from vizgrimoire.GrimoireSQL import ExecuteQuery
+from vizgrimoire.GrimoireSQL import GetSQLPeople, GetSQLPeopleFilter, ExecutePeopleQuery
 from vizgrimoire.GrimoireUtils import GetPercentageDiff, GetDates, completePeriodIds
 from vizgrimoire.GrimoireUtils import checkListArray, removeDecimals
 from vizgrimoire.GrimoireUtils import getPeriod, createJSON, checkFloatArray, medianAndAvgByPeriod, check_array_values
@@ -84,9 +85,10 @@ class Pullpo(DataSource):
 
     @staticmethod
     def create_evolutionary_report (period, startdate, enddate, destdir, i_db, filter_ = None):
-        data =  Pullpo.get_evolutionary_data (period, startdate, enddate, i_db, filter_)
         filename = Pullpo().get_evolutionary_filename()
-        createJSON (data, os.path.join(destdir, filename))
+        fn = os.path.join(destdir, filename)
+        data = DataSource.get_evolutionary_data_incremental(Pullpo, period, startdate, enddate, i_db, filter_, fn)
+        createJSON (data, fn)
 
     @staticmethod
     def get_agg_data (period, startdate, enddate, identities_db, filter_= None):
@@ -250,9 +252,9 @@ class Pullpo(DataSource):
             fn = os.path.join(destdir, filter_.get_static_filename_all(Pullpo()))
             createJSON(agg_all, fn)
 
-            evol_all = Pullpo.get_evolutionary_data(period, startdate, enddate,
-                                                 identities_db, filter_all)
             fn = os.path.join(destdir, filter_.get_evolutionary_filename_all(Pullpo()))
+            evol_all = DataSource.get_evolutionary_data_incremental(Pullpo, period, startdate, enddate,
+                                                                    identities_db, filter_all, fn)
             createJSON(evol_all, fn)
 
             if check:
@@ -308,23 +310,34 @@ class Pullpo(DataSource):
         agg = Pullpo.get_people_query(uuid, startdate, enddate)
         return agg
 
+    @staticmethod
+    def get_people_evol(uuids, period, startdate, enddate, identities_db, type_analysis):
+        evol = Pullpo.get_people_query(uuids, startdate, enddate, True, period)
+        for uuid in evol:
+            evol[uuid] = completePeriodIds(evol[uuid], period, startdate, enddate)
+        return evol
+
+    @staticmethod
+    def get_people_agg(uuids, startdate, enddate, identities_db, type_analysis):
+        return Pullpo.get_people_query(uuids, startdate, enddate)
+
     # TODO: this should be done using people filter metrics
     @staticmethod
     def get_people_query(developer_id, startdate, enddate, evol = False, period = None):
+        """ Data of a person, or {uuid: data} for a list of uuids """
         query_builder = Pullpo.get_query_builder()
         fields ='COUNT(distinct(pr.id)) AS submissions'
         tables = 'pull_requests pr, people_uidentities pup'
         filters = 'pr.user_id = pup.people_id'
-        filters +=" AND pup.uuid='"+str(developer_id)+"'"
-        if (evol) :
-            q = GetSQLPeriod(period,'pr.created_at', fields, tables, filters,
-                    startdate, enddate)
-        else :
+        filters +=" AND "+GetSQLPeopleFilter(developer_id)
+        if not evol:
             fields += ",DATE_FORMAT (min(pr.created_at),'%Y-%m-%d') as first_date, "+\
                       "DATE_FORMAT (max(pr.created_at),'%Y-%m-%d') as last_date"
-            q = GetSQLGlobal('pr.created_at', fields, tables, filters, 
-                             startdate, enddate)
+        q = GetSQLPeople(developer_id, period, 'pr.created_at', fields, tables, filters,
+                         startdate, enddate, evol)
 
+        if isinstance(developer_id, list):
+            return ExecutePeopleQuery(q, developer_id, evol)
         data  = ExecuteQuery(q)
         return (data)
 
@@ -79,9 +79,10 @@ class QAForums(DataSource):
 
     @staticmethod
     def create_evolutionary_report(period, startdate, enddate, destdir, identities_db, filter_ = None):
-        data =  QAForums.get_evolutionary_data(period, startdate, enddate, identities_db, filter_)
         filename = QAForums().get_evolutionary_filename()
-        createJSON(data, os.path.join(destdir, filename))
+        fn = os.path.join(destdir, filename)
+        data = DataSource.get_evolutionary_data_incremental(QAForums, period, startdate, enddate, identities_db, filter_, fn)
+        createJSON(data, fn)
 
     @staticmethod
     def get_agg_data(period, startdate, enddate, identities_db, filter_=None):
@@ -208,9 +209,9 @@ class QAForums(DataSource):
             fn = os.path.join(destdir, filter_.get_static_filename_all(QAForums()))
             createJSON(agg_all, fn)
 
-            evol_all = QAForums.get_evolutionary_data(period, startdate, enddate,
-                                                 identities_db, filter_all)
             fn = os.path.join(destdir, filter_.get_evolutionary_filename_all(QAForums()))
+            evol_all = DataSource.get_evolutionary_data_incremental(QAForums, period, startdate, enddate,
+                                                                    identities_db, filter_all, fn)
             createJSON(evol_all, fn)
         else:
             logging.error(QAForums.get_name()+ " " + filter_name +" does not support yet group by items sql queries")
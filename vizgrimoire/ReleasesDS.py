@@ -21,6 +21,7 @@
 import logging, os
 
 from vizgrimoire.GrimoireSQL import GetSQLGlobal, GetSQLPeriod, ExecuteQuery, BuildQuery
+from vizgrimoire.GrimoireSQL import GetSQLPeople, GetSQLPeopleFilter, ExecutePeopleQuery
 from vizgrimoire.GrimoireUtils import GetPercentageDiff, GetDates, completePeriodIds, createJSON
 
 from vizgrimoire.data_source import DataSource
@@ -65,9 +66,10 @@ class ReleasesDS(DataSource):
  
     @staticmethod
     def create_evolutionary_report (period, startdate, enddate, destdir, i_db, type_analysis = None):
-        data =  ReleasesDS.get_evolutionary_data (period, startdate, enddate, i_db, type_analysis)
         filename = ReleasesDS().get_evolutionary_filename()
-        createJSON (data, os.path.join(destdir, filename))
+        fn = os.path.join(destdir, filename)
+        data = DataSource.get_evolutionary_data_incremental(ReleasesDS, period, startdate, enddate, i_db, type_analysis, fn)
+        createJSON (data, fn)
 
     @staticmethod
     def get_agg_data (period, startdate, enddate, i_db, filter_ = None):
@@ -149,8 +151,9 @@ class ReleasesDS(DataSource):
     def _get_people_sql (uuid, period, startdate, enddate, evol):
         fields = "COUNT(r.id) AS releases"
         tables = "users u, releases r, people_uidentities pup"
-        filters = "pup.people_id = u.id AND r.author_id = u.id AND pup.uuid = '" + str(uuid) + "'"
-        q = BuildQuery (period, startdate, enddate, 'r.created_on', fields, tables, filters, evol)
+        filters = "pup.people_id = u.id AND r.author_id = u.id AND " + GetSQLPeopleFilter(uuid)
+        q = GetSQLPeople(uuid, period, 'r.created_on', fields, tables, filters,
+                         startdate, enddate, evol)
         return (q)
 
     @staticmethod
@@ -163,6 +166,19 @@ class ReleasesDS(DataSource):
         q = ReleasesDS._get_people_sql (uuid, None, startdate, enddate, False)
         return ExecuteQuery(q)
 
+    @staticmethod
+    def get_people_evol(uuids, period, startdate, enddate, identities_db, type_analysis):
+        q = ReleasesDS._get_people_sql (uuids, period, startdate, enddate, True)
+        evol = ExecutePeopleQuery(q, uuids, True)
+        for uuid in evol:
+            evol[uuid] = completePeriodIds(evol[uuid], period, startdate, enddate)
+        return evol
+
+    @staticmethod
+    def get_people_agg(uuids, startdate, enddate, identities_db, type_analysis):
+        q = ReleasesDS._get_people_sql (uuids, None, startdate, enddate, False)
+        return ExecutePeopleQuery(q, uuids, False)
+
     @staticmethod
     def create_r_reports(vizr, enddate, destdir):
         pass
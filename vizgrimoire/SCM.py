@@ -26,6 +26,7 @@
 import os, logging
 
 from vizgrimoire.GrimoireSQL import GetSQLGlobal, GetSQLPeriod
+from vizgrimoire.GrimoireSQL import GetSQLPeople, GetSQLPeopleFilter, ExecutePeopleQuery
 # TODO integrate: from GrimoireSQL import  GetSQLReportFrom 
 from vizgrimoire.GrimoireSQL import ExecuteQuery, BuildQuery
 from vizgrimoire.GrimoireUtils import GetPercentageDiff, GetDates, completePeriodIds
@@ -63,9 +64,10 @@ class SCM(DataSource):
 
     @staticmethod
     def create_evolutionary_report (period, startdate, enddate, destdir, i_db, filter_ = None):
-        data =  SCM.get_evolutionary_data (period, startdate, enddate, i_db, filter_)
         filename = SCM().get_evolutionary_filename()
-        createJSON (data, os.path.join(destdir, filename))
+        fn = os.path.join(destdir, filename)
+        data = DataSource.get_evolutionary_data_incremental(SCM, period, startdate, enddate, i_db, filter_, fn)
+        createJSON (data, fn)
 
     @staticmethod
     def get_agg_data (period, startdate, enddate, identities_db, filter_= None):
@@ -243,15 +245,17 @@ class SCM(DataSource):
         fn = os.path.join(destdir, filter_.get_filename(SCM()))
         createJSON(items, fn)
 
-        for item in items :
-            item_name = "'"+ item+ "'"
-            logging.info (item_name)
-            filter_item = Filter(filter_name, item)
+        if filter_name in ("company","project","repository"):
+            SCM.map_filter_items("create_filter_item_report_top", filter_name, items,
+                                 startdate, enddate, destdir, npeople, identities_db)
 
-            if filter_name in ("company","project","repository"):
-                top_authors = SCM.get_top_data(startdate, enddate, identities_db, filter_item, npeople)
-                fn = os.path.join(destdir, filter_item.get_top_filename(SCM()))
-                createJSON(top_authors, fn)
+    @staticmethod
+    def create_filter_item_report_top(filter_item, startdate, enddate, destdir, npeople, identities_db):
+        """ Top JSON of a filter item """
+        logging.info ("'"+ filter_item.get_item() + "'")
+        top_authors = SCM.get_top_data(startdate, enddate, identities_db, filter_item, npeople)
+        fn = os.path.join(destdir, filter_item.get_top_filename(SCM()))
+        createJSON(top_authors, fn)
 
     @staticmethod
     def create_filter_report(filter_, period, startdate, enddate, destdir, npeople, identities_db):
@@ -275,19 +279,10 @@ class SCM(DataSource):
         else:
             items_list = items
 
-        for item in items :
-            item_name = "'"+ item+ "'"
-            logging.info (item_name)
-            filter_item = Filter(filter_name, item)
-
-            evol_data = SCM.get_evolutionary_data(period, startdate, enddate, identities_db, filter_item)
-            fn = os.path.join(destdir, filter_item.get_evolutionary_filename(SCM()))
-            createJSON(evol_data, fn)
-
-            agg = SCM.get_agg_data(period, startdate, enddate, identities_db, filter_item)
-            fn = os.path.join(destdir, filter_item.get_static_filename(SCM()))
-            createJSON(agg, fn)
+        items_agg = SCM.map_filter_items("create_filter_item_report", filter_name, items,
+                                         period, startdate, enddate, destdir, identities_db)
 
+        for (item, agg) in zip(items, items_agg):
             if filter_name in ("domain", "company", "repository"):
                 items_list['name'].append(item.replace('/', '_'))
                 items_list['commits_365'].append(agg['commits_365'])
@@ -305,6 +300,19 @@ class SCM(DataSource):
             # Perform ages study, if it is specified in Report
             SCM.ages_study_com (items, period, startdate, enddate, destdir)
 
+    @staticmethod
+    def create_filter_item_report(filter_item, period, startdate, enddate, destdir, identities_db):
+        """ Evolutionary and static JSON of a filter item. Returns the static data """
+        logging.info ("'"+ filter_item.get_item() + "'")
+
+        evol_data = SCM.get_evolutionary_data(period, startdate, enddate, identities_db, filter_item)
+        fn = os.path.join(destdir, filter_item.get_evolutionary_filename(SCM()))
+        createJSON(evol_data, fn)
+
+        agg = SCM.get_agg_data(period, startdate, enddate, identities_db, filter_item)
+        fn = os.path.join(destdir, filter_item.get_static_filename(SCM()))
+        createJSON(agg, fn)
+        return agg
 
     @staticmethod
     def _check_report_all_data(data, filter_, startdate, enddate, idb,
@@ -366,9 +374,9 @@ class SCM(DataSource):
             createJSON(agg_all, fn)
             SCM.convert_all_to_single(agg_all, filter_, destdir, False, period)
 
-            evol_all = SCM.get_evolutionary_data(period, startdate, enddate,
-                                                 identities_db, filter_all)
             fn = os.path.join(destdir, filter_.get_evolutionary_filename_all(SCM()))
+            evol_all = DataSource.get_evolutionary_data_incremental(SCM, period, startdate, enddate,
+                                                                    identities_db, filter_all, fn)
             createJSON(evol_all, fn)
             SCM.convert_all_to_single(evol_all, filter_, destdir, True, period)
 
@@ -412,6 +420,19 @@ class SCM(DataSource):
         agg = GetStaticPeopleSCM(uuid,  startdate, enddate)
         return agg
 
+    @staticmethod
+    def get_people_evol(uuids, period, startdate, enddate, identities_db, type_analysis):
+        q = GetPeopleQuerySCM(uuids, period, startdate, enddate, True)
+        evol = ExecutePeopleQuery(q, uuids, True)
+        for uuid in evol:
+            evol[uuid] = completePeriodIds(evol[uuid], period, startdate, enddate)
+        return evol
+
+    @staticmethod
+    def get_people_agg(uuids, startdate, enddate, identities_db, type_analysis):
+        q = GetPeopleQuerySCM(uuids, None, startdate, enddate, False)
+        return ExecutePeopleQuery(q, uuids, False)
+
     # Studies implemented in R
     @staticmethod
     def create_r_reports(vizr, enddate, destdir):
@@ -553,18 +574,16 @@ def GetPeopleListSCM (startdate, enddate) :
     return (data)
 
 def GetPeopleQuerySCM (developer_id, period, startdate, enddate, evol) :
+    # developer_id can be a list of uuids: activity grouped by uuid
     fields ='COUNT(distinct(s.id)) AS commits'
     tables = GetTablesOwnUniqueIdsSCM()
     filters = GetFiltersOwnUniqueIdsSCM()
-    filters +=" AND pup.uuid='"+str(developer_id)+"'"
-    if (evol) :
-        q = GetSQLPeriod(period,'s.author_date', fields, tables, filters,
-                startdate, enddate)
-    else :
+    filters +=" AND "+GetSQLPeopleFilter(developer_id)
+    if not evol:
         fields += ",DATE_FORMAT (min(s.author_date),'%Y-%m-%d') as first_date, "+\
                   "DATE_FORMAT (max(s.author_date),'%Y-%m-%d') as last_date"
-        q = GetSQLGlobal('s.author_date', fields, tables, filters, 
-                startdate, enddate)
+    q = GetSQLPeople(developer_id, period, 's.author_date', fields, tables, filters,
+                     startdate, enddate, evol)
 
     return (q)
 
@@ -31,6 +31,7 @@ import time
 from datetime import datetime, timedelta
 
 from vizgrimoire.GrimoireSQL import GetSQLGlobal, GetSQLPeriod
+from vizgrimoire.GrimoireSQL import GetSQLPeople, GetSQLPeopleFilter, ExecutePeopleQuery
 from vizgrimoire.GrimoireSQL import ExecuteQuery
 from vizgrimoire.GrimoireUtils import GetPercentageDiff, GetDates, completePeriodIds
 from vizgrimoire.GrimoireUtils import checkListArray, removeDecimals
@@ -65,9 +66,10 @@ class SCR(DataSource):
 
     @staticmethod
     def create_evolutionary_report (period, startdate, enddate, destdir, i_db, filter_ = None):
-        data =  SCR.get_evolutionary_data (period, startdate, enddate, i_db, filter_)
         filename = SCR().get_evolutionary_filename()
-        createJSON (data, os.path.join(destdir, filename))
+        fn = os.path.join(destdir, filename)
+        data = DataSource.get_evolutionary_data_incremental(SCR, period, startdate, enddate, i_db, filter_, fn)
+        createJSON (data, fn)
 
     @staticmethod
     def get_agg_data (period, startdate, enddate, identities_db, filter_ = None):
@@ -325,15 +327,17 @@ class SCR(DataSource):
         fn = os.path.join(destdir, filter_.get_filename(SCR()))
         createJSON(items, fn)
 
-        for item in items :
-            item_name = "'"+ item+ "'"
-            logging.info (item_name)
-            filter_item = Filter(filter_name, item)
+        if filter_name in ("company","project","repository"):
+            SCR.map_filter_items("create_filter_item_report_top", filter_name, items,
+                                 startdate, enddate, destdir, npeople, identities_db)
 
-            if filter_name in ("company","project","repository"):
-                top_mergers = SCR.get_top_data(startdate, enddate, identities_db, filter_item, npeople)
-                fn = os.path.join(destdir, filter_item.get_top_filename(SCR()))
-                createJSON(top_mergers, fn)
+    @staticmethod
+    def create_filter_item_report_top(filter_item, startdate, enddate, destdir, npeople, identities_db):
+        """ Top JSON of a filter item """
+        logging.info ("'"+ filter_item.get_item() + "'")
+        top_mergers = SCR.get_top_data(startdate, enddate, identities_db, filter_item, npeople)
+        fn = os.path.join(destdir, filter_item.get_top_filename(SCR()))
+        createJSON(top_mergers, fn)
 
     @staticmethod
     def create_filter_report(filter_, period, startdate, enddate, destdir, npeople, identities_db):
@@ -352,23 +356,13 @@ class SCR(DataSource):
         # Include metrics to sort in javascript.
         items_list = {"name":[],"review_time_days_median":[],"submitted":[]}
 
-        for item in items :
+        items_agg = SCR.map_filter_items("create_filter_item_report", filter_name, items,
+                                         period, startdate, enddate, destdir, identities_db)
+
+        for (item, agg) in zip(items, items_agg):
             item_file = item.replace("/","_")
             items_list["name"].append(item_file)
 
-            logging.info (item)
-            filter_item = Filter(filter_name, item)
-
-            evol = SCR.get_evolutionary_data(period, startdate, enddate,
-                                               identities_db, filter_item)
-            fn = os.path.join(destdir, filter_item.get_evolutionary_filename(SCR()))
-            createJSON(evol, fn)
-
-            # Static
-            agg = SCR.get_agg_data(period, startdate, enddate, identities_db, filter_item)
-            fn = os.path.join(destdir, filter_item.get_static_filename(SCR()))
-            createJSON(agg, fn)
-
             if 'submitted' in agg:
                 items_list["submitted"].append(agg["submitted"])
             else: items_list["submitted"].append("NA")
@@ -381,6 +375,22 @@ class SCR(DataSource):
 
         SCR.create_filter_report_top(filter_, period, startdate, enddate, destdir, npeople, identities_db)
 
+    @staticmethod
+    def create_filter_item_report(filter_item, period, startdate, enddate, destdir, identities_db):
+        """ Evolutionary and static JSON of a filter item. Returns the static data """
+        logging.info (filter_item.get_item())
+
+        evol = SCR.get_evolutionary_data(period, startdate, enddate,
+                                         identities_db, filter_item)
+        fn = os.path.join(destdir, filter_item.get_evolutionary_filename(SCR()))
+        createJSON(evol, fn)
+
+        # Static
+        agg = SCR.get_agg_data(period, startdate, enddate, identities_db, filter_item)
+        fn = os.path.join(destdir, filter_item.get_static_filename(SCR()))
+        createJSON(agg, fn)
+        return agg
+
     @staticmethod
     def _check_report_all_data(data, filter_, startdate, enddate, idb,
                                evol = False, period = None):
@@ -399,9 +409,9 @@ class SCR(DataSource):
             createJSON(agg_all, fn)
             SCR.convert_all_to_single(agg_all, filter_, destdir, False, period)
 
-            evol_all = SCR.get_evolutionary_data(period, startdate, enddate,
-                                                 identities_db, filter_all)
             fn = os.path.join(destdir, filter_.get_evolutionary_filename_all(SCR()))
+            evol_all = DataSource.get_evolutionary_data_incremental(SCR, period, startdate, enddate,
+                                                                    identities_db, filter_all, fn)
             createJSON(evol_all, fn)
             SCR.convert_all_to_single(evol_all, filter_, destdir, True, period)
 
@@ -459,6 +469,19 @@ class SCR(DataSource):
     def get_person_agg(uuid, startdate, enddate, identities_db, type_analysis):
         return GetPeopleStaticSCR(uuid, startdate, enddate)
 
+    @staticmethod
+    def get_people_evol(uuids, period, startdate, enddate, identities_db, type_analysis):
+        q = GetPeopleQuerySCR(uuids, period, startdate, enddate, True)
+        evol = ExecutePeopleQuery(q, uuids, True)
+        for uuid in evol:
+            evol[uuid] = completePeriodIds(evol[uuid], period, startdate, enddate)
+        return evol
+
+    @staticmethod
+    def get_people_agg(uuids, startdate, enddate, identities_db, type_analysis):
+        q = GetPeopleQuerySCR(uuids, None, startdate, enddate, False)
+        return ExecutePeopleQuery(q, uuids, False)
+
     @staticmethod
     def create_r_reports(vizr, enddate, destdir):
         pass
@@ -543,21 +566,19 @@ def GetPeopleQuerySCRChanges (developer_id, period, startdate, enddate, evol):
     return (q)
 
 def GetPeopleQuerySCR (developer_id, period, startdate, enddate, evol):
+    # developer_id can be a list of uuids: activity grouped by uuid
     fields = "COUNT(c.id) AS closed"
     tables = GetTablesOwnUniqueIdsSCR()
-    filters = GetFiltersOwnUniqueIdsSCR()+ " AND pup.uuid = '"+ str(developer_id) + "'"
+    filters = GetFiltersOwnUniqueIdsSCR()+ " AND " + GetSQLPeopleFilter(developer_id)
     # Just closed, not all changes
     filters += "AND (new_value='MERGED' OR new_value='ABANDONED')"
 
-    if (evol):
-        q = GetSQLPeriod(period,'changed_on', fields, tables, filters,
-                startdate, enddate)
-    else:
+    if not evol:
         fields = fields + \
                 ",DATE_FORMAT (min(changed_on),'%Y-%m-%d') as first_date, "+\
                 "  DATE_FORMAT (max(changed_on),'%Y-%m-%d') as last_date"
-        q = GetSQLGlobal('changed_on', fields, tables, filters,
-                startdate, enddate)
+    q = GetSQLPeople(developer_id, period, 'changed_on', fields, tables, filters,
+                     startdate, enddate, evol)
     return (q)
 
 def GetPeopleQuerySCRSubmissions (developer_id, period, startdate, enddate, evol):
@@ -29,6 +29,7 @@ from vizgrimoire.analysis.analyses import Analyses
 from vizgrimoire.metrics.query_builder import DSQuery
 from vizgrimoire.metrics.metrics_filter import MetricFilters
 from vizgrimoire.GrimoireUtils import createJSON
+from vizgrimoire.items_index import ItemsIndex, get_items_values
 import vizgrimoire.GrimoireSQL
 from vizgrimoire.SCM import SCM
 from vizgrimoire.ITS import ITS
@@ -306,12 +307,13 @@ class CompaniesActivity(Analyses):
 
     def add_organizations_data (self, activity, data):
         """ Add organizations data in an already existing complete organizations activity dictionary """
-        new_activity = []
         field = None
 
         # Check all data names are already in activity. If not add it with zero value.
+        activity_names = ItemsIndex(activity['name'])
         for item in data['name']:
-            if item not in activity['name']:
+            if item not in activity_names:
+                activity_names.append(item)
                 activity['name'].append(item)
                 for metric in activity:
                     if metric == "name": continue
@@ -322,13 +324,7 @@ class CompaniesActivity(Analyses):
             if key != "name": 
                 field = key
                 break
-        for company in activity['name']:
-            if company in data['name']:
-                index = data['name'].index(company)
-                value = data[field][index]
-                new_activity.append(value)
-            else:
-                new_activity.append(0)
+        new_activity = get_items_values(activity['name'], data['name'], data[field])
 
         activity[field] = new_activity
         return activity
@@ -93,9 +93,9 @@ class TicketsStates(Analyses):
             current_status[state] = 0
             data[state] = []
 
-        # Request issues log
+        # Request issues log. It is read from the server while processed.
         query = self.__get_sql_issues_states__(backend_type)
-        issues_log = self.db.ExecuteQuery(query)
+        issues_log = self.db.ExecuteQueryStream(query)
 
         periods = list(data['unixtime'][1:])
 
@@ -107,10 +107,10 @@ class TicketsStates(Analyses):
 
         end_period = int(periods.pop(0))
 
-        for i in range(len(issues_log['issue_id'])):
-            issue_id = issues_log['issue_id'][i]
-            issue_state = issues_log['status'][i]
-            issue_date = int(issues_log['udate'][i])
+        for log in issues_log:
+            issue_id = log['issue_id']
+            issue_state = log['status']
+            issue_date = int(log['udate'])
 
             # Fill periods without changes on issues states
             while issue_date >= end_period:
@@ -24,58 +24,88 @@
 
 import vizgrimoire.GrimoireUtils
 import vizgrimoire.GrimoireSQL
-from vizgrimoire.GrimoireSQL import ExecuteQuery
+from vizgrimoire.GrimoireSQL import ExecuteQuery, ExecuteQueryStream
+from vizgrimoire.identities_cache import get_identities_cache
+from vizgrimoire.threads_index import get_threads_index, get_range_date
 
 class Email(object):
     """This class contains the main attributes of an email
     """
 
-    def __init__(self, message_id, i_db):
+    # Fields of the emails, read with the sender of each one
+    query = """
+            select distinct m.message_ID,
+                   m.subject,
+                   m.message_body,
+                   m.first_date,
+                   pup.uuid as initiator_id,
+                   m.mailing_list_url as url
+            from messages m,
+                 messages_people mp,
+                 people_uidentities pup
+            where m.message_ID IN (%s) and
+                  m.message_ID = mp.message_id and
+                  mp.type_of_recipient = 'From' and
+                  mp.email_address = pup.people_id
+            """
+
+    def __init__(self, message_id, i_db, rows = None):
         self.message_id = message_id
         self.i_db = i_db # Identities database
         self.subject = None # Email subject
         self.body = None # Email body
         self.date = None # Email sending date
         self.url = None # Domain of the archive
-        self._buildEmail() # Constructor
+        if rows is None:
+            self._buildEmail() # Constructor
+        else:
+            # Rows already read with load_emails
+            self._set_fields(rows)
+
+    @staticmethod
+    def _get_rows(message_ids):
+        # Rows of the emails query for each message_id
+        rows = dict([(message_id, []) for message_id in message_ids])
+        if len(message_ids) == 0: return rows
+        ids = ",".join(["'" + message_id.replace("'", "''") + "'"
+                        for message_id in message_ids])
+        for row in ExecuteQueryStream(Email.query % (ids)):
+            if row["message_ID"] in rows: rows[row["message_ID"]].append(row)
+        return rows
+
+    @staticmethod
+    def load_emails(message_ids, i_db):
+        # Returns the Email of each message_id reading all of them
+        # with one query
+        rows = Email._get_rows(message_ids)
+        return [Email(message_id, i_db, rows[message_id]) for message_id in message_ids]
 
     def _buildEmail(self):
         # This method retrieves items of information of a given
         # email, specified by its email id.
+        self._set_fields(Email._get_rows([self.message_id])[self.message_id])
 
-        query = """
-                select distinct m.message_ID,
-                       m.subject,
-                       m.message_body,
-                       m.first_date,
-                       pro.name as initiator_name,
-                       u.uuid as initiator_id,
-                       m.mailing_list_url as url
-                from messages m,
-                     messages_people mp,
-                     people_uidentities pup,
-                     %s.uidentities u,
-                     %s.profiles pro
-                where m.message_ID = '%s' and
-                      m.message_ID = mp.message_id and
-                      mp.type_of_recipient = 'From' and
-                      mp.email_address = pup.people_id and
-                      pup.uuid = u.uuid and
-                      pup.uuid = pro.uuid
-                limit 1
-                """  % (self.i_db, self.i_db, self.message_id)
+    def _set_fields(self, rows):
+        # The name of the initiator comes from the identities cache.
         # WARNING: There may appear in some cases repeated emails.
         # This may be because the same email was sent to different
-        # mailing lists. Forcing the query to 1 row, allows to 
-        # avoid this issue till we understand why this behaviour
-        results = ExecuteQuery(query)
-
-        self.subject = results["subject"]
-        self.body = results["message_body"]
-        self.date = results["first_date"]
-        self.initiator_name = results["initiator_name"]
-        self.initiator_id = results["initiator_id"]
-        self.url = results["url"]
+        # mailing lists. Only the first one with a profile is used,
+        # till we understand why this behaviour
+        identities = get_identities_cache(self.i_db)
+        for row in rows:
+            profile = identities.get_profile(row["initiator_id"])
+            if profile is None: continue
+            self.subject = row["subject"]
+            self.body = row["message_body"]
+            self.date = row["first_date"]
+            self.initiator_name = profile[0]
+            self.initiator_id = row["initiator_id"]
+            self.url = row["url"]
+            return
+
+        # Same empty values than the query without rows
+        (self.subject, self.body, self.date) = ([], [], [])
+        (self.initiator_name, self.initiator_id, self.url) = ([], [], [])
 
 
 class Threads(object):
@@ -92,6 +122,12 @@ class Threads(object):
         self.list_is_response_of = [] #list of 'father' messages
         self.threads = {} # General structure, keys = root message_id,
                           # values = list of messages in that thread
+        self.threads_metrics = {} # keys = root message_id, values = dict with
+                                  # length, depth, participants, first_date
+                                  # and last_date of the thread
+        self.children = {} # keys = message_id, values = list of responses
+        self.senders = {} # keys = message_id, values = set of senders uuids
+        self.dates = {} # keys = message_id, values = date of the message
         self.crowded = None # the thread with most people participating
         self.longest = None # the thread with the longest queue of emails
         self.verbose = None # the thread with the most verbose emails.
@@ -99,53 +135,102 @@ class Threads(object):
         self._init_threads()
 
     def _build_threads (self, message_id):
-        # Constructor of threads.
+        # Constructor of threads. Returns the responses to message_id, and
+        # the responses to them, depth first, with the metrics of the thread.
+        # The tree is walked without recursion, so long threads do not
+        # reach the recursion limit.
 
-        sons = []
         messages = []
-        if message_id not in self.list_is_response_of:
-            # this a leaf of the tree!
-            return []
-
-        else:
-            cont = 0
-            for msg in self.list_is_response_of:
-                #Retrieving all of the sons of a given msg
-                if msg == message_id:
-                    sons.append(self.list_message_id[cont])
-                cont = cont + 1
-            for msg in sons:
-                messages.extend([msg])
-                messages.extend(self._build_threads(msg))
-
-
-        return messages
+        depth = 0
+        people = set(self.senders.get(message_id, []))
+        dates = []
+        if message_id in self.dates: dates.append(self.dates[message_id])
+
+        path = [message_id] # messages from the root to the current one
+        in_path = set(path)
+        stack = [(msg, 1) for msg in reversed(self.children.get(message_id, []))]
+        while stack:
+            (msg, level) = stack.pop()
+            while len(path) > level:
+                in_path.discard(path.pop())
+            if msg in in_path:
+                # a message responding to itself in a loop
+                continue
+            messages.append(msg)
+            depth = max(depth, level)
+            people.update(self.senders.get(msg, []))
+            if msg in self.dates: dates.append(self.dates[msg])
+            path.append(msg)
+            in_path.add(msg)
+            for son in reversed(self.children.get(msg, [])):
+                stack.append((son, level + 1))
+
+        metrics = {"length": len(messages) + 1, "depth": depth,
+                   "participants": len(people),
+                   "first_date": None, "last_date": None}
+        if len(dates) > 0:
+            metrics["first_date"] = min(dates)
+            metrics["last_date"] = max(dates)
+        return (messages, metrics)
 
     def _init_threads(self):
         # Returns dictionary of message_id threads. Each key contains a list
         # of emails associated to that thread (not ordered).
 
-        # Retrieving all of the messages. 
+        # With a threads index, threads are read from it
+        index = get_threads_index()
+        initdate = get_range_date(self.initdate)
+        enddate = get_range_date(self.enddate)
+        if index is not None and initdate is not None and enddate is not None:
+            for (root, (thread, metrics)) in index.get_threads(initdate, enddate).items():
+                self.threads[root] = thread
+                self.threads_metrics[root] = metrics
+            return
+
+        # Retrieving all of the messages with their senders in one query
         query = """
-                select DISTINCT message_ID, is_response_of
-                from messages
-                where first_date >= %s and first_date < %s
+                select m.message_ID, m.is_response_of, m.first_date,
+                       pup.uuid as sender_id
+                from messages m
+                left join messages_people mp
+                     on m.message_ID = mp.message_id and
+                        mp.type_of_recipient = 'From'
+                left join people_uidentities pup
+                     on mp.email_address = pup.people_id
+                where m.first_date >= %s and m.first_date < %s
                 """ % (self.initdate, self.enddate)
-        list_messages = ExecuteQuery(query)
-        self.list_message_id = list_messages["message_ID"]
-        self.list_is_response_of = list_messages["is_response_of"]
+        # Messages are read from the server while the lists are built
+        self.list_message_id = []
+        self.list_is_response_of = []
+        self.children = {}
+        self.senders = {}
+        self.dates = {}
+        responses = set([]) # (message_ID, is_response_of) already read
+        for message in ExecuteQueryStream(query):
+            message_id = message["message_ID"]
+            parent = message["is_response_of"]
+            if message["sender_id"] is not None:
+                self.senders.setdefault(message_id, set([])).add(message["sender_id"])
+            date = message["first_date"]
+            if date is not None and (message_id not in self.dates or date < self.dates[message_id]):
+                self.dates[message_id] = date
+            if (message_id, parent) in responses: continue
+            responses.add((message_id, parent))
+            self.list_message_id.append(message_id)
+            self.list_is_response_of.append(parent)
+            if parent is not None:
+                self.children.setdefault(parent, []).append(message_id)
 
         messages = {}
-        for message_id in self.list_message_id:
-            # Looking for messages in the thread
-            index = self.list_message_id.index(message_id)
-
+        self.threads_metrics = {}
+        for index, message_id in enumerate(self.list_message_id):
             # Only analyzing those whose is_response_of is None, 
             # those are the message 'root' of each thread.
             if self.list_is_response_of[index] is None:
-                messages[message_id] = self._build_threads(message_id)
+                (thread, metrics) = self._build_threads(message_id)
                 # Adding the root message to the list in first place
-                messages[message_id].insert(0, message_id)
+                messages[message_id] = [message_id] + thread
+                self.threads_metrics[message_id] = metrics
 
         self.threads = messages
 
@@ -158,46 +243,21 @@ class Threads(object):
             pass
 
     def topCrowdedThread(self, numTop):
-        # Returns list ordered by the longest thread
-
-        top_threads = [] # [(message_id, number of different upeople_id), (...,...), ...]
-
-        for thread in self.threads.values():
-            # this loop counts number of different people
-            # in each of the threads and provides a 
-            # dictionary with root message_id as each of the keys
-            # and a list of upeople_id as the value.
-            # Sets were considered as an option, but it implies that
-            # we may find with a higher probability equal sets, what
-            # would provide incorrect sets to their correspondant message_id
-            # when ordering them (at least using this algorithm).
-            # So, not using sets, and manual order of the lists is done 
-            people = set([])
-            for message in thread:
-                query = """
-                        select distinct pup.uuid as upeople_id
-                        from messages m,
-                             messages_people mp,
-                             people_uidentities pup
-                        where m.message_ID = '%s' and
-                              m.message_ID = mp.message_id and
-                              mp.type_of_recipient = 'From' and
-                              mp.email_address = pup.people_id
-                        """ % (message)
-                result = ExecuteQuery(query)
-                upeople_id = result["upeople_id"]
-                people.add(upeople_id)
-            top_threads.append((message, len(people)))
+        # Returns list ordered by the most crowded threads, with
+        # the number of different participants of each one.
+        # The participants were counted when building the threads.
+
+        top_threads = [] # [(root message_id, number of different upeople_id), (...,...), ...]
+
+        for message_id in self.threads.keys():
+            top_threads.append((message_id, self.threads_metrics[message_id]["participants"]))
 
         sorted_threads = sorted(top_threads, key=lambda thread: thread[1], reverse = True)
+        sorted_threads = sorted_threads[:int(numTop)]
 
-        top_threads_emails = []
-        for top in sorted_threads[:numTop]:
-            # Create a list of emails
-            message_id = top[0]
-            email = Email(message_id, self.i_db)
-            top_threads_emails.append((email, top[1]))
-        return top_threads_emails
+        # Create a list of emails
+        emails = Email.load_emails([top[0] for top in sorted_threads], self.i_db)
+        return [(email, top[1]) for (email, top) in zip(emails, sorted_threads)]
 
     def longestThread (self):
         # Returns the longest thread
@@ -217,7 +277,6 @@ class Threads(object):
         # Returns list ordered by the longest threads
         top_threads = []
         top_root_msgs = []
-        top_threads_emails = []
 
         # Retrieving the lists of threads
         values = self.threads.values()
@@ -235,10 +294,8 @@ class Threads(object):
             # (the rest of them are not ordered)
             top_root_msgs.append(thread[0])
 
-        for message_id in top_root_msgs:
-            # Create a list of emails
-            email = Email(message_id, self.i_db)
-            top_threads_emails.append(email)
+        # Create a list of emails
+        top_threads_emails = Email.load_emails(top_root_msgs, self.i_db)
 
         return top_threads_emails
 
@@ -283,6 +340,11 @@ class Threads(object):
         # root message
         return len(self.threads[message_id])
 
+    def threadMetrics(self, message_id):
+        # Returns length, depth, number of participants, first_date and
+        # last_date of a given thread
+        return self.threads_metrics[message_id]
+
 if __name__ == '__main__':
     GrimoireSQL.SetDBChannel (database = "openstack_mls", user="root", password="")
     main_topics = Threads("'2012-01-01'", "'2014-01-01'", "openstack_scm")
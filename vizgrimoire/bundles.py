@@ -0,0 +1,159 @@
+## Copyright (C) 2014 Bitergia
+##
+## This program is free software; you can redistribute it and/or modify
+## it under the terms of the GNU General Public License as published by
+## the Free Software Foundation; either version 3 of the License, or
+## (at your option) any later version.
+##
+## This program is distributed in the hope that it will be useful,
+## but WITHOUT ANY WARRANTY; without even the implied warranty of
+## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+## GNU General Public License for more details.
+##
+## You should have received a copy of the GNU General Public License
+## along with this program; if not, write to the Free Software
+## Foundation, Inc., 59 Temple Place - Suite 330, Boston, MA 02111-1307, USA.
+##
+## This file is a part of GrimoireLib
+##  (an Python library for the MetricsGrimoire and vizGrimoire systems)
+##
+##
+## Authors:
+##   Alvaro del Castillo <acs@bitergia.com>
+
+""" Bundles with the JSON files of the items of a filter
+
+    Instead of one JSON file per item, the items are written in a few
+    shard files <name>-<shard>.jsonl with one JSON document per line, or
+    <name>-<shard>.jsonl.gz with one gzip member per item (the file can
+    still be read with zcat). The index <name>-index.json has the shard
+    files and, for each legacy file name, its shard, offset and length:
+
+    {"shards": ["scm-rep-all-static-0.jsonl", ...],
+     "items": {"a-scm-rep-static.json": [0, 0, 120], ...}}
+
+    Each item document is the same JSON createJSON writes, so expanding a
+    bundle produces the legacy files with the same content.
+"""
+
+import glob
+import json
+import logging
+import os
+import zlib
+from multiprocessing import Pool
+
+from vizgrimoire.GrimoireUtils import createJSON, toJSON
+
+INDEX_SUFFIX = "-index.json"
+
+
+def get_shard_filename(name, shard, compress = False):
+    filename = name + "-" + str(shard) + ".jsonl"
+    if compress: filename += ".gz"
+    return filename
+
+def _write_shard(args):
+    """ Write the items of a shard and return its index entries """
+    (path, items, compress) = args
+    entries = []
+    offset = 0
+    shard_file = open(path, "wb")
+    try:
+        for (filename, data) in items:
+            document = toJSON(data)
+            if isinstance(document, unicode): document = document.encode('utf-8')
+            document += "\n"
+            if compress:
+                # wbits 31: a complete gzip member per item
+                compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+                document = compressor.compress(document) + compressor.flush()
+            shard_file.write(document)
+            entries.append((filename, offset, len(document)))
+            offset += len(document)
+    finally:
+        shard_file.close()
+    return entries
+
+def write_bundle(items, destdir, name, shards = 4, compress = False, processes = None):
+    """ Write a list of (legacy filename, data) in shards and its index
+
+        Shards are written in parallel by processes workers (shards by default).
+    """
+    shards = max(1, min(shards, len(items)))
+    shards_items = [items[shard::shards] for shard in range(0, shards)]
+    shards_files = [get_shard_filename(name, shard, compress) for shard in range(0, shards)]
+    tasks = [(os.path.join(destdir, shards_files[shard]), shards_items[shard], compress)
+             for shard in range(0, shards)]
+
+    if processes is None: processes = shards
+    if processes > 1 and shards > 1:
+        pool = Pool(min(processes, shards))
+        try:
+            shards_entries = pool.map(_write_shard, tasks)
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        shards_entries = [_write_shard(task) for task in tasks]
+
+    index = {"shards": shards_files, "items": {}}
+    for shard in range(0, shards):
+        for (filename, offset, length) in shards_entries[shard]:
+            index["items"][filename] = [shard, offset, length]
+    # The index is written last: a bundle with index is complete
+    createJSON(index, os.path.join(destdir, name + INDEX_SUFFIX))
+    logging.info("Bundle %s: %i items in %i shards" % (name, len(items), shards))
+
+def read_index(destdir, name):
+    index_file = open(os.path.join(destdir, name + INDEX_SUFFIX))
+    try:
+        return json.load(index_file)
+    finally:
+        index_file.close()
+
+def _read_document(shard_file, offset, length, compress):
+    shard_file.seek(offset)
+    document = shard_file.read(length)
+    if compress: document = zlib.decompress(document, 31)
+    return document[:-1]
+
+def read_bundle_item(destdir, name, filename, index = None):
+    """ JSON document of a legacy filename from a bundle """
+    if index is None: index = read_index(destdir, name)
+    (shard, offset, length) = index["items"][filename]
+    shard_filename = index["shards"][shard]
+    shard_file = open(os.path.join(destdir, shard_filename), "rb")
+    try:
+        return _read_document(shard_file, offset, length, shard_filename.endswith(".gz"))
+    finally:
+        shard_file.close()
+
+def expand_bundle(destdir, name, outdir = None):
+    """ Write the legacy JSON file of each item of a bundle in outdir """
+    if outdir is None: outdir = destdir
+    index = read_index(destdir, name)
+    items_shard = {}
+    for (filename, entry) in index["items"].items():
+        items_shard.setdefault(entry[0], []).append((entry[1], filename))
+
+    for shard in sorted(items_shard.keys()):
+        shard_filename = index["shards"][shard]
+        compress = shard_filename.endswith(".gz")
+        shard_file = open(os.path.join(destdir, shard_filename), "rb")
+        try:
+            for (offset, filename) in sorted(items_shard[shard]):
+                length = index["items"][filename][2]
+                item_file = open(os.path.join(outdir, filename), "wb")
+                try:
+                    item_file.write(_read_document(shard_file, offset, length, compress))
+                finally:
+                    item_file.close()
+        finally:
+            shard_file.close()
+    return len(index["items"])
+
+def get_bundles(destdir):
+    """ Names of the bundles in destdir """
+    return sorted([os.path.basename(path)[:-len(INDEX_SUFFIX)]
+                   for path in glob.glob(os.path.join(destdir, "*" + INDEX_SUFFIX))])
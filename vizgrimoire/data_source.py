@@ -24,16 +24,43 @@
 """ DataSource offers the API to get aggregated, evolutionary and top data with filter 
     support for Grimoire supported data sources """ 
 
-import logging, os
+import json, logging, os
 from vizgrimoire.metrics.query_builder import DSQuery, ITSQuery, MLSQuery
-from vizgrimoire.GrimoireUtils import createJSON
+from vizgrimoire.GrimoireUtils import createJSON, readJSON, toJSON, compare_json_data
+from vizgrimoire.GrimoireUtils import get_lookback_startdate, splice_evol_data
+from vizgrimoire.metrics.metrics import Metrics
 from vizgrimoire.metrics.metrics_filter import MetricFilters
+from vizgrimoire.metrics.metrics_memo import MetricsMemo
+from vizgrimoire.metrics.query_planner import QueryPlanner
 from vizgrimoire.filter import Filter
+from vizgrimoire.bundles import write_bundle
+from vizgrimoire.jobs import map_jobs
+
+def _call_ds_method(DS, method, args):
+    # Methods of classes can not be sent to worker processes
+    return getattr(DS, method)(*args)
 
 class DataSource(object):
     _bots = []
     _metrics_set = []
+    # Function called with a data source before using its metrics set,
+    # to register them on demand
+    _metrics_loader = None
     _global_filter = None
+    # Number of periods before the last one recomputed in evolutionary
+    # reports. None to recompute all periods.
+    _incremental_lookback = None
+    _incremental_check = False
+    # Names of data sources computing all periods (i.e. identities changed)
+    _incremental_full = []
+    # Number of shards for the items files of filters. None to write one
+    # JSON file per item.
+    _bundles_shards = None
+    _bundles_compress = False
+    # Number of processes for the reports of the items of a filter
+    _filter_jobs = 1
+    # Max number of people whose activity is read with one query
+    _people_batch_size = 1000
 
     @staticmethod
     def get_name():
@@ -124,6 +151,67 @@ class DataSource(object):
         """Create the evolutionary data report"""
         raise NotImplementedError
 
+    @staticmethod
+    def set_incremental(lookback, check = False, full = []):
+        """Recompute only the last periods in evolutionary reports
+
+        Data sources in full compute all periods.
+        """
+        DataSource._incremental_lookback = lookback
+        DataSource._incremental_check = check
+        DataSource._incremental_full = list(full)
+
+    @staticmethod
+    def set_bundles(shards, compress = False):
+        """Write the items files of filters in sharded bundles"""
+        DataSource._bundles_shards = shards
+        DataSource._bundles_compress = compress
+
+    @staticmethod
+    def set_filter_jobs(jobs):
+        """Create the reports of filter items in jobs processes"""
+        DataSource._filter_jobs = jobs
+
+    @classmethod
+    def map_filter_items(cls, method, filter_name, items, *args):
+        """Results of cls.method(filter_item, *args) for each item, in items order"""
+        jobs = [(item, (cls, method, (Filter(filter_name, item),) + args))
+                for item in items]
+        return map_jobs(_call_ds_method, jobs, DataSource._filter_jobs)
+
+    @staticmethod
+    def get_evolutionary_data_incremental(DS, period, startdate, enddate, identities_db,
+                                          filter_, filepath):
+        """Get the evolutionary data reusing the old periods already in filepath"""
+        lookback = DataSource._incremental_lookback
+        if lookback is None or DS.get_name() in DataSource._incremental_full:
+            return DS.get_evolutionary_data(period, startdate, enddate, identities_db, filter_)
+
+        data = None
+        old_data = readJSON(filepath)
+        inc_startdate = get_lookback_startdate(period, enddate, lookback)
+        if old_data and inc_startdate is not None and inc_startdate > startdate:
+            new_data = DS.get_evolutionary_data(period, inc_startdate, enddate,
+                                                identities_db, filter_)
+            # Old periods of state dependent metrics are not valid anymore
+            state_fields = [metric.id for metric in DataSource.get_metrics_set(DS)
+                            if getattr(metric, "state_dependent", False)]
+            if len([field for field in new_data if field in state_fields]) == 0:
+                data = splice_evol_data(old_data, json.loads(toJSON(new_data)), period)
+        if data is None:
+            logging.info("Can not update " + filepath + ". Computing all periods.")
+            return DS.get_evolutionary_data(period, startdate, enddate, identities_db, filter_)
+
+        if DataSource._incremental_check:
+            full_data = DS.get_evolutionary_data(period, startdate, enddate,
+                                                 identities_db, filter_)
+            full_data = json.loads(toJSON(full_data))
+            if not compare_json_data(full_data, data, "full " + filepath,
+                                     "incremental " + filepath):
+                logging.warning("Incremental data differs for " + filepath)
+                return full_data
+        return data
+
     def get_agg_filename (self, filter_ = None):
         """Get the filename used to store aggregated data"""
         name = None
@@ -240,6 +328,16 @@ class DataSource(object):
         """Get aggregated data for a person activity"""
         raise NotImplementedError
 
+    @staticmethod
+    def get_people_evol(uuids, period, startdate, enddate, identities_db, type_analysis):
+        """{uuid: get_person_evol data} for a list of people. None if not supported"""
+        return None
+
+    @staticmethod
+    def get_people_agg(uuids, startdate, enddate, identities_db, type_analysis):
+        """{uuid: get_person_agg data} for a list of people. None if not supported"""
+        return None
+
     def create_people_report(self, period, startdate, enddate, destdir, npeople, identities_db, people_ids=None):
         """Create all files related to people activity (aggregated, evolutionary)"""
         fpeople = os.path.join(destdir,self.get_top_people_file(self.get_name()))
@@ -251,16 +349,28 @@ class DataSource(object):
 
         createJSON(people, fpeople)
 
-        for uuid in people :
-            evol_data = self.get_person_evol(uuid, period, startdate, enddate,
-                                            identities_db, type_analysis = None)
-            fperson = os.path.join(destdir,self.get_person_evol_file(uuid))
-            createJSON (evol_data, fperson)
+        # The activity of the people is read in batches, one query per batch
+        size = DataSource._people_batch_size
+        for start in range(0, len(people), size):
+            batch = list(people[start:start+size])
+            people_evol = self.get_people_evol(batch, period, startdate, enddate,
+                                               identities_db, type_analysis = None)
+            people_agg = self.get_people_agg(batch, startdate, enddate,
+                                             identities_db, type_analysis = None)
+            for uuid in batch:
+                if people_evol is not None: evol_data = people_evol[uuid]
+                else:
+                    evol_data = self.get_person_evol(uuid, period, startdate, enddate,
+                                                     identities_db, type_analysis = None)
+                fperson = os.path.join(destdir,self.get_person_evol_file(uuid))
+                createJSON (evol_data, fperson)
 
-            agg = self.get_person_agg(uuid, startdate, enddate,
-                                     identities_db, type_analysis = None)
-            fperson = os.path.join(destdir,self.get_person_agg_file(uuid))
-            createJSON (agg, fperson)
+                if people_agg is not None: agg = people_agg[uuid]
+                else:
+                    agg = self.get_person_agg(uuid, startdate, enddate,
+                                              identities_db, type_analysis = None)
+                fperson = os.path.join(destdir,self.get_person_agg_file(uuid))
+                createJSON (agg, fperson)
 
     @staticmethod
     def create_r_reports(vizr, enddate, destdir):
@@ -291,6 +401,8 @@ class DataSource(object):
     @staticmethod
     def get_metrics_set(ds):
         """Return all metrics objects available"""
+        if DataSource._metrics_loader is not None:
+            DataSource._metrics_loader(ds)
         return ds._metrics_set
 
     @staticmethod
@@ -298,6 +410,12 @@ class DataSource(object):
         """Set all metrics objects available"""
         ds._metrics_set = metrics_set
 
+    @staticmethod
+    def set_metrics_loader(loader):
+        """Register the metrics of a data source on demand with loader(ds)"""
+        if loader is not None: loader = staticmethod(loader)
+        DataSource._metrics_loader = loader
+
     @staticmethod
     def add_metrics(metrics, ds):
         ds._metrics_set.append(metrics)
@@ -305,7 +423,7 @@ class DataSource(object):
     @staticmethod
     def get_metrics(id, ds):
         metrics = None
-        for item in ds._metrics_set:
+        for item in DataSource.get_metrics_set(ds):
             if item.id == id:
                 metrics = item
         return metrics
@@ -404,14 +522,39 @@ class DataSource(object):
             for r in metrics_reports:
                 if r in reports_on: metrics_on += [r]
 
+        metrics_filters = {}
+        for item in all_metrics:
+            if item.id not in metrics_on: continue
+            metrics_filters[item.id] = item.filters
+            item_filter = mfilter.copy()
+            item_filter.set_global_filter(item.filters.global_filter)
+            item_filter.set_closed_condition(item.filters.closed_condition)
+            item.filters = item_filter
+        # Metrics sharing the same FROM and WHERE are computed in one query,
+        # except the ones already memoized in this run
+        memo = Metrics.memo
+        if evol: method = "get_ts"
+        else: method = "get_agg"
+        planned = [item for item in all_metrics if item.id in metrics_filters]
+        if memo is not None:
+            planned = [item for item in planned
+                       if not memo.has_key(MetricsMemo.get_key(item, method))]
+        planner = QueryPlanner(planned, evol)
+        planned_values = planner.get_values()
+        if memo is not None:
+            for item in planned:
+                if item.id in planned_values:
+                    memo.put(MetricsMemo.get_key(item, method), planned_values[item.id])
+
         for item in all_metrics:
             # print item
             if item.id not in metrics_on: continue
-            mfilter_orig = item.filters
+            mfilter_orig = metrics_filters[item.id]
             mfilter.global_filter = mfilter_orig.global_filter
             mfilter.set_closed_condition(mfilter_orig.closed_condition)
             item.filters = mfilter
-            if evol: mvalue = item.get_ts()
+            if item.id in planned_values: mvalue = planned_values[item.id]
+            elif evol: mvalue = item.get_ts()
             else:    mvalue = item.get_agg()
 
             if type_analysis and type_analysis[1] is None and mvalue:
@@ -452,19 +595,18 @@ class DataSource(object):
             if automator_metrics in automator['r']:
                 metrics_trends = automator['r'][automator_metrics].split(",")
 
-            for i in [7,30,365]:
-                for item in all_metrics:
-                    if item.id not in metrics_trends: continue
-                    mfilter_orig = item.filters
-                    item.filters = mfilter
-                    period_data = item.get_trends(enddate, i)
-                    item.filters = mfilter_orig
+            for item in all_metrics:
+                if item.id not in metrics_trends: continue
+                mfilter_orig = item.filters
+                item.filters = mfilter
+                period_data = item.get_trends_windows(enddate, [7,30,365])
+                item.filters = mfilter_orig
 
-                    if type_analysis and type_analysis[1] is None:
-                        group_field = dsquery.get_group_field_alias(type_analysis[0])
-                        period_data = fill_and_order_items(items, period_data, group_field)
+                if type_analysis and type_analysis[1] is None:
+                    group_field = dsquery.get_group_field_alias(type_analysis[0])
+                    period_data = fill_and_order_items(items, period_data, group_field)
 
-                    data = dict(data.items() + period_data.items())
+                data = dict(data.items() + period_data.items())
 
         return data
 
@@ -541,6 +683,7 @@ class DataSource(object):
         ts_fields = ['unixtime','id','date',period]
         # Not metrics fields
         no_metrics_fields = ['filter_type']
+        items_files = []
         for i in range(0,len(data['name'])):
             item_metrics = {}
             item = data['name'][i]
@@ -560,10 +703,21 @@ class DataSource(object):
                 for field in ts_fields:
                     # Shared time series fields
                     item_metrics[field] = data[field]
-                fn = os.path.join(destdir, filter_item.get_evolutionary_filename(cls()))
+                fn = filter_item.get_evolutionary_filename(cls())
+            else:
+                fn = filter_item.get_static_filename(cls())
+            if DataSource._bundles_shards is None:
+                createJSON(item_metrics, os.path.join(destdir, fn))
+            else:
+                items_files.append((fn, item_metrics))
+
+        if DataSource._bundles_shards is not None:
+            if evolutionary:
+                bundle = filter_.get_evolutionary_filename_all(cls())
             else:
-                fn = os.path.join(destdir, filter_item.get_static_filename(cls()))
-            createJSON(item_metrics, fn)
+                bundle = filter_.get_static_filename_all(cls())
+            write_bundle(items_files, destdir, bundle[:-len(".json")],
+                         DataSource._bundles_shards, DataSource._bundles_compress)
 
     @classmethod
     def ages_study_com (ds, items, period,
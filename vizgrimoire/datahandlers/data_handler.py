@@ -72,7 +72,7 @@ class DHESA(DataHandler):
         Parameters
         ----------
 
-        dataset: list of elements
+        dataset: list of elements or NumPy array
         filters: MetricFilters object
 
         """
@@ -80,8 +80,8 @@ class DHESA(DataHandler):
         self.filters = filters
         self.data = {}
 
-        if not isinstance(dataset, list):
-            raise Exception("__init__ dataset should be a list")
+        if not isinstance(dataset, (list, np.ndarray)):
+            raise Exception("__init__ dataset should be a list or array")
         if len(dataset) == 0:
             self.data["median"] = 0
             self.data["mean"] = 0
@@ -0,0 +1,294 @@
+## Copyright (C) 2014 Bitergia
+##
+## This program is free software; you can redistribute it and/or modify
+## it under the terms of the GNU General Public License as published by
+## the Free Software Foundation; either version 3 of the License, or
+## (at your option) any later version.
+##
+## This program is distributed in the hope that it will be useful,
+## but WITHOUT ANY WARRANTY; without even the implied warranty of
+## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+## GNU General Public License for more details.
+##
+## You should have received a copy of the GNU General Public License
+## along with this program; if not, write to the Free Software
+## Foundation, Inc., 59 Temple Place - Suite 330, Boston, MA 02111-1307, USA.
+##
+## This file is a part of GrimoireLib
+##  (an Python library for the MetricsGrimoire and vizGrimoire systems)
+##
+##
+## Authors:
+##   Alvaro del Castillo <acs@bitergia.com>
+
+""" Bounded pools of MySQL connections shared by DSQuery and GrimoireSQL """
+
+import logging
+import threading
+import time
+
+import MySQLdb
+import MySQLdb.cursors
+
+# MySQL client errors after which a connection can not be used anymore
+CR_SERVER_GONE_ERROR = 2006
+CR_SERVER_LOST = 2013
+CONNECTION_LOST_ERRORS = (CR_SERVER_GONE_ERROR, CR_SERVER_LOST)
+
+
+class ConnectionPool(object):
+    """ Bounded pool of connections to a single database
+
+        Connections are checked out per thread: nested checkouts from the
+        same thread reuse the connection already checked out, so a thread
+        never holds more than one connection of a pool.
+    """
+
+    default_size = 4
+    # Idle connections older than this (seconds) are pinged before reuse
+    ping_after = 60
+
+    def __init__(self, user=None, password=None, database=None,
+                 host="127.0.0.1", port=3306, group=None, size=None):
+        self.user = user
+        self.password = password
+        self.database = database
+        self.host = host
+        self.port = port
+        self.group = group
+        if size is None: size = ConnectionPool.default_size
+        self.size = size
+        self._idle = [] # (connection, last time used)
+        self._created = 0
+        self._cond = threading.Condition(threading.Lock())
+        self._local = threading.local()
+
+    def _connect(self):
+        if (self.group == None):
+            db = MySQLdb.connect(user=self.user, passwd=self.password,
+                                 db=self.database, host=self.host, port=self.port)
+        else:
+            db = MySQLdb.connect(read_default_group=self.group, db=self.database)
+        cursor = db.cursor()
+        cursor.execute("SET NAMES 'utf8'")
+        cursor.close()
+        return db
+
+    @staticmethod
+    def _is_alive(db):
+        try:
+            db.ping()
+        except MySQLdb.Error:
+            return False
+        return True
+
+    def _acquire(self, block=True):
+        self._cond.acquire()
+        try:
+            while True:
+                if self._idle:
+                    db, last_used = self._idle.pop()
+                    if time.time() - last_used < ConnectionPool.ping_after \
+                        or self._is_alive(db):
+                        return db
+                    logging.info("Dropping dead connection to " + self.database)
+                    self._created -= 1
+                    continue
+                if self._created < self.size:
+                    # Reserve the slot before connecting outside the lock
+                    self._created += 1
+                    break
+                if not block: return None
+                self._cond.wait()
+        finally:
+            self._cond.release()
+        try:
+            return self._connect()
+        except:
+            self._discard_slot()
+            raise
+
+    def _discard_slot(self):
+        self._cond.acquire()
+        try:
+            self._created -= 1
+            self._cond.notify()
+        finally:
+            self._cond.release()
+
+    def _release(self, db):
+        self._cond.acquire()
+        try:
+            self._idle.append((db, time.time()))
+            self._cond.notify()
+        finally:
+            self._cond.release()
+
+    def checkout(self):
+        """ Get the connection for the current thread """
+        if getattr(self._local, 'depth', 0) == 0:
+            self._local.db = self._acquire()
+            self._local.depth = 0
+        elif self._local.db is None:
+            # A reconnect failed: the slot is still reserved for the thread
+            self._local.db = self._connect()
+        self._local.depth += 1
+        return self._local.db
+
+    def checkin(self):
+        """ Return the connection of the current thread to the pool """
+        self._local.depth -= 1
+        if self._local.depth > 0: return
+        db = self._local.db
+        self._local.db = None
+        # Without connection (failed reconnect) only the slot is freed
+        if db is None: self._discard_slot()
+        else: self._release(db)
+
+    def reconnect(self):
+        """ Replace the dead connection checked out by the current thread """
+        try:
+            self._local.db.close()
+        except MySQLdb.Error:
+            pass
+        # The dead connection must not go back to the pool if this fails
+        self._local.db = None
+        self._local.db = self._connect()
+        return self._local.db
+
+    def close(self):
+        """ Close all idle connections """
+        self._cond.acquire()
+        try:
+            for db, last_used in self._idle:
+                try:
+                    db.close()
+                except MySQLdb.Error:
+                    pass
+            self._created -= len(self._idle)
+            self._idle = []
+        finally:
+            self._cond.release()
+
+    def forget(self):
+        """ Drop the connections without closing them
+
+            Used in a forked process: the connections belong to the parent.
+        """
+        self._idle = []
+        self._created = 0
+        self._cond = threading.Condition(threading.Lock())
+        self._local = threading.local()
+
+    def execute(self, sql, cursor_class=None):
+        """ Execute sql and return the cursor with the results
+
+            The connection stays checked out until checkin() is called, so
+            callers can fetch results from the returned cursor. If the server
+            closed the connection, the query is retried once in a new one.
+        """
+        db = self.checkout()
+        try:
+            try:
+                cursor = db.cursor(cursor_class)
+                cursor.execute(sql)
+            except MySQLdb.OperationalError, e:
+                if e.args[0] not in CONNECTION_LOST_ERRORS: raise
+                logging.warning("Lost connection to " + self.database + ". Reconnecting.")
+                db = self.reconnect()
+                cursor = db.cursor(cursor_class)
+                cursor.execute(sql)
+        except:
+            self.checkin()
+            raise
+        return cursor
+
+    def stream(self, sql, size=1000):
+        """ Generator of (cursor description, rows) with up to size rows
+
+            The first item is always returned, even with no rows, so the
+            description of the columns is available.
+
+            Rows are read with a server side cursor in a connection not
+            shared with the thread, so the caller can run other queries
+            while consuming the generator. If the pool is exhausted, an
+            extra connection is opened and closed at the end.
+        """
+        db = self._acquire(block=False)
+        overflow = db is None
+        if overflow: db = self._connect()
+        cursor = None
+        try:
+            cursor = db.cursor(MySQLdb.cursors.SSCursor)
+            try:
+                cursor.execute(sql)
+            except MySQLdb.OperationalError, e:
+                if e.args[0] not in CONNECTION_LOST_ERRORS: raise
+                logging.warning("Lost connection to " + self.database + ". Reconnecting.")
+                try:
+                    db.close()
+                except MySQLdb.Error:
+                    pass
+                (db, cursor) = (None, None)
+                db = self._connect()
+                cursor = db.cursor(MySQLdb.cursors.SSCursor)
+                cursor.execute(sql)
+            if cursor.description is None: return
+            rows = cursor.fetchmany(size)
+            yield cursor.description, rows
+            while rows:
+                rows = cursor.fetchmany(size)
+                if not rows: break
+                yield cursor.description, rows
+        finally:
+            # All pending rows must be read before reusing the connection
+            if cursor is not None: cursor.close()
+            if overflow:
+                if db is not None: db.close()
+            elif db is None: self._discard_slot()
+            else: self._release(db)
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def set_pool_size(size):
+    """ Max number of connections per database for pools created from now on """
+    ConnectionPool.default_size = int(size)
+
+
+def get_pool(user=None, password=None, database=None,
+             host="127.0.0.1", port=3306, group=None):
+    """ Get the shared pool for a database, creating it if needed """
+    key = (user, database, host, port, group)
+    _pools_lock.acquire()
+    try:
+        if key not in _pools:
+            _pools[key] = ConnectionPool(user, password, database,
+                                         host, port, group)
+        return _pools[key]
+    finally:
+        _pools_lock.release()
+
+
+def close_pools():
+    """ Close all idle connections in all pools """
+    _pools_lock.acquire()
+    try:
+        for pool in _pools.values():
+            pool.close()
+        _pools.clear()
+    finally:
+        _pools_lock.release()
+
+
+def forget_pools():
+    """ Drop in a forked process the connections of the parent process
+
+        Pools already referenced (DSQuery, GrimoireSQL) open new connections.
+    """
+    global _pools_lock
+    _pools_lock = threading.Lock()
+    for pool in _pools.values():
+        pool.forget()
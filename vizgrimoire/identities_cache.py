@@ -0,0 +1,198 @@
+## Copyright (C) 2014 Bitergia
+##
+## This program is free software; you can redistribute it and/or modify
+## it under the terms of the GNU General Public License as published by
+## the Free Software Foundation; either version 3 of the License, or
+## (at your option) any later version.
+##
+## This program is distributed in the hope that it will be useful,
+## but WITHOUT ANY WARRANTY; without even the implied warranty of
+## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+## GNU General Public License for more details.
+##
+## You should have received a copy of the GNU General Public License
+## along with this program; if not, write to the Free Software
+## Foundation, Inc., 59 Temple Place - Suite 330, Boston, MA 02111-1307, USA.
+##
+## This file is a part of GrimoireLib
+##  (an Python library for the MetricsGrimoire and vizGrimoire systems)
+##
+##
+## Authors:
+##   Alvaro del Castillo <acs@bitergia.com>
+
+""" Identities (SortingHat) data loaded once per run
+
+    The profiles, enrollments, organizations and countries of an
+    identities database are read with one query per table and kept in
+    memory: uuid to profile (name, email, country) and uuid to enrollments
+    (organization, start, end). People and threads reports get the
+    identifiers of each person from here instead of joining these tables
+    once per person.
+
+    If a cache directory is set, the data is also written to a JSON file
+    with the checksums of the tables, and read from it in the next runs
+    while the tables do not change.
+"""
+
+import logging
+import os
+import threading
+
+from vizgrimoire.GrimoireSQL import ExecuteQuery, ExecuteQueryStream
+from vizgrimoire.GrimoireUtils import readJSON, writeJSON
+
+TABLES = ["profiles", "enrollments", "organizations", "countries"]
+
+# Loaded caches per identities database
+_caches = {}
+_caches_lock = threading.Lock()
+# Directory for the cache files. None to not persist them.
+_cache_dir = None
+
+
+def _to_str(value):
+    if value is None: return None
+    if isinstance(value, basestring): return value
+    return str(value)
+
+class IdentitiesCache(object):
+    """ Profiles and affiliations of the people of an identities database """
+
+    def __init__(self, identities_db):
+        self.identities_db = identities_db
+        self.profiles = {} # uuid: [name, email, country]
+        self.enrollments = {} # uuid: [[organization, start, end], ...]
+        # False if the database has no organizations (enrollments) data
+        self.organizations = True
+
+    def _get_checksums(self):
+        q = "CHECKSUM TABLE " + ", ".join([self.identities_db + "." + table
+                                           for table in TABLES])
+        res = ExecuteQuery(q)
+        tables = res['Table']
+        checksums = res['Checksum']
+        if not isinstance(tables, list):
+            (tables, checksums) = ([tables], [checksums])
+        return dict(zip(tables, [_to_str(checksum) for checksum in checksums]))
+
+    def _load_db(self):
+        idb = self.identities_db
+        self.profiles = {}
+        q = """
+            SELECT pro.uuid, pro.name, pro.email, cou.name as country
+            FROM %s.profiles pro
+            LEFT JOIN %s.countries cou ON cou.code = pro.country_code
+            """ % (idb, idb)
+        for row in ExecuteQueryStream(q):
+            self.profiles[row['uuid']] = [row['name'], row['email'], row['country']]
+
+        self.enrollments = {}
+        self.organizations = True
+        q = """
+            SELECT enr.uuid, org.name, enr.start, enr.end
+            FROM %s.enrollments enr
+            JOIN %s.organizations org ON org.id = enr.organization_id
+            """ % (idb, idb)
+        try:
+            for row in ExecuteQueryStream(q):
+                self.enrollments.setdefault(row['uuid'], []).append(
+                    [row['name'], _to_str(row['start']), _to_str(row['end'])])
+        except Exception:
+            # No organizations. Just people data and country data.
+            self.enrollments = {}
+            self.organizations = False
+
+    def _get_cache_file(self):
+        return os.path.join(_cache_dir, "identities-" + self.identities_db + ".json")
+
+    def load(self):
+        """ Read the identities, from the cache file if the tables did not change """
+        checksums = None
+        if _cache_dir is not None:
+            try:
+                checksums = self._get_checksums()
+            except Exception:
+                logging.warning("Can not get checksums of " + self.identities_db)
+            cached = None
+            if checksums is not None: cached = readJSON(self._get_cache_file())
+            if cached is not None and cached.get('checksums') == checksums:
+                self.profiles = cached['profiles']
+                self.enrollments = cached['enrollments']
+                self.organizations = cached['organizations']
+                logging.info("Identities of %s read from %s" %
+                             (self.identities_db, self._get_cache_file()))
+                return
+
+        self._load_db()
+        logging.info("Identities of %s loaded: %i profiles, %i enrolled" %
+                     (self.identities_db, len(self.profiles), len(self.enrollments)))
+
+        if checksums is not None:
+            if not os.path.isdir(_cache_dir): os.makedirs(_cache_dir)
+            writeJSON({"checksums": checksums, "profiles": self.profiles,
+                       "enrollments": self.enrollments,
+                       "organizations": self.organizations},
+                      self._get_cache_file())
+
+    def get_profile(self, uuid):
+        """ [name, email, country] of a person or None """
+        return self.profiles.get(uuid)
+
+    def get_enrollments(self, uuid):
+        """ [organization, start, end] of each enrollment of a person """
+        return self.enrollments.get(uuid, [])
+
+    def get_affiliation(self, uuid, date = None):
+        """ Organization of a person in date (a "YYYY-MM-DD..." string) """
+        for (organization, start, end) in self.get_enrollments(uuid):
+            if date is None: return organization
+            if (start is None or start <= date) and (end is None or date < end):
+                return organization
+        return None
+
+    def get_person_identifiers(self, uuid):
+        """ uuid, name, email, country and affiliation of a person
+
+            Same format than a query joining the tables: a value per field
+            with one enrollment, a list per field with several ones and
+            empty lists without enrollments (or profile).
+        """
+        fields = ["uuid", "name", "email", "country"]
+        if self.organizations: fields.append("affiliation")
+        profile = self.get_profile(uuid)
+        rows = []
+        if profile is not None:
+            if not self.organizations:
+                rows.append([uuid] + profile)
+            else:
+                for enrollment in self.get_enrollments(uuid):
+                    rows.append([uuid] + profile + [enrollment[0]])
+        if len(rows) == 1:
+            return dict(zip(fields, rows[0]))
+        return dict([(field, [row[pos] for row in rows])
+                     for (pos, field) in enumerate(fields)])
+
+def set_cache_dir(cache_dir):
+    """ Directory to persist the identities caches. None to disable it """
+    global _cache_dir
+    _cache_dir = cache_dir
+
+def get_identities_cache(identities_db):
+    """ IdentitiesCache of identities_db, loaded on first use """
+    _caches_lock.acquire()
+    try:
+        if identities_db not in _caches:
+            cache = IdentitiesCache(identities_db)
+            cache.load()
+            _caches[identities_db] = cache
+        return _caches[identities_db]
+    finally:
+        _caches_lock.release()
+
+def clear_caches():
+    _caches_lock.acquire()
+    try:
+        _caches.clear()
+    finally:
+        _caches_lock.release()
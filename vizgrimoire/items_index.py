@@ -0,0 +1,74 @@
+## Copyright (C) 2014 Bitergia
+##
+## This program is free software; you can redistribute it and/or modify
+## it under the terms of the GNU General Public License as published by
+## the Free Software Foundation; either version 3 of the License, or
+## (at your option) any later version.
+##
+## This program is distributed in the hope that it will be useful,
+## but WITHOUT ANY WARRANTY; without even the implied warranty of
+## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+## GNU General Public License for more details.
+##
+## You should have received a copy of the GNU General Public License
+## along with this program; if not, write to the Free Software
+## Foundation, Inc., 59 Temple Place - Suite 330, Boston, MA 02111-1307, USA.
+##
+## This file is a part of GrimoireLib
+##  (an Python library for the MetricsGrimoire and vizGrimoire systems)
+##
+##
+## Authors:
+##   Alvaro del Castillo <acs@bitergia.com>
+
+""" Alignment of the values of filter items (companies, people, repositories)
+
+    Metrics for filters return a list of items and, for each metric, a list
+    with the value of each item in the same order. Aligning the values of
+    two results must not search the items in the list for each item.
+"""
+
+
+class ItemsIndex(object):
+    """ Position of the items of a list
+
+        It works as list.index and the in operator, returning the position
+        of the first occurrence of an item, but in constant time.
+    """
+
+    def __init__(self, items = []):
+        self.items = []
+        self._positions = {}
+        for item in items:
+            self.append(item)
+
+    def append(self, item):
+        """ Add an item at the end of the index """
+        if item not in self._positions:
+            self._positions[item] = len(self.items)
+        self.items.append(item)
+
+    def index(self, item):
+        if item not in self._positions:
+            raise ValueError(repr(item) + " is not in list")
+        return self._positions[item]
+
+    def get(self, item, default = None):
+        return self._positions.get(item, default)
+
+    def __contains__(self, item):
+        return item in self._positions
+
+    def __len__(self):
+        return len(self.items)
+
+
+def get_items_values(items, data_items, values, default = 0):
+    """ Values in the order of items from values in the order of data_items """
+    index = ItemsIndex(data_items)
+    items_values = []
+    for item in items:
+        pos = index.get(item)
+        if pos is None: items_values.append(default)
+        else: items_values.append(values[pos])
+    return items_values
@@ -0,0 +1,222 @@
+## Copyright (C) 2014 Bitergia
+##
+## This program is free software; you can redistribute it and/or modify
+## it under the terms of the GNU General Public License as published by
+## the Free Software Foundation; either version 3 of the License, or
+## (at your option) any later version.
+##
+## This program is distributed in the hope that it will be useful,
+## but WITHOUT ANY WARRANTY; without even the implied warranty of
+## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+## GNU General Public License for more details.
+##
+## You should have received a copy of the GNU General Public License
+## along with this program; if not, write to the Free Software
+## Foundation, Inc., 59 Temple Place - Suite 330, Boston, MA 02111-1307, USA.
+##
+## This file is a part of GrimoireLib
+##  (an Python library for the MetricsGrimoire and vizGrimoire systems)
+##
+##
+## Authors:
+##   Alvaro del Castillo <acs@bitergia.com>
+
+""" Independent jobs (i.e. data sources, filter items) run in a pool of processes
+
+    Jobs run in forked worker processes with their own database
+    connections. The log records of the jobs are sent to the main process
+    and handled there by its logging configuration, with the name of the
+    job as prefix. A job that fails is logged and reported, but the rest
+    of jobs go on.
+
+    The stats kept per process (query log, query cache and metrics memo
+    hits) are sent back with the result
+    of each job and merged in the process that submitted it.
+"""
+
+import logging
+import multiprocessing
+import multiprocessing.pool
+import sys
+import threading
+import time
+import traceback
+
+import vizgrimoire.GrimoireSQL as GrimoireSQL
+from vizgrimoire.db_pool import forget_pools
+
+# Name of the job running in a worker process
+_job_name = None
+
+
+class _Process(multiprocessing.Process):
+    """ Worker process that can run its own pool of workers """
+
+    def _get_daemon(self):
+        return False
+
+    def _set_daemon(self, value):
+        pass
+
+    daemon = property(_get_daemon, _set_daemon)
+
+class _Pool(multiprocessing.pool.Pool):
+    Process = _Process
+
+class _QueueHandler(logging.Handler):
+    """ Send the log records of a worker to the main process """
+
+    def __init__(self, queue):
+        logging.Handler.__init__(self)
+        self.queue = queue
+
+    def emit(self, record):
+        try:
+            # Records must be pickable: format message and traceback here
+            message = record.getMessage()
+            if record.exc_info:
+                message += "\n" + self.formatter.formatException(record.exc_info)
+                record.exc_info = None
+            if _job_name is not None: message = "[" + _job_name + "] " + message
+            record.msg = message
+            record.args = None
+            self.queue.put(record)
+        except Exception:
+            self.handleError(record)
+
+def _log_records(queue):
+    """ Handle in the main process the log records from the workers """
+    while True:
+        record = queue.get()
+        if record is None: break
+        logging.getLogger(record.name).handle(record)
+
+def _init_worker(queue, level):
+    # Connections inherited from the main process can not be shared
+    forget_pools()
+    GrimoireSQL.channel = threading.local()
+    GrimoireSQL.default_pool = None
+
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+    handler = _QueueHandler(queue)
+    handler.setFormatter(logging.Formatter())
+    root.addHandler(handler)
+    root.setLevel(level)
+
+def _get_stats_objects():
+    """ Objects of this process with get_stats, reset_stats and merge_stats """
+    from vizgrimoire.metrics.query_builder import DSQuery
+    from vizgrimoire.metrics.metrics import Metrics
+    return {"query_log": DSQuery.query_log, "query_cache": DSQuery.cache,
+            "metrics_memo": Metrics.memo}
+
+def _get_stats():
+    return dict([(name, stats_object.get_stats())
+                 for (name, stats_object) in _get_stats_objects().items()
+                 if stats_object is not None])
+
+def _merge_stats(stats):
+    stats_objects = _get_stats_objects()
+    for (name, value) in stats.items():
+        if stats_objects.get(name) is not None: stats_objects[name].merge_stats(value)
+
+def _run_job(args):
+    global _job_name
+    (name, function, function_args) = args
+    _job_name = name
+    start = time.time()
+    try:
+        result = function(*function_args)
+        return (name, True, time.time() - start, result)
+    except Exception:
+        logging.error("Job failed:\n" + traceback.format_exc().rstrip())
+        return (name, False, time.time() - start, None)
+
+def _run_worker_job(args):
+    """ _run_job in a worker, adding the stats of the job to the result """
+    # Stats inherited from the parent or from previous jobs are not sent
+    for stats_object in _get_stats_objects().values():
+        if stats_object is not None: stats_object.reset_stats()
+    return _run_job(args) + (_get_stats(),)
+
+def _get_result(result):
+    """ Result of _run_worker_job without the stats, merged in this process """
+    _merge_stats(result[4])
+    return result[0:4]
+
+class _JobResult(object):
+    """ AsyncResult of a job, merging its stats when read """
+
+    def __init__(self, async_result):
+        self._async_result = async_result
+
+    def ready(self):
+        return self._async_result.ready()
+
+    def get(self):
+        return _get_result(self._async_result.get())
+
+class JobsPool(object):
+    """ Pool of processes running jobs
+
+        With new_process_per_job, each job runs in a new worker, which can
+        use map_jobs. Otherwise workers (and connections) are reused.
+    """
+
+    def __init__(self, processes, new_process_per_job = False):
+        # Forked workers must not inherit pending buffered output
+        sys.stdout.flush()
+        sys.stderr.flush()
+
+        self._queue = multiprocessing.Queue()
+        self._listener = threading.Thread(target=_log_records, args=(self._queue,))
+        self._listener.start()
+        initargs = (self._queue, logging.getLogger().getEffectiveLevel())
+        if new_process_per_job:
+            self._pool = _Pool(processes, _init_worker, initargs, 1)
+        else:
+            self._pool = multiprocessing.Pool(processes, _init_worker, initargs)
+
+    def map(self, function, jobs):
+        """ (name, ok, elapsed time, result) of each (name, args) job """
+        results = self._pool.map(_run_worker_job, [(name, function, args)
+                                                   for (name, args) in jobs],
+                                 chunksize=1)
+        return [_get_result(result) for result in results]
+
+    def submit(self, name, function, args):
+        """ Run a job. AsyncResult with (name, ok, elapsed time, result) """
+        return _JobResult(self._pool.apply_async(_run_worker_job, ((name, function, args),)))
+
+    def close(self):
+        """ Wait for the jobs submitted and stop the workers """
+        self._pool.close()
+        self._pool.join()
+        self._queue.put(None)
+        self._listener.join()
+
+def run_job(name, function, args):
+    """ Run a job in this process: (name, ok, elapsed time, result) """
+    return _run_job((name, function, args))
+
+def map_jobs(function, jobs, processes):
+    """ Results of function with the args of each (name, args) job
+
+        Jobs run in processes workers, reused between jobs, and the results
+        are in the order of jobs. Raises RuntimeError if any job failed,
+        once all of them are done.
+    """
+    if processes <= 1 or len(jobs) <= 1:
+        return [function(*args) for (name, args) in jobs]
+
+    pool = JobsPool(min(processes, len(jobs)))
+    try:
+        results = pool.map(function, jobs)
+    finally:
+        pool.close()
+    failed = [name for (name, ok, elapsed, result) in results if not ok]
+    if len(failed) > 0:
+        raise RuntimeError("Jobs failed: " + ", ".join(failed))
+    return [result for (name, ok, elapsed, result) in results]
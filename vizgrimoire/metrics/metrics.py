@@ -28,6 +28,8 @@ import logging
 from functools import wraps
 
 from vizgrimoire.GrimoireUtils import completePeriodIds, GetDates, GetPercentageDiff, check_array_values
+from vizgrimoire.GrimoireUtils import getRunPeriodAxis, getPeriodField, getPeriodPositions, getPeriodValues
+from vizgrimoire.items_index import ItemsIndex
 from vizgrimoire.metrics.query_builder import DSQuery
 from vizgrimoire.metrics.metrics_filter import MetricFilters
 
@@ -67,11 +69,22 @@ class Metrics(object):
     domains_limit = 30
     max_decimals = 2
     min_item_per_tag = 20
+    # metrics not supported in group_by trends queries
+    group_trends_not_supported = ['bmitickets']
+    # MetricsMemo shared by all instances. None to disable it.
+    memo = None
+    # Methods whose results are memoized
+    memoized_methods = ["get_agg", "get_ts", "get_trends", "get_trends_windows", "get_list"]
+    # Values of past periods change with the current state of the data
+    # (i.e. reviews still new): incremental reports compute all periods
+    state_dependent = False
 
     def __init__(self, dbcon = None, filters = None):
         """db connection and filter to be used"""
         self.db = dbcon
         self.filters = filters
+        for method in Metrics.memoized_methods:
+            setattr(self, method, self._memoize(method, getattr(self, method)))
         if filters == None:
             people_out = None
             organizations_out = None
@@ -82,6 +95,19 @@ class Metrics(object):
                                          type_analysis, 
                                          npeople, people_out, organizations_out)
 
+    @staticmethod
+    def set_memo(memo):
+        """ Set the MetricsMemo used for all metrics or None to disable it """
+        Metrics.memo = memo
+
+    def _memoize(self, method, function):
+        """ function (the bound method) using Metrics.memo when set """
+        @wraps(function)
+        def memoized(*args, **kwargs):
+            if Metrics.memo is None: return function(*args, **kwargs)
+            return Metrics.memo.call(self, method, function, args, kwargs)
+        return memoized
+
     def get_definition(self):
         def_ = {
                "id":self.id,
@@ -116,6 +142,13 @@ class Metrics(object):
 
         raise NotImplementedError
 
+    def _get_query(self, evolutionary):
+        """ Query for the metric, using the rollups tables if available """
+        from vizgrimoire.rollups import get_rollup_query
+        query = get_rollup_query(self, evolutionary)
+        if query is None: query = self._get_sql(evolutionary)
+        return query
+
     def _get_sql_filter_all (self, evolutionary):
         """ Returns specific sql for the provided filters """
         raise NotImplementedError
@@ -145,9 +178,10 @@ class Metrics(object):
                 ts[field].append([])
 
         # Fill items data
+        id_fields_index = ItemsIndex(id_fields)
         for i in range(0, len(data[id_field])):
             item = data[id_field][i]
-            pos = id_fields.index(item)
+            pos = id_fields_index.index(item)
             for field in fields:
                 ts[field][pos].append(data[field][i])
         return ts
@@ -160,23 +194,27 @@ class Metrics(object):
         if id_field not in data:
             raise Exception(id_field + " not in " + str(data))
 
+        period_field = getPeriodField(data, period)
+        if period_field is None:
+            raise Exception(period + " not in " + str(data))
         metrics.remove(id_field)
-        metrics.remove(period)
+        metrics.remove(period_field)
         ts[id_field] = data[id_field]
         for metric in metrics:
             ts[metric] = []
+        if len(ts[id_field]) == 0: return ts
 
+        (ids, unixtime, dates, id_list) = getRunPeriodAxis(period, startdate, enddate)
         for i in range (0, len(ts[id_field])):
+            # The positions of the periods are the same for all metrics
+            positions = getPeriodPositions(ids, data[period_field][i])
             for metric in metrics:
-                # Standard time series for each metric and convert
-                metric_ts = {}
-                metric_ts[metric] = data[metric][i]
-                metric_ts[period] = data[period][i]
-                metric_ts = completePeriodIds(metric_ts, period, startdate, enddate)
-                ts[metric].append(metric_ts[metric])
-                # Add additional time series fields: unixtime
-                metric_ts.pop(metric) # just time series generic fields
-                ts = dict(ts.items()+metric_ts.items())
+                ts[metric].append(getPeriodValues(data[metric][i], positions))
+        # Additional time series fields shared by all items and metrics
+        ts[period_field] = ids
+        ts['unixtime'] = unixtime
+        ts['date'] = dates
+        ts['id'] = id_list
         return ts
 
     def get_ts (self):
@@ -191,7 +229,7 @@ class Metrics(object):
 
         """
 
-        query = self._get_sql(True)
+        query = self._get_query(True)
         ts = self.db.ExecuteQuery(query)
         if self.filters.type_analysis and self.filters.type_analysis[1] is None:
             id_field = self.db.get_group_field_alias(self.filters.type_analysis[0])
@@ -205,7 +243,7 @@ class Metrics(object):
 
     def get_agg(self):
         """ Returns an aggregated value """
-        q = self._get_sql(False)
+        q = self._get_query(False)
         return self.db.ExecuteQuery(q)
 
 
@@ -245,6 +283,48 @@ class Metrics(object):
         self.filters = filters
         return (data)
 
+    def get_trends_windows(self, date, days_list):
+        """ Returns the trend metrics for all days in days_list
+
+            All windows are computed in one query when the metric query
+            supports it, using get_trends for each window otherwise.
+        """
+        from vizgrimoire.metrics.query_planner import TrendsPlanner
+        data = TrendsPlanner(self).get_trends(date, days_list)
+        if data is not None: return data
+
+        data = {}
+        group_field = None
+        if self.filters.type_analysis and self.filters.type_analysis[1] is None:
+            group_field = self.db.get_group_field_alias(self.filters.type_analysis[0])
+        for days in days_list:
+            period_data = self.get_trends(date, days)
+            if group_field is None or group_field not in period_data:
+                data = dict(data.items() + period_data.items())
+            else:
+                data = Metrics._merge_trends_items(data, period_data, group_field)
+        return data
+
+    @staticmethod
+    def _merge_trends_items(data, period_data, group_field):
+        """ Merge GROUP BY trends sharing the items list, filling with 0 """
+        if group_field not in data:
+            return dict(data.items() + period_data.items())
+        positions = dict((item, pos) for (pos, item) in enumerate(data[group_field]))
+        fields = [field for field in data if field != group_field]
+        for item in period_data[group_field]:
+            if item in positions: continue
+            positions[item] = len(data[group_field])
+            data[group_field].append(item)
+            for field in fields: data[field].append(0)
+        for field in period_data:
+            if field == group_field: continue
+            values = [0] * len(data[group_field])
+            for (item, value) in zip(period_data[group_field], period_data[field]):
+                values[positions[item]] = value
+            data[field] = values
+        return data
+
     def _get_trends_all_items(self, date, days):
         """ Returns the trend metrics between now and now-days values """
         from vizgrimoire.GrimoireUtils import check_array_values
@@ -252,10 +332,7 @@ class Metrics(object):
         # Keeping state of origin filters
         filters = self.filters
 
-        # metrics not supported in group_by queries
-        metrics_not_supported = ['bmitickets']
-
-        if self.id in metrics_not_supported:
+        if self.id in Metrics.group_trends_not_supported:
             logging.warning(self.id + " not supported in GROUP BY queries.")
             return {}
 
@@ -278,24 +355,17 @@ class Metrics(object):
         if field == group_field: field = prev.keys()[1]
 
         # We need to build a new dict with trends
-        # First, we need to find all possible keys
-        items = list(set(prev[group_field] + last[group_field]))
-        # Complete prev and last adding missing (0) values
-        for item in items:
-            if item not in prev[group_field]:
+        # Complete prev adding missing (0) values for items only in last
+        prev_items = set(prev[group_field])
+        for item in last[group_field]:
+            if item not in prev_items:
                 prev[field].append(0)
                 prev[group_field].append(item)
-            if item not in last[group_field]:
-                last[field].append(0)
-                last[group_field].append(item)
         # Recreate last so the items are in the same order than prev
+        last_values = dict(zip(last[group_field], last[field]))
         last_ordered = {}
-        last_ordered[field] = []
-        last_ordered[group_field] = []
-        for item in prev[group_field]:
-            last_ordered[group_field].append(item)
-            pos = last[group_field].index(item)
-            last_ordered[field].append(last[field][pos])
+        last_ordered[field] = [last_values.get(item, 0) for item in prev[group_field]]
+        last_ordered[group_field] = list(prev[group_field])
 
         # Create the dict with trend metrics
         data = {}
@@ -178,3 +178,14 @@ class MetricFilters(object):
                                 self.global_filter)
         return newcopy
 
+
+    def get_key(self):
+        """ Hashable key with all the fields that change the results """
+        def freeze(value):
+            if isinstance(value, list): return tuple([freeze(v) for v in value])
+            return value
+        return (self.period, self.startdate, self.enddate,
+                freeze(self.type_analysis), self.npeople,
+                freeze(self.people_out), freeze(self.companies_out),
+                freeze(self.organizations_out), freeze(self.global_filter),
+                self.closed_condition)
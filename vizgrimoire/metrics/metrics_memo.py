@@ -0,0 +1,148 @@
+## Copyright (C) 2014 Bitergia
+##
+## This program is free software; you can redistribute it and/or modify
+## it under the terms of the GNU General Public License as published by
+## the Free Software Foundation; either version 3 of the License, or
+## (at your option) any later version.
+##
+## This program is distributed in the hope that it will be useful,
+## but WITHOUT ANY WARRANTY; without even the implied warranty of
+## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+## GNU General Public License for more details.
+##
+## You should have received a copy of the GNU General Public License
+## along with this program; if not, write to the Free Software
+## Foundation, Inc., 59 Temple Place - Suite 330, Boston, MA 02111-1307, USA.
+##
+## This file is a part of GrimoireLib
+##  (an Python library for the MetricsGrimoire and vizGrimoire systems)
+##
+##
+## Authors:
+##   Alvaro del Castillo <acs@bitergia.com>
+
+""" Memo of the metrics results computed during a run
+
+    The report phases (evolutionary, aggregated, tops, filters) ask
+    several times for the same metric with the same filters. The results
+    are kept in memory during the run, keyed by the metric class, its
+    databases, the normalized MetricFilters and the method (get_agg, get_ts,
+    get_trends_windows, get_list...) with its arguments.
+
+    Callers modify the data they get (i.e. createJSON rounds values), so
+    copies are stored and returned.
+
+    The memo lives in the memory of a process. With report_tool --jobs each
+    task runs in a new process, so results are only reused within a task
+    (i.e. a data source and its filters), not between tasks. The hits and
+    misses of the tasks are added to the main process memo.
+"""
+
+import copy
+import logging
+import threading
+
+from vizgrimoire.metrics.metrics_filter import MetricFilters
+
+
+class MetricsMemo(object):
+    """ In memory results of metrics methods """
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self._values = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _get_arg_key(arg):
+        if isinstance(arg, MetricFilters): return arg.get_key()
+        if isinstance(arg, list): return tuple([MetricsMemo._get_arg_key(a) for a in arg])
+        return arg
+
+    @staticmethod
+    def get_key(metric, method, args = (), kwargs = {}):
+        """ Key of a method call of a metric with its current filters """
+        db = metric.db
+        databases = (getattr(db, "database", None), getattr(db, "identities_db", None),
+                     getattr(db, "projects_db", None))
+        filters = None
+        if metric.filters is not None: filters = metric.filters.get_key()
+        args = tuple([MetricsMemo._get_arg_key(arg) for arg in args])
+        kwargs = tuple(sorted([(name, MetricsMemo._get_arg_key(value))
+                               for (name, value) in kwargs.items()]))
+        return (type(metric), databases, filters, method, args, kwargs)
+
+    def has_key(self, key):
+        try:
+            return key in self._values
+        except TypeError:
+            # Not hashable key: not memoized
+            return False
+
+    def get(self, key):
+        """ (True, value) for a memoized key, (False, None) otherwise """
+        self._lock.acquire()
+        try:
+            if key not in self._values:
+                self.misses += 1
+                return (False, None)
+            self.hits += 1
+            value = self._values[key]
+        finally:
+            self._lock.release()
+        return (True, copy.deepcopy(value))
+
+    def put(self, key, value):
+        try:
+            hash(key)
+        except TypeError:
+            # Not hashable key: not memoized
+            return
+        value = copy.deepcopy(value)
+        self._lock.acquire()
+        try:
+            self._values[key] = value
+        finally:
+            self._lock.release()
+
+    def call(self, metric, method, function, args, kwargs):
+        """ Memoized result of function, the method of metric, with args """
+        try:
+            key = MetricsMemo.get_key(metric, method, args, kwargs)
+            hash(key)
+        except TypeError:
+            # Not hashable args: not memoized
+            return function(*args, **kwargs)
+        (found, value) = self.get(key)
+        if found: return value
+        value = function(*args, **kwargs)
+        self.put(key, value)
+        return value
+
+    def clear(self):
+        self._lock.acquire()
+        try:
+            self._values = {}
+        finally:
+            self._lock.release()
+
+    def get_stats(self):
+        return [self.hits, self.misses]
+
+    def reset_stats(self):
+        self.hits = 0
+        self.misses = 0
+
+    def merge_stats(self, stats):
+        """ Add the hits and misses of other process """
+        self._lock.acquire()
+        try:
+            self.hits += stats[0]
+            self.misses += stats[1]
+        finally:
+            self._lock.release()
+
+    def log_stats(self):
+        logging.info("Metrics memo: %i hits, %i misses, %i results" %
+                     (self.hits, self.misses, len(self._values)))
@@ -22,21 +22,51 @@
 ##   Alvaro del Castillo <acs@bitergia.com>
 
 import logging
-import MySQLdb
 import re
 import sys
 from sets import Set
 import datetime
 import time
 
+import numpy
+import MySQLdb
+from MySQLdb.constants import FIELD_TYPE
+
+from vizgrimoire.db_pool import get_pool
 from vizgrimoire.metrics.metrics_filter import MetricFilters
 from vizgrimoire.GrimoireUtils import genDates
 from vizgrimoire.datahandlers.data_handler import DHESA
 
+# NumPy types used for MySQL column types in columnar results.
+# Not included types are returned as object arrays.
+COLUMNAR_DTYPES = {
+    FIELD_TYPE.TINY:'int64',
+    FIELD_TYPE.SHORT:'int64',
+    FIELD_TYPE.LONG:'int64',
+    FIELD_TYPE.INT24:'int64',
+    FIELD_TYPE.LONGLONG:'int64',
+    FIELD_TYPE.YEAR:'int64',
+    FIELD_TYPE.DECIMAL:'float64',
+    FIELD_TYPE.NEWDECIMAL:'float64',
+    FIELD_TYPE.FLOAT:'float64',
+    FIELD_TYPE.DOUBLE:'float64',
+    FIELD_TYPE.DATETIME:'datetime64[s]',
+    FIELD_TYPE.TIMESTAMP:'datetime64[s]',
+    FIELD_TYPE.DATE:'datetime64[D]',
+    FIELD_TYPE.NEWDATE:'datetime64[D]'
+}
+
 class DSQuery(object):
     """ Generic methods to control access to db """
 
-    db_conn_pool = {} # one connection per database
+    # QueryCache shared by all instances. None to disable it.
+    cache = None
+    # QueryLog for all queries, also the GrimoireSQL ones. None to disable it.
+    query_log = None
+    # Indexes used by the queries: (table, [columns])
+    indexes = []
+    # (query builder class, database) with indexes already created
+    _indexes_checked = Set([])
 
     def __init__(self, user, password, database,
                  identities_db = None, projects_db = None,
@@ -49,22 +79,79 @@ class DSQuery(object):
         self.host = host
         self.port = port
         self.group = group
-        if database in DSQuery.db_conn_pool:
-            db = DSQuery.db_conn_pool[database]
-        else:
-            db = self.__SetDBChannel__(user, password, database, host, port, group)
-            DSQuery.db_conn_pool[database] = db
-        self.cursor = db.cursor()
-        self.cursor.execute("SET NAMES 'utf8'")
-
-        db = self.__SetDBChannel__(user, password, database, host, port, group)
+        # connections are shared with all DSQuery using the same database
+        self.pool = get_pool(user, password, database, host, port, group)
 
-        self.create_indexes()
+        # Once per database, not for each metric using it
+        indexes_key = (self.__class__, database, host, port, group)
+        if indexes_key not in DSQuery._indexes_checked:
+            DSQuery._indexes_checked.add(indexes_key)
+            self.create_indexes()
 
     def create_indexes(self):
         """ Basic indexes used in each data source """
         pass
 
+    @staticmethod
+    def get_index_name(table, columns):
+        return table + "_" + "_".join(columns) + "_idx"
+
+    def get_existing_indexes(self):
+        """ Dict with the columns of all the indexes of each table """
+        q = """
+            SELECT t.table_name AS table_name, s.index_name AS index_name,
+                   s.column_name AS column_name
+            FROM information_schema.tables t
+            LEFT JOIN information_schema.statistics s
+              ON s.table_schema = t.table_schema AND s.table_name = t.table_name
+            WHERE t.table_schema = '%s'
+            ORDER BY t.table_name, s.index_name, s.seq_in_index
+            """ % (self.database)
+        indexes = {}
+        for row in self.ExecuteQueryStream(q):
+            table = row['table_name'].lower()
+            if table not in indexes: indexes[table] = {}
+            if row['index_name'] is None: continue
+            columns = indexes[table].setdefault(row['index_name'], [])
+            columns.append(row['column_name'].lower())
+        return indexes
+
+    def get_missing_indexes(self):
+        """ Declared indexes not covered by an existing index
+
+            An index is covered if an existing one starts with its columns.
+            Indexes of tables not found in the database are ignored.
+        """
+        existing = self.get_existing_indexes()
+        missing = []
+        for (table, columns) in self.indexes:
+            if table.lower() not in existing: continue
+            columns_lower = [column.lower() for column in columns]
+            covered = False
+            for index_columns in existing[table.lower()].values():
+                if index_columns[0:len(columns)] == columns_lower:
+                    covered = True
+                    break
+            if not covered: missing.append((table, columns))
+        return missing
+
+    def create_missing_indexes(self):
+        """ Create the missing indexes without locking the tables if possible """
+        missing = self.get_missing_indexes()
+        for (table, columns) in missing:
+            name = DSQuery.get_index_name(table, columns)
+            logging.info("Creating index " + name + " in " + self.database)
+            q = "ALTER TABLE %s ADD INDEX %s (%s), ALGORITHM=INPLACE, LOCK=NONE" % \
+                (table, name, ",".join(columns))
+            try:
+                self.ExecuteViewQuery(q)
+            except MySQLdb.Error, e:
+                # Engines or servers without online DDL
+                logging.info("Online index creation not supported: " + str(e))
+                q = "CREATE INDEX %s ON %s (%s)" % (name, table, ",".join(columns))
+                self.ExecuteViewQuery(q)
+        return missing
+
     @classmethod
     def GetSQLGlobal(cls, date, fields, tables, filters, start, end, all_items = None):
         group_field = None
@@ -101,8 +188,8 @@ class DSQuery(object):
 
         iso_8601_mode = 3
         if (period == 'day'):
-            # Remove time so unix timestamp is start of day    
-            fields = 'UNIX_TIMESTAMP(DATE('+date+')) AS unixtime'
+            # Days since year 0: the same in any time zone, not as UNIX_TIMESTAMP
+            fields = 'TO_DAYS('+date+') AS day'
         elif (period == 'week'):
             fields = 'YEARWEEK('+date+','+str(iso_8601_mode)+') AS week'
         elif (period == 'month'):
@@ -212,40 +299,152 @@ class DSQuery(object):
                                   startdate, enddate, all_items)
         return(q)
 
-    def __SetDBChannel__ (self, user=None, password=None, database=None,
-                      host="127.0.0.1", port=3306, group=None):
-        if (group == None):
-            db = MySQLdb.connect(user=user, passwd=password,
-                                 db=database, host=host, port=port)
-        else:
-            db = MySQLdb.connect(read_default_group=group, db=database)
-
-        return db
-
-    def ExecuteQuery (self, sql):
-        if sql is None: return {}
-        # print sql
+    @staticmethod
+    def _fetch_result(cursor):
+        """ Pivot the rows in cursor to a dict with a list of values per column """
         result = {}
-        self.cursor.execute(sql)
-        rows = self.cursor.rowcount
-        columns = self.cursor.description
+        rows = cursor.rowcount
+        columns = cursor.description
 
         if columns is None: return result
 
         for column in columns:
             result[column[0]] = []
         if rows > 1:
-            for value in self.cursor.fetchall():
+            for value in cursor.fetchall():
                 for (index,column) in enumerate(value):
                     result[columns[index][0]].append(column)
         elif rows == 1:
-            value = self.cursor.fetchone()
+            value = cursor.fetchone()
             for i in range (0, len(columns)):
                 result[columns[i][0]] = value[i]
         return result
 
+    @staticmethod
+    def set_cache(cache):
+        """ Set the QueryCache used for all queries or None to disable it """
+        DSQuery.cache = cache
+
+    @staticmethod
+    def set_query_log(query_log):
+        """ Set the QueryLog used for all queries or None to disable it """
+        DSQuery.query_log = query_log
+
+    @staticmethod
+    def _execute(pool, sql):
+        """ Dict with the results of sql, logging the query if enabled """
+        start = time.time()
+        cursor = pool.execute(sql)
+        try:
+            query_time = time.time() - start
+            result = DSQuery._fetch_result(cursor)
+            rows = cursor.rowcount
+        finally:
+            cursor.close()
+            pool.checkin()
+        if DSQuery.query_log is not None:
+            DSQuery.query_log.record(pool, sql, query_time, rows,
+                                     time.time() - start - query_time)
+        return result
+
+    @staticmethod
+    def _execute_columnar(pool, sql):
+        """ Columnar results of sql, logging the query if enabled """
+        start = time.time()
+        result = DSQuery._fetch_columnar(pool, sql)
+        if DSQuery.query_log is not None:
+            rows = 0
+            if len(result) > 0: rows = len(result.values()[0])
+            # Rows are converted while read so there is no pivot time
+            DSQuery.query_log.record(pool, sql, time.time() - start, rows)
+        return result
+
+    @staticmethod
+    def _get_column_array(values, dtype):
+        if dtype == 'int64' and None in values:
+            # NULL values are not supported in integer arrays
+            dtype = 'float64'
+        return numpy.array(values, dtype=dtype)
+
+    @staticmethod
+    def _fetch_columnar(pool, sql, chunk_size = 10000):
+        """ Dict with a typed NumPy array per column with the results of sql
+
+            Rows are read in chunks from a server side cursor and converted
+            to arrays, so only chunk_size rows are boxed at the same time.
+        """
+        result = {}
+        chunks = None
+        for description, rows in pool.stream(sql, chunk_size):
+            if chunks is None:
+                dtypes = [COLUMNAR_DTYPES.get(column[1], 'object')
+                          for column in description]
+                chunks = [[] for column in description]
+            for (index, dtype) in enumerate(dtypes):
+                values = [row[index] for row in rows]
+                chunks[index].append(DSQuery._get_column_array(values, dtype))
+        if chunks is None: return result
+
+        for (index, column) in enumerate(description):
+            if len(chunks[index]) == 1: result[column[0]] = chunks[index][0]
+            else: result[column[0]] = numpy.concatenate(chunks[index])
+        return result
+
+    def ExecuteQuery (self, sql, columnar = False):
+        """ Execute sql and return a dict with the values of each column
+
+            Columns with just one row contain the value and not a list. With
+            columnar, each column is a typed NumPy array (int64, float64,
+            datetime64 or object) whatever the number of rows.
+        """
+        if sql is None: return {}
+        # print sql
+        if columnar: return DSQuery._execute_columnar(self.pool, sql)
+
+        cache = DSQuery.cache
+        if cache is not None and cache.is_cacheable(sql) and cache.has_fingerprint(self):
+            result = cache.get(self, sql)
+            if result is not None: return result
+        else:
+            cache = None
+
+        result = DSQuery._execute(self.pool, sql)
+
+        if cache is not None: cache.put(self, sql, result)
+        return result
+
+    @staticmethod
+    def _stream_result(pool, sql, chunk_size = None):
+        """ Generator of rows (dicts) or column chunks from a server side cursor """
+        size = chunk_size
+        if size is None: size = 1000
+        for description, rows in pool.stream(sql, size):
+            if not rows: break
+            columns = [column[0] for column in description]
+            if chunk_size is None:
+                for row in rows:
+                    yield dict(zip(columns, row))
+            else:
+                chunk = {}
+                for (index, column) in enumerate(columns):
+                    chunk[column] = [row[index] for row in rows]
+                yield chunk
+
+    def ExecuteQueryStream (self, sql, chunk_size = None):
+        """ Generator of the results of sql without loading them in memory
+
+            Rows are read from the server while they are consumed. If
+            chunk_size is None, a dict per row is returned. If not, dicts
+            with lists of up to chunk_size values per column, like the ones
+            returned by ExecuteQuery, are returned.
+        """
+        if sql is None: return iter([])
+        return DSQuery._stream_result(self.pool, sql, chunk_size)
+
     def ExecuteViewQuery(self, sql):
-        self.cursor.execute(sql)
+        cursor = self.pool.execute(sql)
+        cursor.close()
+        self.pool.checkin()
 
     def get_subprojects(self, project):
         """ Return all subprojects ids for a project in a string join by comma """
@@ -292,13 +491,15 @@ class DSQuery(object):
         field = None
         supported = ['people2','company','country','domain','project','repository',
                      'company'+MetricFilters.DELIMITER+'country',
-                     'company'+MetricFilters.DELIMITER+'project',]
+                     'company'+MetricFilters.DELIMITER+'project','uuid']
 
         analysis = filter_type
 
         if analysis not in supported:
             raise Exception("Can't get_group_field for " +  filter_type)
         if analysis == 'people2': field = "up.identifier"
+        # batched people activity queries
+        elif analysis == 'uuid': field = "pup.uuid"
         elif analysis == "company": field = "org.name"
         elif analysis == "country": field = "cou.name"
         # elif analysis == "domain": field = "d.name"
@@ -429,6 +630,16 @@ class DSQuery(object):
 class SCMQuery(DSQuery):
     """ Specific query builders for source code management system data source """
 
+    indexes = [("scmlog", ["author_date"]),
+               ("scmlog", ["rev"]),
+               ("scmlog", ["author_id"]),
+               ("scmlog", ["committer_id"]),
+               ("scmlog", ["repository_id"]),
+               ("actions", ["commit_id"]),
+               ("commits_lines", ["commit_id"]),
+               ("people_uidentities", ["people_id"]),
+               ("people_uidentities", ["uuid"])]
+
     def GetSQLRepositoriesFrom (self):
         """ Tables needed for repository studies
 
@@ -944,6 +1155,17 @@ class SCMQuery(DSQuery):
 
 class ITSQuery(DSQuery):
     """ Specific query builders for issue tracking system data source """
+
+    indexes = [("issues", ["submitted_on"]),
+               ("issues", ["submitted_by"]),
+               ("issues", ["tracker_id"]),
+               ("changes", ["changed_on", "issue_id"]),
+               ("changes", ["issue_id"]),
+               ("changes", ["changed_by"]),
+               ("comments", ["issue_id"]),
+               ("people_uidentities", ["people_id"]),
+               ("people_uidentities", ["uuid"])]
+
     def GetSQLRepositoriesFrom (self):
         # tables necessary for repositories 
         tables = Set([])
@@ -1294,6 +1516,15 @@ class ITSQuery(DSQuery):
 
 class MLSQuery(DSQuery):
     """ Specific query builders for mailing lists data source """
+
+    indexes = [("messages", ["first_date", "is_response_of"]),
+               ("messages", ["is_response_of"]),
+               ("messages", ["mailing_list_url"]),
+               ("messages_people", ["message_id"]),
+               ("messages_people", ["email_address"]),
+               ("people_uidentities", ["people_id"]),
+               ("people_uidentities", ["uuid"])]
+
     def GetSQLRepositoriesFrom (self):
         # tables necessary for repositories
         #return (" messages m ") 
@@ -1592,6 +1823,16 @@ class MLSQuery(DSQuery):
 class SCRQuery(DSQuery):
     """ Specific query builders for source code review source"""
 
+    indexes = [("issues", ["submitted_on"]),
+               ("issues", ["submitted_by"]),
+               ("issues", ["tracker_id"]),
+               ("issues", ["status"]),
+               ("changes", ["changed_on", "issue_id"]),
+               ("changes", ["issue_id"]),
+               ("changes", ["changed_by"]),
+               ("people_uidentities", ["people_id"]),
+               ("people_uidentities", ["uuid"])]
+
     def GetSQLRepositoriesFrom (self):
         #tables necessaries for repositories
         tables = Set([])
@@ -2408,6 +2649,12 @@ class SCRQuery(DSQuery):
 
 class IRCQuery(DSQuery):
 
+    indexes = [("irclog", ["date"]),
+               ("irclog", ["nick"]),
+               ("irclog", ["channel_id"]),
+               ("people_uidentities", ["people_id"]),
+               ("people_uidentities", ["uuid"])]
+
     def GetSQLRepositoriesFrom (self):
         # tables necessary for repositories
         fields = Set([])
@@ -2610,6 +2857,11 @@ class IRCQuery(DSQuery):
 
 class MediawikiQuery(DSQuery):
 
+    indexes = [("wiki_pages_revs", ["date"]),
+               ("wiki_pages_revs", ["user"]),
+               ("people_uidentities", ["people_id"]),
+               ("people_uidentities", ["uuid"])]
+
     def GetSQLPeople2Where(self, name = None):
         # filters necessary to organizations analysis
         filters = Set([])
@@ -2669,30 +2921,15 @@ class MediawikiQuery(DSQuery):
 class QAForumsQuery(DSQuery):
     """ Specific query builders for question and answer platforms """
 
+    indexes = [("answers", ["question_identifier"]),
+               ("questionstags", ["question_identifier"]),
+               ("tags", ["tag"])]
+
     def create_indexes(self):
         try:
-            q = "create index q_id_a_idx on answers (question_identifier)"
-            self.ExecuteQuery(q)
-        except Exception:
-            pass
-            # logging.info("Indexes for QAForums already created")
-            # import traceback
-            # traceback.print_exc(file=sys.stdout)
-        try:
-            q = "create index q_id_qt_idx on questionstags (question_identifier)"
-            self.ExecuteQuery(q)
-        except:
-            pass
-        try:
-            q = "create index tag_id_qt_idx on questionstags (question_identifier)"
-            self.ExecuteQuery(q)
-        except:
-            pass
-        try:
-            q = "create index tag_idx_t on tags (tag)"
-            self.ExecuteQuery(q)
-        except:
-            pass
+            self.create_missing_indexes()
+        except MySQLdb.Error, e:
+            logging.info("Indexes for QAForums not created: " + str(e))
 
     def GetSQLReportFrom(self, type_analysis):
         # generic function to generate "from" clauses
@@ -3168,16 +3405,13 @@ class PullpoQuery(DSQuery):
 
         #Building the query
         timeto_sql = self.GetTimeToSQL(metric_filters, closed_field, metric_name)
-        data = self.ExecuteQuery(timeto_sql)
+        data = self.ExecuteQuery(timeto_sql, columnar = True)
 
         #Calculating specific statistical values
-        median = 0.0
-        mean = 0.0
-        if isinstance(data[metric_name], list):
-            stats_data = DHESA(data[metric_name])
-            to_days = 3600*24
-            median = round(stats_data.data["median"] / to_days, 2)
-            mean = round(stats_data.data["mean"] / to_days, 2)
+        stats_data = DHESA(data[metric_name])
+        to_days = 3600*24
+        median = round(stats_data.data["median"] / to_days, 2)
+        mean = round(stats_data.data["mean"] / to_days, 2)
 
         agg_data = {}
         agg_data["timeto_"+value+"_median"] = median
@@ -0,0 +1,362 @@
+## Copyright (C) 2014 Bitergia
+##
+## This program is free software; you can redistribute it and/or modify
+## it under the terms of the GNU General Public License as published by
+## the Free Software Foundation; either version 3 of the License, or
+## (at your option) any later version.
+##
+## This program is distributed in the hope that it will be useful,
+## but WITHOUT ANY WARRANTY; without even the implied warranty of
+## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+## GNU General Public License for more details.
+##
+## You should have received a copy of the GNU General Public License
+## along with this program; if not, write to the Free Software
+## Foundation, Inc., 59 Temple Place - Suite 330, Boston, MA 02111-1307, USA.
+##
+## This file is a part of GrimoireLib
+##  (an Python library for the MetricsGrimoire and vizGrimoire systems)
+##
+##
+## Authors:
+##   Alvaro del Castillo <acs@bitergia.com>
+
+""" Query planner that computes several metrics with a single SQL query
+
+    Most core metrics of a data source build their query with the same
+    FROM and WHERE parts (GetSQLReportFrom/GetSQLReportWhere) and only change
+    the aggregated fields. Metrics whose tables, filters and dates are
+    identical are grouped in one SELECT with all their fields, and the
+    result is split back in the values each metric would have returned.
+"""
+
+import logging
+import re
+from sets import Set
+
+from vizgrimoire.GrimoireUtils import completePeriodIds, check_array_values, GetDates, GetPercentageDiff
+from vizgrimoire.metrics.metrics import Metrics
+from vizgrimoire.metrics.metrics_filter import MetricFilters
+from vizgrimoire.rollups import get_rollup_query
+
+class QueryRecorder(object):
+    """ DSQuery proxy that records the BuildQuery call done by a metric """
+
+    def __init__(self, db):
+        self._db = db
+        self.calls = []
+        # Returned instead of the query. It will not be the result of
+        # _get_sql if the metric modifies the query after building it.
+        self.marker = "/* recorded */"
+
+    def __getattr__(self, name):
+        return getattr(self._db, name)
+
+    def BuildQuery (self, period, startdate, enddate, date_field, fields,
+                    tables, filters, evolutionary, type_analysis = None):
+        self.calls.append((period, startdate, enddate, date_field,
+                           fields, tables, filters, evolutionary, type_analysis))
+        return self.marker
+
+
+class QueryPlanner(object):
+    """ Group metrics that can be computed in the same SQL query """
+
+    alias_re = re.compile(r"\s+as\s+`?(\w+)`?\s*$", re.IGNORECASE)
+
+    def __init__(self, metrics, evolutionary):
+        self.metrics = metrics
+        self.evolutionary = evolutionary
+
+    def _is_standard(self, metric):
+        """ Metrics using Metrics get_ts/get_agg with its _get_sql """
+        if self.evolutionary: method = "get_ts"
+        else: method = "get_agg"
+        if get_rollup_query(metric, self.evolutionary) is not None: return False
+        return getattr(type(metric), method).im_func is getattr(Metrics, method).im_func
+
+    def _get_query_parts(self, metric):
+        """ Return (key, fields, aliases) for the query of the metric or None """
+        if not self._is_standard(metric): return None
+        recorder = QueryRecorder(metric.db)
+        db = metric.db
+        metric.db = recorder
+        try:
+            try:
+                q = metric._get_sql(self.evolutionary)
+            except NotImplementedError:
+                return None
+        finally:
+            metric.db = db
+
+        if q is not recorder.marker or len(recorder.calls) != 1: return None
+        (period, startdate, enddate, date_field, fields, tables, filters,
+         evolutionary, type_analysis) = recorder.calls[0]
+        if not isinstance(fields, Set): return None
+
+        aliases = []
+        for field in fields:
+            alias = QueryPlanner.alias_re.search(field)
+            if alias is None: return None
+            aliases.append(alias.group(1))
+            if not evolutionary and type_analysis is not None and type_analysis[1] is None:
+                # GetSQLGlobal orders all the items by the third word of the
+                # fields, that must be the alias whatever the first field is
+                words = field.split(" ")
+                if len(words) != 3 or words[1].lower() != "as": return None
+
+        if type_analysis is not None: type_analysis = tuple(type_analysis)
+        key = (db.database, period, startdate, enddate, date_field.strip(),
+               frozenset(tables), frozenset(filters), evolutionary, type_analysis)
+        return (key, fields, aliases)
+
+    def get_groups(self):
+        """ List of lists of (metric, fields, aliases) sharing a query """
+        groups = {}
+        order = []
+        for metric in self.metrics:
+            parts = self._get_query_parts(metric)
+            if parts is None: continue
+            key, fields, aliases = parts
+            if key not in groups:
+                groups[key] = []
+                order.append(key)
+            # Fields with the same name can not be split later
+            used = [alias for m in groups[key] for alias in m[2]]
+            if len([alias for alias in aliases if alias in used]) > 0: continue
+            groups[key].append((metric, fields, aliases))
+        return [groups[key] for key in order if len(groups[key]) > 1]
+
+    def _get_group_values(self, group):
+        metric = group[0][0]
+        fields = Set([])
+        all_aliases = []
+        for (m, mfields, aliases) in group:
+            fields.union_update(mfields)
+            all_aliases += aliases
+
+        # Tables and filters are the same for all metrics of the group
+        recorder = QueryRecorder(metric.db)
+        db = metric.db
+        metric.db = recorder
+        try:
+            metric._get_sql(self.evolutionary)
+        finally:
+            metric.db = db
+        (period, startdate, enddate, date_field, mfields, tables, sql_filters,
+         evolutionary, type_analysis) = recorder.calls[0]
+
+        q = db.BuildQuery(period, startdate, enddate, date_field, fields,
+                          tables, sql_filters, evolutionary, type_analysis)
+        logging.info("Computing " + ",".join([m[0].id for m in group]) + " in one query")
+        data = db.ExecuteQuery(q)
+
+        # Period and GROUP BY fields are shared by all metrics
+        shared = [column for column in data if column not in all_aliases]
+        values = {}
+        for (m, mfields, aliases) in group:
+            mvalue = {}
+            for column in shared + aliases:
+                # Empty results have no columns at all
+                if column not in data: continue
+                # Each metric gets its own lists: they are filled in place
+                if isinstance(data[column], list): mvalue[column] = list(data[column])
+                else: mvalue[column] = data[column]
+            if self.evolutionary:
+                mvalue = QueryPlanner._complete_ts(m, mvalue)
+            values[m.id] = mvalue
+        return values
+
+    @staticmethod
+    def _complete_ts(metric, ts):
+        """ Same post processing than Metrics.get_ts """
+        if metric.filters.type_analysis and metric.filters.type_analysis[1] is None:
+            id_field = metric.db.get_group_field_alias(metric.filters.type_analysis[0])
+            ts = Metrics._convert_group_to_ts(ts, id_field)
+            ts = Metrics._complete_period_ids_items(ts, id_field, metric.filters.period,
+                                                    metric.filters.startdate,
+                                                    metric.filters.enddate)
+        else:
+            ts = completePeriodIds(ts, metric.filters.period,
+                                   metric.filters.startdate, metric.filters.enddate)
+        return ts
+
+    def get_values(self):
+        """ Dict with the values of the metrics computed in shared queries
+
+            Metrics not included must be computed on their own.
+        """
+        values = {}
+        for group in self.get_groups():
+            values.update(self._get_group_values(group))
+        return values
+
+
+class TrendsPlanner(object):
+    """ Trends of a metric for several windows of days in one SQL query
+
+        The query reads the biggest span needed (twice the biggest window)
+        and the value of each window is computed with conditional
+        aggregation: count(distinct(CASE WHEN <date in window> THEN x END)).
+    """
+
+    aggregation_re = re.compile(r"^\s*(count|sum)\s*\(\s*(distinct\b)?\s*(.*)\)\s+as\s+`?(\w+)`?\s*$",
+                                re.IGNORECASE | re.DOTALL)
+
+    def __init__(self, metric):
+        self.metric = metric
+
+    def _is_standard(self):
+        # Rollups are cheaper than a conditional aggregation of raw tables
+        if get_rollup_query(self.metric, False) is not None: return False
+        metric_class = type(self.metric)
+        for method in ["get_agg", "get_trends", "_get_trends_all_items"]:
+            if getattr(metric_class, method).im_func is not getattr(Metrics, method).im_func:
+                return False
+        return True
+
+    def _record_query(self, startdate, enddate):
+        """ BuildQuery arguments used by the metric for an aggregated value """
+        metric = self.metric
+        filters = metric.filters
+        metric.filters = MetricFilters(filters.period, startdate, enddate,
+                                       filters.type_analysis)
+        metric.filters.global_filter = filters.global_filter
+        metric.filters.closed_condition = filters.closed_condition
+        recorder = QueryRecorder(metric.db)
+        db = metric.db
+        metric.db = recorder
+        try:
+            try:
+                q = metric._get_sql(False)
+            except NotImplementedError:
+                return None
+        finally:
+            metric.db = db
+            metric.filters = filters
+        if q is not recorder.marker or len(recorder.calls) != 1: return None
+        call = recorder.calls[0]
+        # Dates must be used only in the date field condition
+        if call[1] != startdate or call[2] != enddate: return None
+        if not isinstance(call[4], Set): return None
+        return call
+
+    @staticmethod
+    def _has_top_level_comma(expr):
+        level = 0
+        for char in expr:
+            if char == "(": level += 1
+            elif char == ")": level -= 1
+            elif char == "," and level == 0: return True
+        return False
+
+    @staticmethod
+    def _get_window_field(field, condition, alias):
+        """ Aggregated field only counting rows matching condition or None """
+        match = TrendsPlanner.aggregation_re.match(field)
+        if match is None: return None
+        function, distinct, expr, metric_alias = match.groups()
+        if TrendsPlanner._has_top_level_comma(expr): return None
+        if expr.strip() == "*": expr = "1"
+        value = "CASE WHEN " + condition + " THEN " + expr + " END"
+        if distinct: value = "distinct(" + value + ")"
+        return function + "(" + value + ") as " + alias
+
+    def _build_query(self, call, windows):
+        (period, startdate, enddate, date_field, fields, tables, filters,
+         evolutionary, type_analysis) = call
+        field = list(fields)[0]
+        fields_sql = []
+        for (alias, start, end) in windows:
+            condition = date_field + ">=" + start + " AND " + date_field + "<" + end
+            window_field = TrendsPlanner._get_window_field(field, condition, alias)
+            if window_field is None: return None
+            fields_sql.append(window_field)
+        fields_sql = " , ".join(fields_sql)
+
+        db = self.metric.db
+        all_items = db.get_all_items(type_analysis)
+        group_field = None
+        if all_items:
+            group_field = db.get_group_field(all_items)
+            fields_sql = group_field + ", " + fields_sql
+            if len(group_field.split(" ")) == 3:
+                group_field = group_field.split(" ")[2]
+
+        filters = db._get_filters_query(Set(filters))
+        sql = "SELECT " + fields_sql
+        sql += " FROM " + db._get_tables_query(Set(tables))
+        sql += " WHERE " + date_field + ">=" + startdate + " AND " + date_field + "<" + enddate
+        reg_and = re.compile("^[ ]*and", re.IGNORECASE)
+        if (filters != ""):
+            if (reg_and.match (filters.lower())) is not None: sql += " " + filters
+            else: sql += " AND " + filters
+        if group_field is not None:
+            sql += " GROUP BY " + group_field
+        return sql
+
+    def get_trends(self, date, days_list):
+        """ Same data than get_trends for each days in days_list merged
+
+            None is returned if the metric query can not be converted, so
+            the caller must compute each window on its own. In GROUP BY
+            queries all items with activity in the biggest span are
+            returned for all windows, with 0 in windows without activity.
+        """
+        metric = self.metric
+        if not self._is_standard(): return None
+        group_by = metric.filters.type_analysis and metric.filters.type_analysis[1] is None
+        if group_by and metric.id in Metrics.group_trends_not_supported: return None
+
+        span = GetDates(date, max(days_list))
+        call = self._record_query(span[2], span[0])
+        if call is None or len(call[4]) != 1: return None
+        # The query must not depend on the dates apart from the date field
+        window = GetDates(date, min(days_list))
+        other = self._record_query(window[2], window[0])
+        if other is None or other[3] != call[3] or \
+            Set(other[4]) != Set(call[4]) or Set(other[5]) != Set(call[5]) or \
+            Set(other[6]) != Set(call[6]):
+            return None
+
+        field = TrendsPlanner.aggregation_re.match(list(call[4])[0])
+        if field is None: return None
+        field = field.group(4)
+        if not group_by and field != metric.id: return None
+
+        windows = []
+        for days in days_list:
+            chardates = GetDates(date, days)
+            windows.append(("last_" + str(days), chardates[1], chardates[0]))
+            windows.append(("prev_" + str(days), chardates[2], chardates[1]))
+        q = self._build_query(call, windows)
+        if q is None: return None
+        values = metric.db.ExecuteQuery(q)
+
+        data = {}
+        if group_by:
+            values = check_array_values(values)
+            group_field = metric.db.get_group_field_alias(metric.filters.type_analysis[0])
+            data[group_field] = values.get(group_field, [])
+        for days in days_list:
+            last = values.get("last_" + str(days))
+            prev = values.get("prev_" + str(days))
+            if group_by:
+                if last is None: last, prev = [], []
+                # Windows without rows for an item are NULL for sum()
+                last = [0 if value is None else value for value in last]
+                prev = [0 if value is None else value for value in prev]
+                data[metric.id+'_'+str(days)] = last
+                data['diff_net'+metric.id+'_'+str(days)] = \
+                    [last[i] - prev[i] for i in range(0, len(prev))]
+                data['percentage_'+metric.id+'_'+str(days)] = \
+                    [GetPercentageDiff(prev[i], last[i]) for i in range(0, len(prev))]
+            else:
+                if last is None: last = 0
+                else: last = int(last)
+                if prev is None: prev = 0
+                else: prev = int(prev)
+                data['diff_net'+metric.id+'_'+str(days)] = last - prev
+                data['percentage_'+metric.id+'_'+str(days)] = GetPercentageDiff(prev, last)
+                data[metric.id+'_'+str(days)] = last
+        return data
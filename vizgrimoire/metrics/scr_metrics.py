@@ -30,6 +30,7 @@ import MySQLdb
 import numpy
 
 from vizgrimoire.GrimoireUtils import completePeriodIds, checkListArray, medianAndAvgByPeriod, check_array_values
+from vizgrimoire.GrimoireUtils import medianAndAvgByPeriodStream, PeriodMedianAvg
 from vizgrimoire.metrics.query_builder import DSQuery
 
 from vizgrimoire.metrics.metrics import Metrics
@@ -363,6 +364,7 @@ class Opened(Metrics):
     name = "Opened reviews"
     desc = "Number of review processes opened"
     data_source = SCR
+    state_dependent = True
 
     def _get_sql(self, evolutionary):
         q = self.db.GetReviewsSQL("opened", self.filters, evolutionary)
@@ -383,6 +385,7 @@ class InProgress(Metrics):
     name = "In progress reviews"
     desc = "Number review processes in progress"
     data_source = SCR
+    state_dependent = True
 
     def _get_sql(self, evolutionary):
         q = self.db.GetReviewsSQL("inprogress", self.filters, evolutionary)
@@ -394,6 +397,7 @@ class New(Metrics):
     name = "New reviews"
     desc = "Number of new review processes"
     data_source = SCR
+    state_dependent = True
 
     def _get_sql(self, evolutionary):
         q = self.db.GetReviewsSQL("new", self.filters, evolutionary)
@@ -777,6 +781,7 @@ class PatchesWaitingForReviewer(Metrics):
     name = "Waiting for reviewer patches"
     desc = "Number of patches from review processes waiting for reviewer"
     data_source = SCR
+    state_dependent = True
 
 
     def _get_sql(self, evolutionary):
@@ -788,6 +793,7 @@ class PatchesWaitingForSubmitter(Metrics):
     name = "Waiting for submitter patches"
     desc = "Number of patches from review processes waiting for submitter"
     data_source = SCR
+    state_dependent = True
 
     def _get_sql(self, evolutionary):
         q = self.db.GetWaiting4SubmitterSQL(self.filters, evolutionary)
@@ -967,6 +973,7 @@ class ReviewsWaitingForReviewer(Metrics):
     name = "Reviews waiting for reviewer"
     desc = "Number of preview processes waiting for reviewer"
     data_source = SCR
+    state_dependent = True
 
 
     def _get_sql (self, evolutionary):
@@ -997,6 +1004,7 @@ class ReviewsWaitingForSubmitter(Metrics):
     name = "Reviews waiting for submitter"
     desc = "Number of review processes waiting for submitter"
     data_source = SCR
+    state_dependent = True
 
 
     def _get_sql(self, evolutionary):
@@ -1636,98 +1644,86 @@ class TimeToReview(Metrics):
         q = self.db.GetTimeToReviewQuerySQL (self.filters, bots)
         return q
 
-    def _get_agg_all(self, data):
-        from numpy import median, average
-        from vizgrimoire.GrimoireUtils import removeDecimals
+    @staticmethod
+    def _get_median_avg(revtimes):
+        if (len(revtimes) == 0):
+            return (float("nan"), float("nan"))
+        return (float(numpy.median(revtimes)), float(numpy.average(revtimes)))
 
+    def _get_agg_all(self, q):
         data_all = {}
 
         # First, we need to group by the filter field the data
         all_items = self.db.get_all_items(self.filters.type_analysis)
         id_field = self.db.get_group_field_alias(all_items)
 
-        items =  list(Set(data[id_field]))
-        data_all[id_field] = items
+        data = self.db.ExecuteQuery(q, columnar = True)
+        items, positions = numpy.unique(data[id_field], return_inverse = True)
+        # Review times of each item in consecutive positions
+        order = numpy.argsort(positions, kind = 'mergesort')
+        limits = numpy.cumsum(numpy.bincount(positions, minlength = len(items)))[:-1]
+        revtimes = []
+        if len(items) > 0:
+            revtimes = numpy.split(data['revtime'][order], limits)
+
+        data_all[id_field] = items.tolist()
         for id in ["review_time_days_median", "review_time_days_avg"]:
             data_all[id] = []
 
-        for item in items:
-            # First, extract the data for the item
-            data_item = {"changed_on":[],"revtime":[]}
-            for i in range(0,len(data[id_field])):
-                if data[id_field][i] == item:
-                    data_item["changed_on"].append(data["changed_on"][i])
-                    data_item["revtime"].append(data["revtime"][i])
-            data_revtime = data_item['revtime']
-            if (isinstance(data, list) == False): data_revtime = [data_revtime]
-            # ttr_median = sorted(data)[len(data)//2]
-            if (len(data_revtime) == 0):
-                ttr_median = float("nan")
-                ttr_avg = float("nan")
-            else:
-                ttr_median = float(median(removeDecimals(data_revtime)))
-                ttr_avg = float(average(removeDecimals(data_revtime)))
+        for item_revtimes in revtimes:
+            ttr_median, ttr_avg = TimeToReview._get_median_avg(item_revtimes)
             data_all["review_time_days_median"].append(ttr_median)
             data_all["review_time_days_avg"].append(ttr_avg)
         return data_all
 
     def get_agg(self):
-        from numpy import median, average
-        from vizgrimoire.GrimoireUtils import removeDecimals
-
         q = self._get_sql()
         if q is None: return {}
-        data = self.db.ExecuteQuery(q)
 
         if self.filters.type_analysis and self.filters.type_analysis[1] is None:
             # Support for GROUP BY queries
-            return self._get_agg_all(data)
-
-        data = data['revtime']
-        if (isinstance(data, list) == False): data = [data]
-        # ttr_median = sorted(data)[len(data)//2]
-        if (len(data) == 0):
-            ttr_median = float("nan")
-            ttr_avg = float("nan")
-        else:
-            ttr_median = float(median(removeDecimals(data)))
-            ttr_avg = float(average(removeDecimals(data)))
+            return self._get_agg_all(q)
+
+        revtimes = self.db.ExecuteQuery(q, columnar = True)['revtime']
+        ttr_median, ttr_avg = TimeToReview._get_median_avg(revtimes)
         return {"review_time_days_median":ttr_median, "review_time_days_avg":ttr_avg}
 
-    def _get_ts_all(self, data):
-        from numpy import median, average
-        from vizgrimoire.GrimoireUtils import removeDecimals
+    @staticmethod
+    def _get_metrics_list(med_avg_list):
+        metrics_list = {}
+        if (med_avg_list != None):
+            metrics_list['review_time_days_median'] = med_avg_list['median']
+            metrics_list['review_time_days_avg'] = med_avg_list['avg']
+            metrics_list['month'] = med_avg_list['month']
+        else:
+            metrics_list['review_time_days_median'] = []
+            metrics_list['review_time_days_avg'] = []
+            metrics_list['month'] = []
+        return metrics_list
 
+    def _get_ts_all(self, q):
         data_all = {}
 
         # First, we need to group by the filter field the data
         all_items = self.db.get_all_items(self.filters.type_analysis)
         id_field = self.db.get_group_field_alias(all_items)
 
-        items =  list(Set(data[id_field]))
+        # Only the values of the current period are kept for each item
+        med_avg_items = {}
+        for row in self.db.ExecuteQueryStream(q):
+            item = row[id_field]
+            if item not in med_avg_items:
+                med_avg_items[item] = PeriodMedianAvg(self.filters.period)
+            med_avg_items[item].add(row['changed_on'], row['revtime'])
+
+        items = med_avg_items.keys()
         data_all[id_field] = items
         for id in ["review_time_days_median", "review_time_days_avg"]:
             data_all[id] = []
 
         for item in items:
-            # First, extract the data for the item
-            data_item = {"changed_on":[],"revtime":[]}
-            for i in range(0,len(data[id_field])):
-                if data[id_field][i] == item:
-                    data_item["changed_on"].append(data["changed_on"][i])
-                    data_item["revtime"].append(data["revtime"][i])
-
-            med_avg_list = medianAndAvgByPeriod(self.filters.period,
-                                                data_item['changed_on'], data_item['revtime'])
-            metrics_list = {}
-            if (med_avg_list != None):
-                metrics_list['review_time_days_median'] = med_avg_list['median']
-                metrics_list['review_time_days_avg'] = med_avg_list['avg']
-                metrics_list['month'] = med_avg_list['month']
-            else:
-                metrics_list['review_time_days_median'] = []
-                metrics_list['review_time_days_avg'] = []
-                metrics_list['month'] = []
+            med_avg_list = med_avg_items[item].get_result()
+            metrics_list = TimeToReview._get_metrics_list(med_avg_list)
 
             metrics_list = completePeriodIds(metrics_list, self.filters.period,
                                              self.filters.startdate, self.filters.enddate)
@@ -1743,23 +1739,15 @@ class TimeToReview(Metrics):
     def get_ts(self):
         q = self._get_sql()
         if q is None: return {}
-        review_list = self.db.ExecuteQuery(q)
-        checkListArray(review_list)
 
         if self.filters.type_analysis and self.filters.type_analysis[1] is None:
             # Support for GROUP BY queries
-            return self._get_ts_all(review_list)
+            return self._get_ts_all(q)
 
-        metrics_list = {}
-        med_avg_list = medianAndAvgByPeriod(self.filters.period, review_list['changed_on'], review_list['revtime'])
-        if (med_avg_list != None):
-            metrics_list['review_time_days_median'] = med_avg_list['median']
-            metrics_list['review_time_days_avg'] = med_avg_list['avg']
-            metrics_list['month'] = med_avg_list['month']
-        else:
-            metrics_list['review_time_days_median'] = []
-            metrics_list['review_time_days_avg'] = []
-            metrics_list['month'] = []
+        reviews = self.db.ExecuteQueryStream(q)
+        med_avg_list = medianAndAvgByPeriodStream(self.filters.period,
+            ((review['changed_on'], review['revtime']) for review in reviews))
+        metrics_list = TimeToReview._get_metrics_list(med_avg_list)
 
         metrics_list = completePeriodIds(metrics_list, self.filters.period,
                           self.filters.startdate, self.filters.enddate)
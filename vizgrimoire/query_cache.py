@@ -0,0 +1,288 @@
+## Copyright (C) 2014 Bitergia
+##
+## This program is free software; you can redistribute it and/or modify
+## it under the terms of the GNU General Public License as published by
+## the Free Software Foundation; either version 3 of the License, or
+## (at your option) any later version.
+##
+## This program is distributed in the hope that it will be useful,
+## but WITHOUT ANY WARRANTY; without even the implied warranty of
+## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+## GNU General Public License for more details.
+##
+## You should have received a copy of the GNU General Public License
+## along with this program; if not, write to the Free Software
+## Foundation, Inc., 59 Temple Place - Suite 330, Boston, MA 02111-1307, USA.
+##
+## This file is a part of GrimoireLib
+##  (an Python library for the MetricsGrimoire and vizGrimoire systems)
+##
+##
+## Authors:
+##   Alvaro del Castillo <acs@bitergia.com>
+
+""" Persistent cache for the results of DSQuery.ExecuteQuery
+
+    Results are stored in a local directory, one file per query, keyed by
+    the normalized SQL and the databases it can read. Each entry carries a
+    fingerprint of the databases (row count and max value of the tables
+    MetricsGrimoire tools append to, checksum of the identities and projects
+    tables) so entries are invalidated as soon as new data is collected or
+    identities are changed. Queries using the current time (NOW(), CURDATE()...)
+    or random values are not cached. The directory is limited in size,
+    removing the least recently used entries first.
+"""
+
+import cPickle
+import hashlib
+import logging
+import os
+import re
+import tempfile
+import threading
+
+# Tables checked to detect changes in a database and the column used
+# to get its max value (None to use just the number of rows). Tables not
+# found in a database are ignored. Queries of a database without any of
+# them are not cached.
+FINGERPRINT_TABLES = {
+    "scmlog":"id",
+    "actions":"id",
+    "issues":"id",
+    "changes":"id",
+    "messages":"first_date",
+    "irclog":"id",
+    "wiki_pages_revs":"id",
+    "pull_requests":"id",
+    "questions":None,
+    "answers":None,
+    "comments":None,
+    "visits_month":"date",
+    "pages_month":"date",
+    "countries_month":"date"
+}
+
+# Tables whose rows are changed in place (i.e. identities merged, bots and
+# affiliations edited), checked with CHECKSUM TABLE
+CHECKSUM_TABLES = [
+    "people_uidentities",
+    "uidentities",
+    "enrollments",
+    "profiles",
+    "organizations",
+    "projects",
+    "project_repositories"
+]
+
+
+class QueryCache(object):
+    """ LRU cache of query results in a local directory """
+
+    # Functions whose result depends on the time of the query, not on the data
+    volatile_re = re.compile(r"\b(NOW|CURDATE|CURTIME|CURRENT_\w+|SYSDATE|UTC_\w+|RAND|UUID)\b",
+                             re.IGNORECASE)
+
+    def __init__(self, cache_dir, max_size = 512 * 1024 * 1024):
+        self.cache_dir = cache_dir
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._fingerprints = {}
+        self._lock = threading.Lock()
+        if not os.path.isdir(cache_dir):
+            os.makedirs(cache_dir)
+        self._size = 0
+        for name in os.listdir(cache_dir):
+            self._size += os.path.getsize(os.path.join(cache_dir, name))
+        self._stats_size = self._size # size when the stats were reset
+
+    @staticmethod
+    def normalize(sql):
+        """ Remove spacing differences between equivalent queries """
+        return re.sub(r"\s+", " ", sql).strip()
+
+    @staticmethod
+    def is_select(sql):
+        return QueryCache.normalize(sql)[0:6].upper() == "SELECT"
+
+    @staticmethod
+    def is_cacheable(sql):
+        """ Queries reading data, with the same result while the data does not change """
+        return QueryCache.is_select(sql) and QueryCache.volatile_re.search(sql) is None
+
+    def _get_path(self, dsquery, sql):
+        key = "\0".join([str(dsquery.database), str(dsquery.identities_db),
+                         str(dsquery.projects_db), QueryCache.normalize(sql)])
+        return os.path.join(self.cache_dir, hashlib.sha1(key).hexdigest())
+
+    @staticmethod
+    def _get_db_fingerprint(pool, database):
+        """ Fingerprint of a database and whether it has tables with data """
+        tables = ",".join(["'"+t+"'" for t in FINGERPRINT_TABLES.keys() + CHECKSUM_TABLES])
+        q = """
+            SELECT table_name FROM information_schema.tables
+            WHERE table_schema = '%s' AND table_name IN (%s)
+            ORDER BY table_name
+            """ % (database, tables)
+        cursor = pool.execute(q)
+        try:
+            found = [row[0] for row in cursor.fetchall()]
+        finally:
+            cursor.close()
+            pool.checkin()
+
+        fingerprint = []
+        checksum_tables = [table for table in found if table in CHECKSUM_TABLES]
+        if len(checksum_tables) > 0:
+            q = "CHECKSUM TABLE " + ", ".join([database + "." + table
+                                               for table in checksum_tables])
+            cursor = pool.execute(q)
+            try:
+                for (table, checksum) in cursor.fetchall():
+                    fingerprint.append(table + ":" + str(checksum))
+            finally:
+                cursor.close()
+                pool.checkin()
+        for table in found:
+            if table in CHECKSUM_TABLES: continue
+            column = FINGERPRINT_TABLES[table]
+            if column is None: column = "NULL"
+            q = "SELECT COUNT(*), MAX(%s) FROM %s.%s" % (column, database, table)
+            cursor = pool.execute(q)
+            try:
+                fingerprint.append(table + ":" + str(cursor.fetchone()))
+            finally:
+                cursor.close()
+                pool.checkin()
+        has_data = len([table for table in found if table in FINGERPRINT_TABLES]) > 0
+        return (",".join(fingerprint), has_data)
+
+    def _get_fingerprints(self, dsquery):
+        """ Fingerprint of all databases read by the queries of dsquery and
+            of its main database alone
+
+            They are computed once per run for each set of databases.
+        """
+        key = (dsquery.database, dsquery.identities_db, dsquery.projects_db)
+        self._lock.acquire()
+        try:
+            if key not in self._fingerprints:
+                fingerprints = []
+                for database in key:
+                    if database is None: fingerprints.append(("", False))
+                    else: fingerprints.append(self._get_db_fingerprint(dsquery.pool, database))
+                fingerprint = "|".join([str(database) + "=" + fingerprints[pos][0]
+                                        for (pos, database) in enumerate(key)
+                                        if database is not None])
+                self._fingerprints[key] = (fingerprint, fingerprints[0][1])
+            return self._fingerprints[key]
+        finally:
+            self._lock.release()
+
+    def get_fingerprint(self, dsquery):
+        """ Fingerprint of all databases read by the queries of dsquery """
+        return self._get_fingerprints(dsquery)[0]
+
+    def has_fingerprint(self, dsquery):
+        """ False if changes in the main database of dsquery can not be detected """
+        return self._get_fingerprints(dsquery)[1]
+
+    def get(self, dsquery, sql):
+        """ Return the cached result for sql or None if not available """
+        path = self._get_path(dsquery, sql)
+        try:
+            f = open(path, "rb")
+            try:
+                fingerprint, result = cPickle.load(f)
+            finally:
+                f.close()
+        except (IOError, EOFError, cPickle.UnpicklingError):
+            self.misses += 1
+            return None
+
+        if fingerprint != self.get_fingerprint(dsquery):
+            self._remove(path)
+            self.misses += 1
+            return None
+
+        # Last access time is used for LRU eviction
+        try:
+            os.utime(path, None)
+        except OSError:
+            pass
+        self.hits += 1
+        return result
+
+    def put(self, dsquery, sql, result):
+        path = self._get_path(dsquery, sql)
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, prefix=".tmp")
+        f = os.fdopen(fd, "wb")
+        try:
+            cPickle.dump((self.get_fingerprint(dsquery), result), f,
+                         cPickle.HIGHEST_PROTOCOL)
+        finally:
+            f.close()
+        size = os.path.getsize(tmp_path)
+        self._remove(path)
+        os.rename(tmp_path, path)
+        self._lock.acquire()
+        try:
+            self._size += size
+        finally:
+            self._lock.release()
+        if self._size > self.max_size:
+            self._evict()
+
+    def _remove(self, path):
+        try:
+            size = os.path.getsize(path)
+            os.remove(path)
+        except OSError:
+            return
+        self._lock.acquire()
+        try:
+            self._size -= size
+        finally:
+            self._lock.release()
+
+    def _evict(self):
+        """ Remove least recently used entries until max_size/2 is reached """
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            if name.startswith(".tmp"): continue
+            path = os.path.join(self.cache_dir, name)
+            try:
+                entries.append((os.path.getmtime(path), path))
+            except OSError:
+                pass
+        entries.sort()
+        for mtime, path in entries:
+            if self._size <= self.max_size / 2: break
+            self._remove(path)
+
+    def clear(self):
+        for name in os.listdir(self.cache_dir):
+            self._remove(os.path.join(self.cache_dir, name))
+
+    def get_stats(self):
+        """ Hits, misses and bytes added since the stats were reset """
+        return [self.hits, self.misses, self._size - self._stats_size]
+
+    def reset_stats(self):
+        self.hits = 0
+        self.misses = 0
+        self._stats_size = self._size
+
+    def merge_stats(self, stats):
+        """ Add the stats of the queries of other process """
+        self._lock.acquire()
+        try:
+            self.hits += stats[0]
+            self.misses += stats[1]
+            self._size += stats[2]
+        finally:
+            self._lock.release()
+
+    def log_stats(self):
+        logging.info("Query cache: %i hits, %i misses, %i bytes used" %
+                     (self.hits, self.misses, self._size))
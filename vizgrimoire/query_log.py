@@ -0,0 +1,162 @@
+## Copyright (C) 2014 Bitergia
+##
+## This program is free software; you can redistribute it and/or modify
+## it under the terms of the GNU General Public License as published by
+## the Free Software Foundation; either version 3 of the License, or
+## (at your option) any later version.
+##
+## This program is distributed in the hope that it will be useful,
+## but WITHOUT ANY WARRANTY; without even the implied warranty of
+## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+## GNU General Public License for more details.
+##
+## You should have received a copy of the GNU General Public License
+## along with this program; if not, write to the Free Software
+## Foundation, Inc., 59 Temple Place - Suite 330, Boston, MA 02111-1307, USA.
+##
+## This file is a part of GrimoireLib
+##  (an Python library for the MetricsGrimoire and vizGrimoire systems)
+##
+##
+## Authors:
+##   Alvaro del Castillo <acs@bitergia.com>
+
+""" Log of the queries executed with their timing
+
+    Each query is written as a JSON line with the time spent in the
+    database, the rows returned, the time spent building the Python result
+    and the metric, data source and filter that executed it. Queries slower
+    than a threshold include the output of EXPLAIN. At the end of the run a
+    summary with the queries ranked by total time is written.
+
+    Worker processes (report_tool --jobs) append to the same log, and their
+    stats are merged in the main process through the jobs results.
+"""
+
+import json
+import logging
+import os
+import sys
+import threading
+import time
+
+from vizgrimoire.query_cache import QueryCache
+
+
+class QueryLog(object):
+    """ JSON lines log of executed queries """
+
+    def __init__(self, path, slow_threshold = 1.0):
+        self.path = path
+        self.slow_threshold = slow_threshold
+        self._lock = threading.Lock()
+        self._stats = {} # normalized sql: [count, total time, rows, max time]
+        self._file = open(path, "a")
+
+    @staticmethod
+    def get_context():
+        """ Metric, data source and filter of the caller, if any """
+        from vizgrimoire.metrics.metrics import Metrics
+        frame = sys._getframe(2)
+        while frame is not None:
+            caller = frame.f_locals.get('self')
+            if isinstance(caller, Metrics):
+                context = {"metric": caller.id}
+                ds = caller.data_source
+                if ds is not None and hasattr(ds, "get_name"):
+                    context["data_source"] = ds.get_name()
+                if caller.filters is not None and caller.filters.type_analysis:
+                    context["filter"] = [str(value) for value in caller.filters.type_analysis]
+                return context
+            frame = frame.f_back
+        return {}
+
+    @staticmethod
+    def _explain(pool, sql):
+        cursor = pool.execute("EXPLAIN " + sql)
+        try:
+            columns = [column[0] for column in cursor.description]
+            return [dict(zip(columns, [str(value) for value in row]))
+                    for row in cursor.fetchall()]
+        finally:
+            cursor.close()
+            pool.checkin()
+
+    def record(self, pool, sql, query_time, rows, pivot_time = None):
+        sql = QueryCache.normalize(sql)
+        entry = QueryLog.get_context()
+        entry.update({"time": time.time(),
+                      "database": pool.database,
+                      "sql": sql,
+                      "query_time": round(query_time, 6),
+                      "rows": rows})
+        if pivot_time is not None: entry["pivot_time"] = round(pivot_time, 6)
+        if query_time >= self.slow_threshold and QueryCache.is_select(sql):
+            try:
+                entry["explain"] = QueryLog._explain(pool, sql)
+            except Exception, e:
+                entry["explain"] = str(e)
+        line = json.dumps(entry, default=str)
+
+        if isinstance(line, unicode): line = line.encode('utf-8')
+
+        self._lock.acquire()
+        try:
+            # One write per line: lines of several processes are not mixed
+            os.write(self._file.fileno(), line + "\n")
+            self._add_stats(sql, [1, query_time, rows, query_time])
+        finally:
+            self._lock.release()
+
+    def _add_stats(self, sql, stats):
+        if sql not in self._stats: self._stats[sql] = [0, 0.0, 0, 0.0]
+        total = self._stats[sql]
+        total[0] += stats[0]
+        total[1] += stats[1]
+        total[2] += stats[2]
+        total[3] = max(total[3], stats[3])
+
+    def get_stats(self):
+        return self._stats
+
+    def reset_stats(self):
+        self._lock.acquire()
+        try:
+            self._stats = {}
+        finally:
+            self._lock.release()
+
+    def merge_stats(self, stats):
+        """ Add the stats of the queries of other process """
+        self._lock.acquire()
+        try:
+            for (sql, query_stats) in stats.items():
+                self._add_stats(sql, query_stats)
+        finally:
+            self._lock.release()
+
+    def get_summary(self):
+        """ List of queries stats ranked by total time """
+        summary = [{"sql": sql, "count": stats[0], "total_time": round(stats[1], 6),
+                    "rows": stats[2], "max_time": round(stats[3], 6)}
+                   for (sql, stats) in self._stats.items()]
+        summary.sort(key=lambda query: query["total_time"], reverse=True)
+        return summary
+
+    def write_summary(self, top = 20):
+        """ Write the summary next to the log and show the top queries """
+        summary = self.get_summary()
+        f = open(self.path + ".summary.json", "w")
+        try:
+            json.dump(summary, f, indent=1)
+        finally:
+            f.close()
+        total = sum([query["total_time"] for query in summary])
+        logging.info("Query log: %i queries, %i distinct, %.2fs in database" %
+                     (sum([query["count"] for query in summary]), len(summary), total))
+        for query in summary[0:top]:
+            logging.info("%.2fs %i times: %s" % (query["total_time"], query["count"],
+                                                 query["sql"][0:200]))
+
+    def close(self):
+        self._file.close()
@@ -20,6 +20,13 @@
 
 
 from vizgrimoire.GrimoireSQL import SetDBChannel
+from vizgrimoire.db_pool import set_pool_size
+from vizgrimoire.query_cache import QueryCache
+from vizgrimoire.metrics.metrics_memo import MetricsMemo
+import vizgrimoire.identities_cache as identities_cache
+import vizgrimoire.threads_index as threads_index
+from vizgrimoire.query_log import QueryLog
+from vizgrimoire.rollups import RollupsManager, get_identities_fingerprint
 from vizgrimoire.GrimoireUtils import read_main_conf
 import logging, time, sys
 import vizgrimoire.SCM as SCM
@@ -39,6 +46,7 @@ from vizgrimoire.metrics.metrics import Metrics
 from vizgrimoire.metrics.metrics_filter import MetricFilters
 from vizgrimoire.analysis.analyses import Analyses
 from vizgrimoire.metrics.query_builder import DSQuery
+from vizgrimoire.data_source import DataSource
 
 class Report(object):
     """Basic class for a Grimoire automator based dashboard"""
@@ -51,18 +59,114 @@ class Report(object):
     _on_studies = []
     _automator = None
     _automator_file = None
+    _metrics_modules = [] # metrics modules names, imported on demand
+    _metrics_classes = None
+    _metrics_loaded = [] # data sources with their metrics registered
 
     @staticmethod
     def init(automator_file, metrics_path = None):
         Report._automator_file = automator_file
         Report._automator = read_main_conf(automator_file)
+        if 'db_pool_size' in Report._automator['generic']:
+            set_pool_size(Report._automator['generic']['db_pool_size'])
+        Report._init_query_cache()
+        Report._init_query_log()
+        Report._init_metrics_memo()
+        Report._init_identities_cache()
+        Report._init_threads_index()
         Report._init_filters()
         Report._init_data_sources()
+        Report._init_rollups()
         if metrics_path is not None:
             Report._init_metrics(metrics_path)
             studies_path = metrics_path.replace("metrics","analysis")
             Report._init_studies(studies_path)
 
+    @staticmethod
+    def _init_query_cache():
+        """ Cache query results on disk if query_cache_dir is configured """
+        generic = Report._automator['generic']
+        if 'query_cache_dir' not in generic: return
+        max_size = 512
+        if 'query_cache_size' in generic:
+            max_size = int(generic['query_cache_size'])
+        logging.info("Using query cache in " + generic['query_cache_dir'])
+        DSQuery.set_cache(QueryCache(generic['query_cache_dir'],
+                                     max_size * 1024 * 1024))
+
+    @staticmethod
+    def _init_metrics_memo():
+        """ Memoize metrics results in the run unless metrics_memo is false """
+        generic = Report._automator['generic']
+        if generic.get('metrics_memo', 'true').lower() in ('false', 'no', '0'):
+            Metrics.set_memo(None)
+            return
+        Metrics.set_memo(MetricsMemo())
+
+    @staticmethod
+    def _init_identities_cache():
+        """ Persist the identities loaded if identities_cache_dir is configured """
+        generic = Report._automator['generic']
+        if 'identities_cache_dir' not in generic: return
+        logging.info("Using identities cache in " + generic['identities_cache_dir'])
+        identities_cache.set_cache_dir(generic['identities_cache_dir'])
+
+    @staticmethod
+    def _init_threads_index():
+        """ Read mailing lists threads from an index if threads_index_dir is configured """
+        generic = Report._automator['generic']
+        if 'threads_index_dir' not in generic: return
+        logging.info("Using threads index in " + generic['threads_index_dir'])
+        threads_index.set_index_dir(generic['threads_index_dir'])
+
+    @staticmethod
+    def _init_query_log():
+        """ Log all queries and their timing if query_log is configured """
+        generic = Report._automator['generic']
+        if 'query_log' not in generic: return
+        slow_threshold = 1.0
+        if 'query_log_slow' in generic:
+            slow_threshold = float(generic['query_log_slow'])
+        logging.info("Logging queries in " + generic['query_log'])
+        DSQuery.set_query_log(QueryLog(generic['query_log'], slow_threshold))
+
+    @staticmethod
+    def _init_rollups():
+        """ Update the rollups tables used by metrics if rollups is enabled """
+        generic = Report._automator['generic']
+        if 'rollups' not in generic or generic['rollups'].lower() != "true": return
+        db_projects = None
+        if 'db_projects' in generic: db_projects = generic['db_projects']
+        for ds in Report.get_data_sources():
+            if ds.get_name() not in ["scm","its","mls"]: continue
+            builder = ds.get_query_builder()
+            dsquery = builder(generic['db_user'], generic['db_password'],
+                              generic[ds.get_db_name()], generic['db_identities'],
+                              db_projects)
+            RollupsManager(dsquery, ds.get_name()).update()
+
+    @staticmethod
+    def get_identities_fingerprints():
+        """ Fingerprint of the identities used by each data source
+
+            None for data sources without identities tables.
+        """
+        generic = Report._automator['generic']
+        db_projects = None
+        if 'db_projects' in generic: db_projects = generic['db_projects']
+        fingerprints = {}
+        for ds in Report.get_data_sources():
+            if ds.get_db_name() not in generic: continue
+            builder = ds.get_query_builder()
+            dsquery = builder(generic['db_user'], generic['db_password'],
+                              generic[ds.get_db_name()], generic['db_identities'],
+                              db_projects)
+            try:
+                fingerprints[ds.get_name()] = get_identities_fingerprint(dsquery, True)
+            except Exception:
+                fingerprints[ds.get_name()] = None
+        return fingerprints
+
     @staticmethod
     def _init_filters():
         reports = Report._automator['r']['reports']
@@ -123,7 +227,7 @@ class Report(object):
 
     @staticmethod
     def _init_metrics(metrics_path):
-        """Register all available metrics"""
+        """Find all available metrics modules. Metrics are registered on demand"""
 
         # logging.info("Loading metrics modules from %s" % (metrics_path))
         # sys.path.insert(1,metrics_path) # Prepend the metrics path
@@ -132,15 +236,7 @@ class Report(object):
         from os.path import isfile, isdir, join, dirname
         import imp, inspect
 
-        db_identities = Report._automator['generic']['db_identities']
-        db_projects = None
-        if 'db_projects' in Report._automator['generic']:
-            db_projects = Report._automator['generic']['db_projects']
-        dbuser = Report._automator['generic']['db_user']
-        dbpass = Report._automator['generic']['db_password']
-
         # Read all available metrics installed in GrimoireLib egg
-        metrics_pkg = "vizgrimoire.metrics"
         import vizgrimoire.metrics
         mfile = inspect.getfile(vizgrimoire.metrics)
         if ".egg" in mfile:
@@ -161,37 +257,58 @@ class Report(object):
             metrics_mod = [f for f in listdir(mdir)
                            if isfile(join(mdir,f)) and f.endswith("_metrics.py")]
 
-        for metric_mod in metrics_mod:
-            mod_name = metric_mod.split(".py")[0]
-            mod = __import__(metrics_pkg+"."+mod_name)
-            # Support for having more than one metric per module
-            metrics_classes = [c for name, c in inspect.getmembers(sys.modules[metrics_pkg+"."+mod_name])
-                               if inspect.isclass(c) and issubclass(c, Metrics)]
-
-            for metrics_class in metrics_classes:
-                ds = metrics_class.data_source
-                if ds is None: continue
-                if ds.get_db_name() not in Report._automator['generic']: continue
-                builder = ds.get_query_builder()
-                db = Report._automator['generic'][ds.get_db_name()]
-                metric_filters = Report.get_default_filter()
-                if (ds.get_global_filter(ds) is not None):
-                    metric_filters.global_filter = ds.get_global_filter(ds)
-                metrics = metrics_class(builder(dbuser, dbpass, db, db_identities, db_projects), metric_filters)
-                ds.add_metrics(metrics, ds)
-                if ds == ITS.ITS:
-                    db_its1_name = ITS_1.ITS_1.get_db_name()
-                    if db_its1_name in Report._automator['generic']:
-                        db_its1 = Report._automator['generic'][db_its1_name]
-                        metric_filters = Report.get_default_filter()
-                        metric_filters.set_closed_condition(ITS_1.ITS_1._get_closed_condition())
-                        metrics = metrics_class(builder(dbuser, dbpass, db_its1, db_identities, db_projects), metric_filters)
-                        ITS_1.ITS_1.add_metrics(metrics, ITS_1.ITS_1)
-
-                # Specific filters
-                if ds.get_name() == "scr":
-                    if 'scr_start_date' in Report._automator['r']:
-                        metrics.filters.start_date = Report._automator['r']['scr_start_date']
+        Report._metrics_modules = [metric_mod.split(".py")[0] for metric_mod in metrics_mod]
+        Report._metrics_classes = None
+        Report._metrics_loaded = []
+        DataSource.set_metrics_loader(Report._load_metrics)
+
+    @staticmethod
+    def get_metrics_classes(ds):
+        """Metrics classes of a data source, importing the metrics modules once"""
+        import inspect
+
+        if Report._metrics_classes is None:
+            metrics_pkg = "vizgrimoire.metrics"
+            Report._metrics_classes = []
+            for mod_name in Report._metrics_modules:
+                mod = __import__(metrics_pkg+"."+mod_name)
+                # Support for having more than one metric per module
+                Report._metrics_classes += [c for name, c in inspect.getmembers(sys.modules[metrics_pkg+"."+mod_name])
+                                            if inspect.isclass(c) and issubclass(c, Metrics)]
+        # ITS_1 uses the ITS metrics with its own database
+        if ds == ITS_1.ITS_1: ds = ITS.ITS
+        return [c for c in Report._metrics_classes if c.data_source == ds]
+
+    @staticmethod
+    def _load_metrics(ds):
+        """Register the metrics of a data source the first time they are used"""
+        if ds in Report._metrics_loaded: return
+        Report._metrics_loaded.append(ds)
+        if ds.get_db_name() not in Report._automator['generic']: return
+
+        db_identities = Report._automator['generic']['db_identities']
+        db_projects = None
+        if 'db_projects' in Report._automator['generic']:
+            db_projects = Report._automator['generic']['db_projects']
+        dbuser = Report._automator['generic']['db_user']
+        dbpass = Report._automator['generic']['db_password']
+        db = Report._automator['generic'][ds.get_db_name()]
+
+        for metrics_class in Report.get_metrics_classes(ds):
+            # Connections are opened when the metric runs its first query
+            builder = metrics_class.data_source.get_query_builder()
+            metric_filters = Report.get_default_filter()
+            if ds == ITS_1.ITS_1:
+                metric_filters.set_closed_condition(ITS_1.ITS_1._get_closed_condition())
+            elif (ds.get_global_filter(ds) is not None):
+                metric_filters.global_filter = ds.get_global_filter(ds)
+            metrics = metrics_class(builder(dbuser, dbpass, db, db_identities, db_projects), metric_filters)
+            ds.add_metrics(metrics, ds)
+
+            # Specific filters
+            if ds.get_name() == "scr":
+                if 'scr_start_date' in Report._automator['r']:
+                    metrics.filters.start_date = Report._automator['r']['scr_start_date']
 
     @staticmethod
     def _init_studies(studies_path):
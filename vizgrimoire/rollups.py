@@ -0,0 +1,371 @@
+## Copyright (C) 2014 Bitergia
+##
+## This program is free software; you can redistribute it and/or modify
+## it under the terms of the GNU General Public License as published by
+## the Free Software Foundation; either version 3 of the License, or
+## (at your option) any later version.
+##
+## This program is distributed in the hope that it will be useful,
+## but WITHOUT ANY WARRANTY; without even the implied warranty of
+## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+## GNU General Public License for more details.
+##
+## You should have received a copy of the GNU General Public License
+## along with this program; if not, write to the Free Software
+## Foundation, Inc., 59 Temple Place - Suite 330, Boston, MA 02111-1307, USA.
+##
+## This file is a part of GrimoireLib
+##  (an Python library for the MetricsGrimoire and vizGrimoire systems)
+##
+##
+## Authors:
+##   Alvaro del Castillo <acs@bitergia.com>
+
+""" Summary tables with the activity per day, repository and person
+
+    Each rollup is stored in two tables in the data source database:
+    <name> keyed by (day, repository, uuid) and <name>_orgs keyed also by
+    the organization the person was enrolled in at the time of the
+    activity. Periods (day, week, month, year) are computed from the day.
+
+    Rollups are extended in each run with the rows with an id greater than
+    the last one summarized. If the identities (people_uidentities or
+    enrollments) change, they are built again from scratch. Rollups
+    without an id in their source table are extended from the last day
+    summarized, that is summarized again, and built again if rows older
+    than that day are added.
+
+    Metrics that can be answered from a rollup use it instead of the raw
+    tables when rollups are enabled. Revisions (or messages) found in
+    several repositories are counted by their first occurrence, and
+    overlapping enrollments to the same organization count sums twice,
+    like the raw queries do.
+"""
+
+import logging
+from sets import Set
+
+
+class Rollup(object):
+    """ Definition of a rollup table built from a raw table """
+
+    def __init__(self, name, source, id_table, id_field, date_field,
+                 repository_field, repository_type, person_field, columns):
+        self.name = name
+        # FROM clause for the raw rows, with %(from_id)i and %(to_id)i
+        self.source = source
+        self.id_table = id_table # table with the ids
+        self.id_field = id_field # None to extend the rollup by day
+        self.date_field = date_field
+        self.repository_field = repository_field
+        self.repository_type = repository_type
+        self.person_field = person_field
+        self.columns = columns # (name, expression) for each counter
+
+    def get_tables(self):
+        return [self.name, self.name + "_orgs"]
+
+    def get_create_sql(self, orgs):
+        table = self.name
+        keys = "day, repository, uuid"
+        fields = ["day DATE NOT NULL",
+                  "repository " + self.repository_type,
+                  "uuid VARCHAR(128)"]
+        if orgs:
+            table += "_orgs"
+            keys += ", organization_id"
+            fields.append("organization_id INT")
+        for (column, expr) in self.columns:
+            fields.append(column + " BIGINT NOT NULL DEFAULT 0")
+        fields.append("UNIQUE KEY (" + keys + ")")
+        fields.append("KEY (uuid)")
+        if orgs: fields.append("KEY (organization_id, day)")
+        return "CREATE TABLE IF NOT EXISTS " + table + " (" + ", ".join(fields) + \
+            ") ENGINE=MyISAM DEFAULT CHARSET=utf8"
+
+    def get_date_column(self):
+        """ Date field in id_table """
+        return self.date_field.split(".")[1]
+
+    def get_insert_sql(self, orgs, identities_db, from_id = None, to_id = None,
+                       from_day = None):
+        """ Add to the rollup the raw rows in (from_id, to_id] or, without
+            id_field, the ones since from_day (TO_DAYS) if given """
+        table = self.name
+        fields = ["DATE(" + self.date_field + ")", self.repository_field, "pup.uuid"]
+        if orgs:
+            table += "_orgs"
+            fields.append("enr.organization_id")
+            people = " JOIN people_uidentities pup ON pup.people_id = " + self.person_field
+            people += " JOIN " + identities_db + ".enrollments enr ON enr.uuid = pup.uuid "
+            people += "AND " + self.date_field + " >= enr.start AND " + self.date_field + " < enr.end"
+        else:
+            people = " LEFT JOIN people_uidentities pup ON pup.people_id = " + self.person_field
+        group = ",".join([str(i + 1) for i in range(0, len(fields))])
+        columns = [column for (column, expr) in self.columns]
+        fields += [expr for (column, expr) in self.columns]
+
+        sql = "INSERT INTO " + table
+        sql += " (day, repository, uuid" + (", organization_id" if orgs else "")
+        sql += ", " + ", ".join(columns) + ")"
+        sql += " SELECT " + ", ".join(fields)
+        sql += " FROM " + (self.source % {"from_id":from_id, "to_id":to_id}) + people
+        if self.id_field is not None:
+            sql += " WHERE %s > %i AND %s <= %i" % (self.id_field, from_id,
+                                                   self.id_field, to_id)
+        elif from_day is not None:
+            sql += " WHERE %s >= FROM_DAYS(%i)" % (self.date_field, from_day)
+        sql += " GROUP BY " + group
+        sql += " ON DUPLICATE KEY UPDATE "
+        sql += ", ".join([column + " = " + column + " + VALUES(" + column + ")"
+                          for column in columns])
+        return sql
+
+
+# Rollups available for each data source
+ROLLUPS = {
+    "scm": [Rollup("scm_rollup",
+                   "scmlog s " + \
+                   "LEFT JOIN (SELECT commit_id, SUM(added) AS added, SUM(removed) AS removed " + \
+                   "FROM commits_lines WHERE commit_id > %(from_id)i AND commit_id <= %(to_id)i " + \
+                   "GROUP BY commit_id) cl ON cl.commit_id = s.id " + \
+                   "LEFT JOIN (SELECT commit_id, COUNT(*) AS actions FROM actions " + \
+                   "WHERE commit_id > %(from_id)i AND commit_id <= %(to_id)i " + \
+                   "GROUP BY commit_id) a ON a.commit_id = s.id",
+                   "scmlog", "s.id", "s.author_date", "s.repository_id", "INT", "s.author_id",
+                   [("commits", "COUNT(DISTINCT CASE WHEN a.actions IS NOT NULL THEN s.id END)"),
+                    ("first_commits", "COUNT(DISTINCT CASE WHEN a.actions IS NOT NULL AND " + \
+                     "NOT EXISTS (SELECT 1 FROM scmlog s2 WHERE s2.rev = s.rev AND s2.id < s.id) " + \
+                     "THEN s.id END)"),
+                    ("added_lines", "IFNULL(SUM(cl.added),0)"),
+                    ("removed_lines", "IFNULL(SUM(cl.removed),0)"),
+                    ("actions", "IFNULL(SUM(a.actions),0)")])],
+    "its": [Rollup("its_rollup_opened", "issues i",
+                   "issues", "i.id", "i.submitted_on", "i.tracker_id", "INT", "i.submitted_by",
+                   [("opened", "COUNT(DISTINCT i.id)")]),
+            Rollup("its_rollup_changes", "changes ch JOIN issues i ON i.id = ch.issue_id",
+                   "changes", "ch.id", "ch.changed_on", "i.tracker_id", "INT", "ch.changed_by",
+                   [("changes", "COUNT(DISTINCT ch.id)")])],
+    "mls": [Rollup("mls_rollup",
+                   "messages m LEFT JOIN messages_people mp ON mp.message_id = m.message_ID " + \
+                   "AND mp.type_of_recipient = 'From'",
+                   "messages", None, "m.first_date", "m.mailing_list_url", "VARCHAR(255)", "mp.email_address",
+                   [("sent", "COUNT(DISTINCT m.message_ID)"),
+                    ("first_sent", "COUNT(DISTINCT CASE WHEN NOT EXISTS (SELECT 1 FROM messages m2 " + \
+                     "WHERE m2.message_ID = m.message_ID AND m2.mailing_list_url < m.mailing_list_url) " + \
+                     "THEN m.message_ID END)")])]
+}
+
+# Tables and filters to join the rollup with each kind of filter
+ROLLUPS_FILTERS = {
+    "scm": {"repository": (["repositories r"], ["r.id = ru.repository"], "r.name")},
+    "its": {"repository": (["trackers t"], ["t.id = ru.repository"], "t.url")},
+    "mls": {"repository": (["mailing_lists ml"], ["ml.mailing_list_url = ru.repository"],
+                           "ml.mailing_list_url")}
+}
+
+# Metrics classes answered with rollups: rollup, counter per filter type
+# (None for no filter) or "uuid" for distinct people
+ROLLUPS_METRICS = {
+    "vizgrimoire.metrics.scm_metrics.Commits":
+        ("scm_rollup", {None:"first_commits", "repository":"commits", "company":"first_commits"}),
+    "vizgrimoire.metrics.scm_metrics.Authors":
+        ("scm_rollup", {None:"uuid", "repository":"uuid", "company":"uuid"}),
+    "vizgrimoire.metrics.scm_metrics.AddedLines":
+        ("scm_rollup", {None:"added_lines", "repository":"added_lines", "company":"added_lines"}),
+    "vizgrimoire.metrics.scm_metrics.RemovedLines":
+        ("scm_rollup", {None:"removed_lines", "repository":"removed_lines", "company":"removed_lines"}),
+    "vizgrimoire.metrics.scm_metrics.Actions":
+        ("scm_rollup", {None:"actions", "repository":"actions", "company":"actions"}),
+    "vizgrimoire.metrics.its_metrics.Opened":
+        ("its_rollup_opened", {None:"opened", "repository":"opened", "company":"opened"}),
+    "vizgrimoire.metrics.its_metrics.Openers":
+        ("its_rollup_opened", {None:"uuid", "repository":"uuid", "company":"uuid"}),
+    "vizgrimoire.metrics.its_metrics.Changers":
+        ("its_rollup_changes", {None:"uuid", "repository":"uuid", "company":"uuid"}),
+    "vizgrimoire.metrics.mls_metrics.EmailsSent":
+        ("mls_rollup", {None:"first_sent", "repository":"sent", "company":"first_sent"}),
+    "vizgrimoire.metrics.mls_metrics.EmailsSenders":
+        ("mls_rollup", {None:"uuid", "repository":"uuid", "company":"uuid"})
+}
+
+# Sums returned as Decimal by the raw queries
+ROLLUPS_DECIMAL = ["added_lines", "removed_lines"]
+
+# Databases with updated rollups in this run
+_updated = Set([])
+
+
+class RollupsManager(object):
+    """ Create and extend the rollups of a data source database """
+
+    def __init__(self, dsquery, ds_name):
+        self.db = dsquery
+        self.rollups = ROLLUPS.get(ds_name, [])
+
+    def _get_identities_fingerprint(self):
+        return get_identities_fingerprint(self.db)
+
+    def _get_state(self, name):
+        q = "SELECT last_id, fingerprint FROM rollups_state WHERE name = '%s'" % (name)
+        res = self.db.ExecuteQuery(q)
+        if 'last_id' not in res or res['last_id'] == []: return (0, None)
+        return (res['last_id'], res['fingerprint'])
+
+    def _set_state(self, name, last_id, fingerprint):
+        q = "REPLACE INTO rollups_state (name, last_id, fingerprint) VALUES ('%s', %i, '%s')" % \
+            (name, last_id, fingerprint)
+        self.db.ExecuteViewQuery(q)
+
+    def _get_day_state(self, rollup, identities):
+        """ Last day (TO_DAYS) in the source of a rollup without id and
+            its fingerprint: identities, rows before that day and all rows """
+        date = rollup.get_date_column()
+        q = "SELECT TO_DAYS(MAX(%s)) AS last_day, COUNT(%s) AS total FROM %s" % \
+            (date, date, rollup.id_table)
+        res = self.db.ExecuteQuery(q)
+        last_day = res['last_day']
+        if last_day is None: return (0, identities + ",0,0")
+        return (last_day, ",".join([identities, str(self._count_before(rollup, last_day)),
+                                    str(res['total'])]))
+
+    def _count_before(self, rollup, day):
+        date = rollup.get_date_column()
+        q = "SELECT COUNT(%s) AS total FROM %s WHERE %s < FROM_DAYS(%i)" % \
+            (date, rollup.id_table, date, day)
+        return self.db.ExecuteQuery(q)['total']
+
+    def _update_by_day(self, rollup, identities):
+        """ Summarize again the days since the last one summarized """
+        last_day, last_fingerprint = self._get_state(rollup.name)
+        to_day, fingerprint = self._get_day_state(rollup, identities)
+        if last_fingerprint == fingerprint: return
+
+        from_day = None
+        if last_fingerprint is not None and last_day > 0:
+            (last_identities, before, total) = last_fingerprint.rsplit(",", 2)
+            if last_identities == identities and \
+                str(self._count_before(rollup, last_day)) == before:
+                from_day = last_day
+
+        if from_day is None:
+            logging.info("Building rollup " + rollup.name + " in " + self.db.database)
+            for rollup_table in rollup.get_tables():
+                self.db.ExecuteViewQuery("TRUNCATE TABLE " + rollup_table)
+        else:
+            logging.info("Extending rollup %s in %s from day %i to %i" %
+                         (rollup.name, self.db.database, from_day, to_day))
+            for rollup_table in rollup.get_tables():
+                self.db.ExecuteViewQuery("DELETE FROM %s WHERE day >= FROM_DAYS(%i)" %
+                                         (rollup_table, from_day))
+        for orgs in [False, True]:
+            self.db.ExecuteViewQuery(rollup.get_insert_sql(orgs, self.db.identities_db,
+                                                           from_day = from_day))
+        self._set_state(rollup.name, to_day, fingerprint)
+
+    def update(self):
+        """ Create the rollups tables if needed and add the new activity """
+        if len(self.rollups) == 0: return
+        q = "CREATE TABLE IF NOT EXISTS rollups_state (name VARCHAR(64) PRIMARY KEY, " + \
+            "last_id BIGINT, fingerprint VARCHAR(255)) ENGINE=MyISAM DEFAULT CHARSET=utf8"
+        self.db.ExecuteViewQuery(q)
+        identities = self._get_identities_fingerprint()
+
+        for rollup in self.rollups:
+            for orgs in [False, True]:
+                self.db.ExecuteViewQuery(rollup.get_create_sql(orgs))
+            if rollup.id_field is None:
+                self._update_by_day(rollup, identities)
+                continue
+            fingerprint = identities
+            id_column = rollup.id_field.split(".")[1]
+            res = self.db.ExecuteQuery("SELECT MAX(%s) AS max_id FROM %s" %
+                                       (id_column, rollup.id_table))
+            to_id = res['max_id']
+            if to_id is None: to_id = 0
+            last_id, last_fingerprint = self._get_state(rollup.name)
+
+            if last_fingerprint != fingerprint:
+                logging.info("Building rollup " + rollup.name + " in " + self.db.database)
+                for rollup_table in rollup.get_tables():
+                    self.db.ExecuteViewQuery("TRUNCATE TABLE " + rollup_table)
+                last_id = 0
+            elif last_id >= to_id:
+                continue
+            else:
+                logging.info("Extending rollup %s in %s from id %i to %i" %
+                             (rollup.name, self.db.database, last_id, to_id))
+            for orgs in [False, True]:
+                self.db.ExecuteViewQuery(rollup.get_insert_sql(orgs, self.db.identities_db,
+                                                               last_id, to_id))
+            self._set_state(rollup.name, to_id, fingerprint)
+        _updated.add(self.db.database)
+
+
+def get_identities_fingerprint(dsquery, profiles = False):
+    """ Checksum of the tables mapping people to uuids and organizations
+
+        With profiles, the people names and bots are also included.
+    """
+    checksum = []
+    tables = ["people_uidentities", dsquery.identities_db + ".enrollments"]
+    if profiles: tables.append(dsquery.identities_db + ".profiles")
+    for table in tables:
+        res = dsquery.ExecuteQuery("CHECKSUM TABLE " + table)
+        checksum.append(str(res['Checksum']))
+    return ",".join(checksum)
+
+def _get_bots_where(db, bots):
+    """ Conditions on the profiles (pro) used by the raw queries to exclude bots """
+    if hasattr(db, "GetSQLBotWhere"): where = db.GetSQLBotWhere(bots)
+    else: where = db.GetSQLBotsWhere(bots)
+    # Joins with the raw tables are not needed
+    return Set([condition for condition in where
+                if condition.startswith("pro.") and "uuid" not in condition])
+
+def get_rollup_query(metric, evolutionary):
+    """ Query for the metric using rollups or None if not possible """
+    if metric.db is None or metric.db.database not in _updated: return None
+    metric_class = type(metric).__module__ + "." + type(metric).__name__
+    if metric_class not in ROLLUPS_METRICS: return None
+    filters = metric.filters
+    if filters.global_filter is not None: return None
+    name, counters = ROLLUPS_METRICS[metric_class]
+    ds_name = metric.data_source.get_name()
+
+    filter_type, filter_value = None, None
+    if filters.type_analysis:
+        filter_type, filter_value = filters.type_analysis[0], filters.type_analysis[1]
+    if filter_type not in counters: return None
+
+    tables = Set([])
+    where = Set([])
+    table = name
+    if filter_type == "company":
+        table += "_orgs"
+        tables.add(metric.db.identities_db + ".organizations org")
+        where.add("org.id = ru.organization_id")
+        if filter_value is not None: where.add("org.name = " + filter_value)
+    elif filter_type == "repository":
+        repo_tables, repo_where, repo_field = ROLLUPS_FILTERS[ds_name]["repository"]
+        tables.union_update(repo_tables)
+        where.union_update(repo_where)
+        if filter_value is not None: where.add(repo_field + " = " + filter_value)
+    tables.add(table + " ru")
+
+    if filters.people_out is not None:
+        tables.add(metric.db.identities_db + ".profiles pro")
+        where.add("pro.uuid = ru.uuid")
+        where.union_update(_get_bots_where(metric.db, filters.people_out))
+
+    counter = counters[filter_type]
+    if counter == "uuid":
+        field = "count(distinct(ru.uuid)) as " + metric.id
+    elif counter in ROLLUPS_DECIMAL:
+        field = "sum(ru." + counter + ") as " + metric.id
+    else:
+        field = "coalesce(convert(sum(ru." + counter + "),signed),0) as " + metric.id
+
+    return metric.db.BuildQuery(filters.period, filters.startdate, filters.enddate,
+                                " ru.day ", Set([field]), tables, where, evolutionary,
+                                filters.type_analysis)
@@ -0,0 +1,229 @@
+## Copyright (C) 2014 Bitergia
+##
+## This program is free software; you can redistribute it and/or modify
+## it under the terms of the GNU General Public License as published by
+## the Free Software Foundation; either version 3 of the License, or
+## (at your option) any later version.
+##
+## This program is distributed in the hope that it will be useful,
+## but WITHOUT ANY WARRANTY; without even the implied warranty of
+## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+## GNU General Public License for more details.
+##
+## You should have received a copy of the GNU General Public License
+## along with this program; if not, write to the Free Software
+## Foundation, Inc., 59 Temple Place - Suite 330, Boston, MA 02111-1307, USA.
+##
+## This file is a part of GrimoireLib
+##  (an Python library for the MetricsGrimoire and vizGrimoire systems)
+##
+##
+## Authors:
+##   Alvaro del Castillo <acs@bitergia.com>
+
+""" Tasks with dependencies run by a scheduler with checkpoints
+
+    A task runs once all the tasks it depends on are done. Tasks run in
+    order of addition, in up to jobs processes and up to group_jobs tasks
+    of the same group (i.e. data source) at the same time. A task failed
+    is logged and the tasks depending on it are skipped, but the rest go on.
+
+    The tasks done and their results are written to a state file after
+    each one, with a signature of the run (dates, options). Resuming a run
+    with the same signature skips the tasks already done.
+"""
+
+import json
+import logging
+import os
+import time
+
+from vizgrimoire.GrimoireUtils import writeJSON
+from vizgrimoire.jobs import JobsPool, run_job
+
+
+class Task(object):
+    """ Function called with args once the tasks in depends are done
+
+        The results of the tasks in inputs, that must be done before, are
+        added to args.
+    """
+
+    def __init__(self, name, function, args = (), depends = [], inputs = [], group = None):
+        self.name = name
+        self.function = function
+        self.args = tuple(args)
+        self.depends = list(depends) + [task for task in inputs if task not in depends]
+        self.inputs = list(inputs)
+        self.group = group
+
+
+class TaskScheduler(object):
+    """ Run tasks following their dependencies """
+
+    # Seconds between checks of the running tasks
+    poll_interval = 0.1
+
+    def __init__(self, jobs = 1, group_jobs = None, state_file = None, signature = None):
+        self.jobs = max(1, jobs)
+        self.group_jobs = group_jobs
+        self.state_file = state_file
+        self.signature = signature
+        self.tasks = []
+        self._names = {}
+        self.done = {} # task name: result
+        self.failed = []
+        self.skipped = []
+
+    def add(self, task):
+        if task.name in self._names:
+            raise ValueError("Duplicated task " + task.name)
+        self._names[task.name] = task
+        self.tasks.append(task)
+        return task
+
+    def _check(self):
+        """ Dependencies must exist and not form cycles """
+        for task in self.tasks:
+            for name in task.depends:
+                if name not in self._names:
+                    raise ValueError(task.name + " depends on unknown task " + name)
+        visited = {} # name: True when all its dependencies are visited
+        for task in self.tasks:
+            stack = [(task, 0)]
+            while stack:
+                (current, pos) = stack.pop()
+                if pos == 0:
+                    if visited.get(current.name): continue
+                    if current.name in visited:
+                        raise ValueError("Cycle in dependencies of " + current.name)
+                    visited[current.name] = False
+                if pos < len(current.depends):
+                    stack.append((current, pos + 1))
+                    dependency = self._names[current.depends[pos]]
+                    if not visited.get(dependency.name):
+                        if dependency.name in visited:
+                            raise ValueError("Cycle in dependencies of " + current.name)
+                        stack.append((dependency, 0))
+                else:
+                    visited[current.name] = True
+
+    def load_state(self):
+        """ Tasks done in a previous run with the same signature """
+        if self.state_file is None or not os.path.isfile(self.state_file):
+            return {}
+        state_file = open(self.state_file)
+        try:
+            state = json.load(state_file)
+        except ValueError:
+            logging.warning("Wrong tasks state file " + self.state_file)
+            return {}
+        finally:
+            state_file.close()
+        if state.get("signature") != self.signature:
+            logging.warning("Tasks state from a different run. Not resuming.")
+            return {}
+        return state["done"]
+
+    def _save_state(self):
+        if self.state_file is None: return
+        writeJSON({"signature": self.signature, "done": self.done}, self.state_file)
+
+    def _skip(self):
+        """ Skip the pending tasks depending on tasks failed or skipped """
+        skipped = True
+        # Tasks can depend on tasks added after them: repeat until no changes
+        while skipped:
+            skipped = False
+            for task in self._pending[:]:
+                not_ok = [name for name in task.depends
+                          if name in self.failed or name in self.skipped]
+                if len(not_ok) > 0:
+                    logging.error("Task %s skipped: %s not done" % (task.name, ",".join(not_ok)))
+                    self.skipped.append(task.name)
+                    self._pending.remove(task)
+                    skipped = True
+
+    def _get_ready(self, running):
+        """ Pending tasks that can start now. Skips the ones that can not run """
+        self._skip()
+        ready = []
+        groups = {}
+        for task in running.values():
+            groups[task.group] = groups.get(task.group, 0) + 1
+        for task in self._pending[:]:
+            if len(running) + len(ready) >= self.jobs: break
+            if len([name for name in task.depends if name not in self.done]) > 0:
+                continue
+            if self.group_jobs is not None and task.group is not None:
+                if groups.get(task.group, 0) >= self.group_jobs: continue
+                groups[task.group] = groups.get(task.group, 0) + 1
+            ready.append(task)
+            self._pending.remove(task)
+        return ready
+
+    def _finish(self, task, ok, elapsed, result):
+        if ok:
+            logging.info("Task %s done in %.2fs" % (task.name, elapsed))
+            self.done[task.name] = result
+            self._save_state()
+        else:
+            logging.error("Task %s failed after %.2fs" % (task.name, elapsed))
+            self.failed.append(task.name)
+
+    def _get_args(self, task):
+        return task.args + tuple([self.done[name] for name in task.inputs])
+
+    def run(self, resume = False):
+        """ Run the tasks not done. Returns the names of tasks failed or skipped """
+        self._check()
+        self.done = {}
+        if resume:
+            done = self.load_state()
+            for name in done:
+                if name in self._names: self.done[name] = done[name]
+            if len(self.done) > 0:
+                logging.info("Resuming: %i tasks already done" % len(self.done))
+        self._save_state()
+        self.failed = []
+        self.skipped = []
+        self._pending = [task for task in self.tasks if task.name not in self.done]
+
+        if self.jobs == 1:
+            while True:
+                ready = self._get_ready({})
+                if len(ready) == 0: break
+                task = ready[0]
+                (name, ok, elapsed, result) = run_job(task.name, task.function,
+                                                      self._get_args(task))
+                self._finish(task, ok, elapsed, result)
+        else:
+            pool = JobsPool(self.jobs, new_process_per_job = True)
+            running = {} # AsyncResult: task
+            try:
+                while True:
+                    for task in self._get_ready(running):
+                        running[pool.submit(task.name, task.function, self._get_args(task))] = task
+                    if len(running) == 0: break
+                    finished = [result for result in running if result.ready()]
+                    if len(finished) == 0:
+                        time.sleep(TaskScheduler.poll_interval)
+                        continue
+                    for async_result in finished:
+                        task = running.pop(async_result)
+                        try:
+                            (name, ok, elapsed, result) = async_result.get()
+                        except Exception, e:
+                            # i.e. results that can not be sent from the worker
+                            logging.error("Task %s: %s" % (task.name, str(e)))
+                            (ok, elapsed, result) = (False, 0, None)
+                        self._finish(task, ok, elapsed, result)
+            finally:
+                pool.close()
+
+        # Tasks not run are not done, the run must not be taken as complete
+        for task in self._pending:
+            logging.error("Task %s not run" % (task.name))
+            self.skipped.append(task.name)
+        self._pending = []
+        return self.failed + self.skipped
@@ -0,0 +1,290 @@
+## Copyright (C) 2014 Bitergia
+##
+## This program is free software; you can redistribute it and/or modify
+## it under the terms of the GNU General Public License as published by
+## the Free Software Foundation; either version 3 of the License, or
+## (at your option) any later version.
+##
+## This program is distributed in the hope that it will be useful,
+## but WITHOUT ANY WARRANTY; without even the implied warranty of
+## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+## GNU General Public License for more details.
+##
+## You should have received a copy of the GNU General Public License
+## along with this program; if not, write to the Free Software
+## Foundation, Inc., 59 Temple Place - Suite 330, Boston, MA 02111-1307, USA.
+##
+## This file is a part of GrimoireLib
+##  (an Python library for the MetricsGrimoire and vizGrimoire systems)
+##
+##
+## Authors:
+##   Alvaro del Castillo <acs@bitergia.com>
+
+""" Index of the threads of a mailing lists (MLStats) database
+
+    The messages (response of, date and senders) and the threads of the
+    whole archive (root, members, depth, senders and first and last date)
+    are kept in a JSON file threads-<database>.json in the index
+    directory. In the next runs only the messages newer than the last one
+    indexed are read, and attached to their threads following is_response_of.
+    If older messages appeared in the database, the index is built again.
+
+    The threads of any date range are answered from the index: threads
+    inside the range are used as they are, and the rest are walked again
+    with the messages of the range only, as Threads does with a query.
+
+    Senders are kept as people_id, so the index is valid after merging
+    identities: they are mapped to uuids with people_uidentities when used.
+"""
+
+import logging
+import os
+import re
+import threading
+
+from vizgrimoire.GrimoireSQL import ExecuteQuery, ExecuteQueryStream
+from vizgrimoire.GrimoireUtils import readJSON, writeJSON
+
+# Loaded indexes per database
+_indexes = {}
+_indexes_lock = threading.Lock()
+# Directory for the index files. None to not use the index.
+_index_dir = None
+
+
+def _to_str(value):
+    if value is None: return None
+    if isinstance(value, basestring): return value
+    return str(value)
+
+def get_range_date(date):
+    """ "YYYY-MM-DD[ HH:MM:SS]" of a date used in queries or None
+
+        Dates are compared as strings: "2014-01-01" is before any
+        datetime of that day, as in the queries.
+    """
+    date = _to_str(date)
+    if date is None: return None
+    date = date.strip().strip("'\"")
+    if re.match(r"^\d{4}-\d{2}-\d{2}( \d{2}:\d{2}:\d{2})?$", date) is None:
+        return None
+    return date
+
+
+class ThreadsIndex(object):
+    """ Threads of all the messages of a mailing lists database """
+
+    def __init__(self, database):
+        self.database = database
+        self.messages = {} # message_ID: [[is_response_of, ...], first_date, [people_id, ...]]
+        self.threads = {} # root message_ID: {"members", "depth", "people",
+                          #                   "first_date", "last_date"}
+        self.last_date = None # newest first_date indexed
+        self._children = {}
+        self._uuids = None # people_id: uuid
+
+    def _get_messages_query(self, after = None):
+        q = """
+            SELECT m.message_ID, m.is_response_of, m.first_date, mp.email_address
+            FROM messages m
+            LEFT JOIN messages_people mp
+                 ON m.message_ID = mp.message_id AND
+                    mp.type_of_recipient = 'From'
+            WHERE m.first_date IS NOT NULL
+            """
+        if after is not None: q += " AND m.first_date >= '%s'" % (after)
+        return q
+
+    def _read_messages(self, after = None):
+        """ Add the messages from the database. Returns the new ones """
+        new = []
+        for row in ExecuteQueryStream(self._get_messages_query(after)):
+            message_id = row["message_ID"]
+            date = _to_str(row["first_date"])
+            if message_id not in self.messages:
+                self.messages[message_id] = [[], date, []]
+                new.append(message_id)
+            message = self.messages[message_id]
+            if date < message[1]: message[1] = date
+            parent = row["is_response_of"]
+            if parent not in message[0]:
+                message[0].append(parent)
+                if parent is not None:
+                    self._children.setdefault(parent, []).append(message_id)
+            if row["email_address"] is not None and row["email_address"] not in message[2]:
+                message[2].append(row["email_address"])
+            if self.last_date is None or date > self.last_date: self.last_date = date
+        return new
+
+    def _init_children(self):
+        self._children = {}
+        for (message_id, message) in self.messages.items():
+            for parent in message[0]:
+                if parent is not None:
+                    self._children.setdefault(parent, []).append(message_id)
+
+    def _get_roots(self, message_id):
+        """ Roots of the threads a message belongs to, following is_response_of """
+        roots = set([])
+        visited = set([message_id])
+        pending = [message_id]
+        while pending:
+            current = pending.pop()
+            for parent in self.messages[current][0]:
+                if parent is None: roots.add(current)
+                elif parent in self.messages and parent not in visited:
+                    visited.add(parent)
+                    pending.append(parent)
+        return roots
+
+    def _walk(self, root, initdate = None, enddate = None):
+        """ Members (root first) and metrics of a thread, with the messages
+            in the date range only if given """
+        def in_range(message_id):
+            date = self.messages[message_id][1]
+            if initdate is not None and date < initdate: return False
+            if enddate is not None and date >= enddate: return False
+            return True
+
+        members = [root]
+        depth = 0
+        people = set(self.messages[root][2])
+        dates = [self.messages[root][1]]
+        path = [root] # messages from the root to the current one
+        in_path = set(path)
+        stack = [(msg, 1) for msg in reversed(self._children.get(root, []))]
+        while stack:
+            (msg, level) = stack.pop()
+            while len(path) > level:
+                in_path.discard(path.pop())
+            if msg in in_path or not in_range(msg):
+                continue
+            members.append(msg)
+            depth = max(depth, level)
+            people.update(self.messages[msg][2])
+            dates.append(self.messages[msg][1])
+            path.append(msg)
+            in_path.add(msg)
+            for son in reversed(self._children.get(msg, [])):
+                stack.append((son, level + 1))
+
+        return {"members": members, "depth": depth, "people": list(people),
+                "first_date": min(dates), "last_date": max(dates)}
+
+    def _count_db_messages(self, before):
+        q = """
+            SELECT COUNT(DISTINCT message_ID) AS total
+            FROM messages
+            WHERE first_date < '%s'
+            """ % (before)
+        return int(ExecuteQuery(q)["total"])
+
+    def build(self):
+        """ Index all the messages of the database """
+        self.messages = {}
+        self._children = {}
+        self.last_date = None
+        self._read_messages()
+        self.threads = {}
+        for (message_id, message) in self.messages.items():
+            if None in message[0]: self.threads[message_id] = self._walk(message_id)
+
+    def update(self):
+        """ Attach to their threads the messages added to the database """
+        if self.last_date is None: return self.build()
+        indexed = len([m for m in self.messages.values() if m[1] < self.last_date])
+        if self._count_db_messages(self.last_date) != indexed:
+            logging.info("Older messages in %s: building threads index" % (self.database))
+            return self.build()
+
+        new = self._read_messages(self.last_date)
+        roots = set([])
+        for message_id in new:
+            roots.update(self._get_roots(message_id))
+        for root in roots:
+            self.threads[root] = self._walk(root)
+        logging.info("Threads index of %s: %i new messages, %i threads updated" %
+                     (self.database, len(new), len(roots)))
+
+    def _get_index_file(self):
+        return os.path.join(_index_dir, "threads-" + self.database + ".json")
+
+    def load(self):
+        """ Read the index file, if any, and update it with the database """
+        index_file = self._get_index_file()
+        index = None
+        if os.path.isfile(index_file): index = readJSON(index_file)
+        if index is not None:
+            self.messages = index['messages']
+            self.threads = index['threads']
+            self.last_date = index['last_date']
+            self._init_children()
+            self.update()
+        else:
+            self.build()
+        logging.info("Threads index of %s: %i messages, %i threads" %
+                     (self.database, len(self.messages), len(self.threads)))
+
+        if not os.path.isdir(_index_dir): os.makedirs(_index_dir)
+        writeJSON({"messages": self.messages, "threads": self.threads,
+                   "last_date": self.last_date}, index_file)
+
+    def get_uuids(self):
+        """ people_id: uuid of the senders """
+        if self._uuids is None:
+            self._uuids = {}
+            for row in ExecuteQueryStream("SELECT people_id, uuid FROM people_uidentities"):
+                self._uuids[row["people_id"]] = row["uuid"]
+        return self._uuids
+
+    def get_threads(self, initdate, enddate):
+        """ Threads of the messages in a date range
+
+            Returns the members (root first) and the metrics (length,
+            depth, participants, first_date and last_date) of each
+            thread, by root message_ID.
+        """
+        uuids = self.get_uuids()
+        result = {}
+        for (root, thread) in self.threads.items():
+            date = self.messages[root][1]
+            if date < initdate or date >= enddate: continue
+            if thread["first_date"] < initdate or thread["last_date"] >= enddate:
+                # some messages out of the range
+                thread = self._walk(root, initdate, enddate)
+            people = set([uuids[person] for person in thread["people"] if person in uuids])
+            metrics = {"length": len(thread["members"]), "depth": thread["depth"],
+                       "participants": len(people),
+                       "first_date": thread["first_date"], "last_date": thread["last_date"]}
+            result[root] = (thread["members"], metrics)
+        return result
+
+def set_index_dir(index_dir):
+    """ Directory to persist the threads indexes. None to disable them """
+    global _index_dir
+    _index_dir = index_dir
+
+def get_threads_index():
+    """ ThreadsIndex of the current database, loaded and updated on first use
+
+        None if no index directory is set.
+    """
+    if _index_dir is None: return None
+    database = ExecuteQuery("SELECT DATABASE() AS db")["db"]
+    _indexes_lock.acquire()
+    try:
+        if database not in _indexes:
+            index = ThreadsIndex(database)
+            index.load()
+            _indexes[database] = index
+        return _indexes[database]
+    finally:
+        _indexes_lock.release()
+
+def clear_indexes():
+    _indexes_lock.acquire()
+    try:
+        _indexes.clear()
+    finally:
+        _indexes_lock.release()